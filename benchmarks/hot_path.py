@@ -0,0 +1,192 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+measures the find, authorize and assume hot path of a simulation against synthetic
+accounts of increasing size, without network access. For each stage it reports the
+throughput, the latency percentiles and the memory allocated per operation.
+
+    PYTHONPATH=src python benchmarks/hot_path.py --roles 1000,10000,50000
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, List
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# offline: no rate limiting, dummy credentials and a policy allowing all roles
+os.environ["IAM_SUDO_IAM_RATE"] = "0"
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "secret")
+os.environ.pop("IAM_SUDO_POLICY_SOURCE", None)
+os.environ.pop("IAM_SUDO_INVENTORY_SNAPSHOT", None)
+os.environ.pop("IAM_SUDO_ACCOUNTS", None)
+
+import iam_sudo.sudo  # noqa: E402
+from iam_sudo import clients  # noqa: E402
+from iam_sudo.inventory import RoleInventory  # noqa: E402
+from iam_sudo.roles import Role, policy_snapshots  # noqa: E402
+from iam_sudo.sudo import find_role, simulate_assume_role  # noqa: E402
+from iam_sudo.sudo_policy import Policy  # noqa: E402
+from synthetic import SyntheticAccount  # noqa: E402
+
+
+class Stage(object):
+    def __init__(self, name: str, operation: Callable[[int], None], count: int):
+        self.name = name
+        self.operation = operation
+        self.count = count
+
+    def run(self) -> dict:
+        latencies = []
+        started = time.perf_counter()
+        for i in range(self.count):
+            t = time.perf_counter()
+            self.operation(i)
+            latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - started
+
+        allocations = max(1, min(self.count, 100))
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            for i in range(allocations):
+                self.operation(i)
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        allocated = sum(
+            s.size_diff for s in after.compare_to(before, "filename") if s.size_diff > 0
+        )
+
+        latencies.sort()
+        return {
+            "stage": self.name,
+            "operations": self.count,
+            "traced_operations": allocations,
+            "per_second": self.count / elapsed if elapsed else 0.0,
+            "p50_us": _percentile(latencies, 0.5) * 1e6,
+            "p90_us": _percentile(latencies, 0.9) * 1e6,
+            "p99_us": _percentile(latencies, 0.99) * 1e6,
+            "mean_us": statistics.mean(latencies) * 1e6,
+            "retained_bytes_per_op": allocated / allocations,
+            "peak_bytes": peak,
+        }
+
+
+def _percentile(values: List[float], p: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def stages(account: SyntheticAccount, lookups: int) -> List[Stage]:
+    rng = random.Random(7)
+    size = len(account.roles)
+    policy = Policy.get_default()
+    base_role = f"arn:aws:iam::{account.account}:role/IAMSudoUser"
+
+    def scan(_: int):
+        iam_sudo.sudo.inventory.invalidate()
+        iam_sudo.sudo.inventory.find("")
+
+    def find_by_substring(_: int):
+        find_role(account.stack_name(rng.randrange(size)), None)
+
+    def find_by_name(_: int):
+        find_role(account.roles[rng.randrange(size)]["RoleName"], None)
+
+    def parse_principals(_: int):
+        Role(account.roles[rng.randrange(size)]).principals
+
+    records = list(iam_sudo.sudo.inventory.get_all())
+
+    def authorize(_: int):
+        policy.is_allowed_role(records[rng.randrange(size)])
+
+    def simulate_cold(_: int):
+        policy_snapshots.clear()
+        simulate_assume_role(
+            base_role, account.roles[rng.randrange(size)]["RoleName"], None
+        )
+
+    def simulate_cached(i: int):
+        simulate_assume_role(base_role, account.roles[i % 10]["RoleName"], None)
+
+    return [
+        Stage("scan and index", scan, max(1, min(5, 50000 // size))),
+        Stage("find (substring)", find_by_substring, lookups),
+        Stage("find (exact)", find_by_name, lookups),
+        Stage("principals", parse_principals, lookups),
+        Stage("authorize", authorize, lookups),
+        Stage("simulate (cold)", simulate_cold, max(1, lookups // 10)),
+        Stage("simulate (cached)", simulate_cached, lookups),
+    ]
+
+
+def benchmark(size: int, lookups: int, max_inline_policies: int) -> List[dict]:
+    account = SyntheticAccount(size, max_inline_policies=max_inline_policies)
+    clients.reset()
+    account.attach(clients.client("iam"))
+    account.attach(clients.client("sts"))
+    iam_sudo.sudo.inventory = RoleInventory(ttl=3600, max_size=size + 1)
+    iam_sudo.sudo.inventory.get_all()
+
+    results = []
+    for stage in stages(account, lookups):
+        calls = sum(account.calls.values())
+        result = stage.run()
+        result["roles"] = size
+        result["aws_calls_per_op"] = (sum(account.calls.values()) - calls) / (
+            result["operations"] + result["traced_operations"]
+        )
+        results.append(result)
+    return results
+
+
+@click.command(help="measure the hot path of simulations against synthetic accounts")
+@click.option("--roles", default="1000,10000", help="account sizes, default 1000,10000")
+@click.option("--lookups", default=1000, type=int, help="operations per stage, default 1000")
+@click.option("--inline-policies", default=5, type=int, help="maximum inline policies per role, default 5")
+@click.option("--json", "as_json", is_flag=True, help="write the results as JSON lines")
+def main(roles, lookups, inline_policies, as_json):
+    for size in [int(s) for s in roles.split(",")]:
+        results = benchmark(size, lookups, inline_policies)
+        if as_json:
+            for result in results:
+                click.echo(json.dumps(result))
+            continue
+
+        click.echo(f"\n{size} roles")
+        click.echo(
+            f"{'stage':<18} {'ops/s':>10} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10} {'KiB/op':>8} {'peak KiB':>9} {'calls/op':>9}"
+        )
+        for r in results:
+            click.echo(
+                f"{r['stage']:<18} {r['per_second']:>10.0f} {r['p50_us']:>10.1f} {r['p90_us']:>10.1f}"
+                f" {r['p99_us']:>10.1f} {r['retained_bytes_per_op'] / 1024:>8.1f} {r['peak_bytes'] / 1024:>9.0f}"
+                f" {r['aws_calls_per_op']:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
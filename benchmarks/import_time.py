@@ -0,0 +1,87 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+measures the cold start of the Lambda function: the time to import the handler, to
+load the sudo policy and to create the first AWS client, each in a fresh interpreter.
+
+    PYTHONPATH=src python benchmarks/import_time.py --runs 20
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import click
+
+_cold_start = """
+import json, os, time
+t0 = time.perf_counter()
+import iam_sudo
+t1 = time.perf_counter()
+from iam_sudo.sudo_policy import Policy
+Policy.get_default()
+t2 = time.perf_counter()
+from iam_sudo.clients import client
+client("sts")
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "policy": t2 - t1, "client": t3 - t2}))
+"""
+
+
+def cold_start() -> dict:
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
+    r = subprocess.run(
+        [sys.executable, "-c", _cold_start], env=env, capture_output=True, check=True
+    )
+    return json.loads(r.stdout)
+
+
+def slowest_imports(n: int) -> list:
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import iam_sudo"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in r.stderr.splitlines()[1:]:
+        _, cumulative_us, module = line.split("|")
+        imports.append((int(cumulative_us), module.strip()))
+    return sorted(imports, reverse=True)[:n]
+
+
+@click.command(help="measure the cold start of the iam-sudo lambda")
+@click.option("--runs", default=10, type=int, help="number of cold starts, default 10")
+@click.option("--top", default=10, type=int, help="number of slowest imports to show")
+def main(runs, top):
+    results = [cold_start() for _ in range(runs)]
+    click.echo(f"{'stage':<10} {'median ms':>10} {'p90 ms':>10} {'max ms':>10}")
+    for stage in ["import", "policy", "client"]:
+        timings = sorted(r[stage] * 1000 for r in results)
+        p90 = timings[min(len(timings) - 1, int(len(timings) * 0.9))]
+        click.echo(
+            f"{stage:<10} {statistics.median(timings):>10.1f} {p90:>10.1f} {timings[-1]:>10.1f}"
+        )
+
+    click.echo("\nslowest imports of iam_sudo (cumulative):")
+    for cumulative_us, module in slowest_imports(top):
+        click.echo(f"{cumulative_us / 1000:>10.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+synthetic AWS accounts for the benchmarks: generated roles with varied trust policies
+and inline policies, served to real botocore clients without network access.
+"""
+import datetime
+import json
+import random
+import string
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from botocore.awsrequest import AWSResponse
+
+_services = [
+    "ecs-tasks.amazonaws.com",
+    "lambda.amazonaws.com",
+    "codebuild.amazonaws.com",
+    "ec2.amazonaws.com",
+    "events.amazonaws.com",
+    "states.amazonaws.com",
+]
+_kinds = ["Task", "Function", "Build", "Instance", "Trigger", "StateMachine"]
+_actions = [
+    f"{service}:{verb}{noun}"
+    for service, nouns in [
+        ("s3", ["Object", "Bucket", "ObjectTagging"]),
+        ("sqs", ["Message", "Queue", "QueueAttributes"]),
+        ("dynamodb", ["Item", "Table", "Records"]),
+        ("logs", ["LogEvents", "LogStream", "LogGroup"]),
+    ]
+    for verb in ["Get", "Put", "Delete", "Describe"]
+    for noun in nouns
+]
+
+
+class SyntheticAccount(object):
+    """
+    an account with `size` generated roles, each with up to `max_inline_policies` inline
+    policies. The roles, their policies and the credentials of AssumeRole are served
+    through the before-call event of botocore clients, in the same way as the botocore
+    Stubber does, but independent of the order of the calls.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        account: str = "123456789012",
+        max_inline_policies: int = 5,
+        seed: int = 42,
+    ):
+        self.account = account
+        self.random = random.Random(seed)
+        self.roles: List[dict] = []
+        self.policies: Dict[str, Tuple[List[str], Dict[str, dict]]] = {}
+        self.calls: Dict[str, int] = {}
+        created = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        for i in range(size):
+            role = self._role(i, created + datetime.timedelta(minutes=i))
+            self.roles.append(role)
+            self.policies[role["RoleName"]] = self._policies(max_inline_policies)
+        self.by_name = {r["RoleName"]: r for r in self.roles}
+        # IAM returns policy documents url-encoded, botocore decodes them in place
+        self._wire_roles = [
+            dict(r, AssumeRolePolicyDocument=_encode(r["AssumeRolePolicyDocument"]))
+            for r in self.roles
+        ]
+        self._wire_by_name = {r["RoleName"]: r for r in self._wire_roles}
+
+    def stack_name(self, i: int) -> str:
+        return f"stack{i:05d}-{_kinds[i % len(_kinds)]}Role"
+
+    def attach(self, client):
+        """
+        serves the calls of `client` from this account.
+        """
+        client.meta.events.register(
+            f"before-call.{client.meta.service_model.endpoint_prefix}", self.respond
+        )
+
+    def respond(self, model, params, **kwargs) -> Tuple[AWSResponse, dict]:
+        body = params.get("body", {})
+        self.calls[model.name] = self.calls.get(model.name, 0) + 1
+        handler = getattr(self, f"_{model.name}", None)
+        if handler is None:
+            raise NotImplementedError(model.name)
+        return handler(body)
+
+    def _role(self, i: int, created: datetime.datetime) -> dict:
+        suffix = "".join(self.random.choices(string.ascii_uppercase + string.digits, k=12))
+        name = f"{self.stack_name(i)}-{suffix}"
+        principal = self._principal(i)
+        return {
+            "Path": "/",
+            "RoleName": name,
+            "RoleId": f"AROA{suffix}{i:05d}",
+            "Arn": f"arn:aws:iam::{self.account}:role/{name}",
+            "CreateDate": created,
+            "AssumeRolePolicyDocument": {
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Effect": "Allow",
+                        "Principal": principal,
+                        "Action": "sts:AssumeRole",
+                    }
+                ],
+            },
+        }
+
+    def _principal(self, i: int) -> dict:
+        kind = i % 4
+        if kind == 0:
+            return {"Service": _services[i % len(_services)]}
+        if kind == 1:
+            return {"Service": self.random.sample(_services, 2)}
+        if kind == 2:
+            return {"AWS": f"arn:aws:iam::{self.account}:root"}
+        return {"Federated": f"arn:aws:iam::{self.account}:saml-provider/sso"}
+
+    def _policies(self, max_inline_policies: int) -> Tuple[List[str], Dict[str, dict]]:
+        attached = [
+            f"arn:aws:iam::aws:policy/Policy{j}"
+            for j in range(self.random.randint(0, 3))
+        ]
+        inline = {
+            f"policy-{j}": {
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Sid": f"statement{j}{k}",
+                        "Effect": "Allow",
+                        "Action": self.random.sample(_actions, 3),
+                        "Resource": "*",
+                    }
+                    for k in range(2)
+                ],
+            }
+            for j in range(self.random.randint(0, max_inline_policies))
+        }
+        return attached, inline
+
+    def _ListRoles(self, body: dict):
+        start = int(body.get("Marker", "0"))
+        end = start + int(body.get("MaxItems", 100))
+        page = {
+            "Roles": [dict(r) for r in self._wire_roles[start:end]],
+            "IsTruncated": end < len(self.roles),
+        }
+        if page["IsTruncated"]:
+            page["Marker"] = str(end)
+        return _ok(page)
+
+    def _GetRole(self, body: dict):
+        role = self._wire_by_name.get(body["RoleName"])
+        if role is None:
+            return _error(404, "NoSuchEntity", f"role {body['RoleName']} not found")
+        return _ok({"Role": dict(role)})
+
+    def _ListAttachedRolePolicies(self, body: dict):
+        attached, _ = self.policies[body["RoleName"]]
+        return _ok(
+            {
+                "AttachedPolicies": [
+                    {"PolicyName": arn.split("/")[-1], "PolicyArn": arn} for arn in attached
+                ],
+                "IsTruncated": False,
+            }
+        )
+
+    def _ListRolePolicies(self, body: dict):
+        _, inline = self.policies[body["RoleName"]]
+        return _ok({"PolicyNames": list(inline), "IsTruncated": False})
+
+    def _GetRolePolicy(self, body: dict):
+        _, inline = self.policies[body["RoleName"]]
+        return _ok(
+            {
+                "RoleName": body["RoleName"],
+                "PolicyName": body["PolicyName"],
+                "PolicyDocument": _encode(inline[body["PolicyName"]]),
+            }
+        )
+
+    def _AssumeRole(self, body: dict):
+        expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            hours=1
+        )
+        return _ok(
+            {
+                "Credentials": {
+                    "AccessKeyId": "ASIAEXAMPLE",
+                    "SecretAccessKey": "secret",
+                    "SessionToken": "token",
+                    "Expiration": expiration,
+                },
+                "PackedPolicySize": 10,
+            }
+        )
+
+    def _GetCallerIdentity(self, body: dict):
+        return _ok(
+            {
+                "Account": self.account,
+                "Arn": f"arn:aws:iam::{self.account}:user/benchmark",
+                "UserId": "AIDAEXAMPLE",
+            }
+        )
+
+
+def _encode(document: dict) -> str:
+    return quote(json.dumps(document))
+
+
+def _ok(parsed: dict, status: Optional[int] = 200):
+    parsed.setdefault("ResponseMetadata", {"HTTPStatusCode": status})
+    return AWSResponse(None, status, {}, None), parsed
+
+
+def _error(status: int, code: str, message: str):
+    return _ok({"Error": {"Code": code, "Message": message}}, status)
@@ -41,6 +41,7 @@ setup(
     zip_safe=False,
     platforms='any',
     install_requires=dependencies,
+    extras_require={'cache-encryption': ['cryptography', 'keyring']},
     setup_requires=[],
     tests_require=dependencies +  ['pytest', 'botostubs', 'pytest-runner'],
     test_suite='tests',
@@ -1 +1,2 @@
+from .lambda_handler import events_handler as events_handler
 from .lambda_handler import handler as handler
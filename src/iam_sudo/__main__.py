@@ -13,14 +13,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import json
 import logging
 import os
 
 import click
 from collections import namedtuple
+from functools import partial
+from itertools import chain
+from typing import Optional
 
+from iam_sudo.cache import active_profile, cache_file
+from iam_sudo.clients import hub_accounts
+from iam_sudo.credential_cache import cache_key, credential_cache
+from iam_sudo.events import apply_events
+from iam_sudo.identity import caller_identity, credentials_key
+from iam_sudo.inventory import inventory
+from iam_sudo.metrics import metrics
 from iam_sudo.sudo import AssumeRoleError, simulate_assume_role, real_assume_role, remote_assume_role
+from iam_sudo.credentials import Credentials
 from iam_sudo.principal import Principal
+from iam_sudo.roles import Role
+from iam_sudo.server import CredentialProvider, CredentialServer
+from iam_sudo.snapshot import Snapshot, SnapshotError, write_snapshot
+from iam_sudo.sudo_policy import Policy
+from iam_sudo.supervisor import run_with_refresh
 
 
 
@@ -28,29 +45,70 @@ Setting = namedtuple("Setting", ["profile", "verbose"])
 
 @click.group(help="get credentials of a real or simulated IAM role")
 @click.option("--verbose", required=False, is_flag=True, help="log output")
-def cli(verbose):
+@click.option(
+    "--profile-timings",
+    required=False,
+    is_flag=True,
+    help="print the time spent per stage and the AWS calls made on exit",
+)
+@click.pass_context
+def cli(ctx, verbose, profile_timings):
     logging.basicConfig(
         format="%(levelname)s: %(message)s",
         level=os.getenv("LOG_LEVEL", "DEBUG" if verbose else "INFO"),
     )
+    if profile_timings:
+        ctx.call_on_close(_print_timings)
+    inventory.filename = cache_file(f"roles-{active_profile()}.json")
+    caller_identity.filename = cache_file(f"identity-{active_profile()}.json")
+
+def _refresh_option(f):
+    return click.option(
+        "--refresh/--no-refresh",
+        default=False,
+        help="renew the credentials of the command before they expire, default --no-refresh",
+    )(f)
+
+
+def _cache_option(f):
+    return click.option(
+        "--cache/--no-cache",
+        default=None,
+        help="reuse credentials until they are about to expire, default --cache if the cache can be encrypted",
+    )(f)
+
+
+def _use_credentials(role_name, fetch, profile, refresh, cmd):
+    credentials = fetch()
+    if profile:
+        credentials.write_aws_config(profile)
+    if cmd:
+        if refresh:
+            r = run_with_refresh(
+                role_name, cmd, fetch, credential_cache.margin, credentials
+            )
+        else:
+            r = credentials.run(cmd)
+        exit(r.returncode)
+
 
 @cli.command("assume", help="the IAM role")
 @click.option(
     "--role-name", required=True, help="to assume", metavar="NAME"
 )
 @click.option("--profile", required=False, help="to save the credentials under", metavar="PROFILE")
+@_cache_option
+@_refresh_option
 @click.argument("CMD", nargs=-1)
-def assume(role_name, profile, cmd):
+def assume(role_name, profile, cache, refresh, cmd):
     try:
         if not profile and not cmd:
             raise click.UsageError("specify --profile, a command or both")
 
-        credentials = real_assume_role(role_name)
-        if profile:
-            credentials.write_aws_config(profile)
-        if cmd:
-            r = credentials.run(cmd)
-            exit(r.returncode)
+        fetch = partial(real_assume_role, role_name)
+        fetch = _cached(cache, fetch, mode="assume", role_name=role_name)
+
+        _use_credentials(role_name, fetch, profile, refresh, cmd)
 
     except AssumeRoleError as e:
         logging.error(f"{e}")
@@ -74,30 +132,197 @@ def assume(role_name, profile, cmd):
     help="invoke lambda, default --remote",
 )
 @click.option("--profile", required=False, help="to save the credentials under", metavar="PROFILE")
+@_cache_option
+@_refresh_option
 @click.argument("CMD", nargs=-1)
-def simulate(role_name, profile, principal, base_role, remote, cmd):
+def simulate(role_name, profile, principal, base_role, remote, cache, refresh, cmd):
     principal = str(principal) if principal else None
     try:
         if not profile and not cmd:
             raise click.UsageError("specify --profile, a command or both")
 
         if remote:
-            credentials = remote_assume_role(role_name, base_role, principal)
+            fetch = partial(remote_assume_role, role_name, base_role, principal)
+            policy = None
         else:
             if not base_role:
                 base_role = os.getenv("IAM_SUDO_BASE_ROLE", "IAMSudoRole")
-            credentials = simulate_assume_role(base_role, role_name, principal)
+            fetch = partial(simulate_assume_role, base_role, role_name, principal)
+            policy = Policy.get_default().content_hash
 
-        if profile:
-            credentials.write_aws_config(profile)
-        if cmd:
-            r = credentials.run(cmd)
-            exit(r.returncode)
+        fetch = _cached(
+            cache,
+            fetch,
+            mode="remote" if remote else "simulate",
+            role_name=role_name,
+            principal=principal,
+            base_role=base_role,
+            policy=policy,
+        )
+
+        _use_credentials(role_name, fetch, profile, refresh, cmd)
 
     except AssumeRoleError as e:
         logging.error(f"{e}")
         exit(1)
 
 
+@cli.command("serve", help="credentials of simulated roles over a local HTTP endpoint")
+@click.option("--port", default=9911, type=int, help="to listen on, default 9911")
+@click.option("--base-role", required=False, help="to assume to simulate the roles", metavar="NAME")
+@click.option(
+    "--remote/--local",
+    default=True,
+    required=False,
+    is_flag=True,
+    help="invoke lambda, default --remote",
+)
+@click.option("--role-name", required=False, help="to show the environment for", metavar="NAME")
+@click.option("--principal", required=False, help="of the simulated role", metavar="PRINCIPAL", callback=Principal.click_option)
+def serve(port, base_role, remote, role_name, principal):
+    def fetch(role_name: str, principal: str, requested_base_role: str) -> Credentials:
+        if remote:
+            return remote_assume_role(role_name, requested_base_role or base_role, principal)
+        return simulate_assume_role(
+            requested_base_role or base_role or os.getenv("IAM_SUDO_BASE_ROLE", "IAMSudoRole"),
+            role_name,
+            principal,
+        )
+
+    server = CredentialServer(
+        CredentialProvider(fetch, margin=credential_cache.margin),
+        port=port,
+        token=os.getenv("IAM_SUDO_SERVER_TOKEN"),
+    )
+    logging.info("serving credentials on %s/roles/<role-name>", server.url)
+    if role_name:
+        for name, value in server.environment(
+            role_name, str(principal) if principal else None
+        ).items():
+            click.echo(f'export {name}="{value}";')
+    else:
+        click.echo(f'export AWS_CONTAINER_AUTHORIZATION_TOKEN="{server.token}";')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@cli.command("list", help="the roles which may be simulated, as JSON lines")
+def list_roles():
+    policy = Policy.get_default()
+    scope = policy.role_scope()
+    roles = chain.from_iterable(
+        Role.iterate_all(a, scope) for a in hub_accounts() or [None]
+    )
+    for role in policy.iter_allowed_roles(roles):
+        click.echo(
+            json.dumps(
+                {
+                    "role_name": role.name,
+                    "arn": role.arn,
+                    "principals": [str(p) for p in policy.allowed_principals_of(role)],
+                }
+            )
+        )
+
+
+@cli.group("inventory", help="export and import snapshots of the role inventory")
+def inventory_group():
+    pass
+
+
+@inventory_group.command("export", help="the roles of the account to a snapshot")
+@click.option("--output", required=True, type=click.Path(dir_okay=False), help="snapshot file", metavar="FILE")
+@click.option(
+    "--policies/--no-policies",
+    default=True,
+    help="include the policies of the roles, default --policies",
+)
+def export_inventory(output, policies):
+    def roles():
+        for role in chain.from_iterable(Role.query_all(a) for a in hub_accounts() or [None]):
+            yield role, role.fetch_policy_snapshot() if policies else None
+
+    count = write_snapshot(output, roles(), include_policies=policies)
+    logging.info("exported %s roles to %s", count, output)
+
+
+@inventory_group.command("import", help="the roles of a snapshot into the role cache")
+@click.option("--input", "input_file", required=True, type=click.Path(exists=True, dir_okay=False), help="snapshot file", metavar="FILE")
+def import_inventory(input_file):
+    try:
+        snapshot = Snapshot.open(input_file)
+        inventory.replace(
+            snapshot, timestamp=snapshot.created, scope=Policy.get_default().role_scope()
+        )
+    except SnapshotError as e:
+        raise click.ClickException(f"{e}")
+    logging.info("imported %s roles from %s", len(snapshot), input_file)
+
+
+@inventory_group.command("apply-events", help="IAM change events to the role cache")
+@click.option("--input", "input_file", type=click.File("r"), default="-", help="events as JSON lines, default stdin", metavar="FILE")
+def apply_inventory_events(input_file):
+    scope = Policy.get_default().role_scope()
+    count = 0
+    for line in input_file:
+        if not line.strip():
+            continue
+        try:
+            count += apply_events(json.loads(line), scope=scope)
+        except ValueError as e:
+            logging.warning("ignoring line which is not an event, %s", e)
+    logging.info("applied %s role changes", count)
+
+
+@cli.group("policy", help="manage sudo policies")
+def policy():
+    pass
+
+
+@policy.command("compile", help="a sudo policy into a precompiled artifact")
+@click.option("--input", "input_file", type=click.File("r"), default="-", help="sudo policy in YAML, default stdin", metavar="FILE")
+@click.option("--output", "output_file", type=click.File("w"), default="-", help="compiled policy, default stdout", metavar="FILE")
+def compile_policy(input_file, output_file):
+    try:
+        artifact = Policy.load(input_file.read()).to_artifact()
+    except Exception as e:
+        raise click.ClickException(f"invalid sudo policy, {e}")
+
+    json.dump(artifact, output_file, separators=(",", ":"))
+    output_file.write("\n")
+    logging.info("compiled policy with sha256 %s", artifact["sha256"])
+
+
+def _print_timings():
+    for line in metrics.summary():
+        click.echo(line, err=True)
+
+
+def _cached(cache: Optional[bool], fetch, **kwargs):
+    """
+    `fetch` through the credential cache, unless `cache` is False. Without encryption,
+    credentials are not cached, and a warning is logged if --cache was specified.
+    """
+    if cache is False:
+        return fetch
+    if not credential_cache.available():
+        if cache:
+            logging.warning(
+                "credential cache disabled, install iam-sudo[cache-encryption] and set "
+                "IAM_SUDO_CACHE_KEY or use a keyring"
+            )
+        return fetch
+    return partial(credential_cache.get, _credentials_cache_key(**kwargs), fetch)
+
+
+def _credentials_cache_key(**kwargs) -> str:
+    return cache_key(profile=active_profile(), caller=credentials_key(), **kwargs)
+
+
 if __name__ == "__main__":
     cli()
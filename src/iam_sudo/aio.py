@@ -0,0 +1,70 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+asyncio versions of the sudo flows. The blocking boto3 calls are run on a bounded
+thread pool, so that an event loop can have many requests in flight without a thread
+per request.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+from iam_sudo import sudo
+from iam_sudo.credentials import Credentials
+from iam_sudo.principal import Principal
+from iam_sudo.roles import RoleRecord
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if not _executor:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("IAM_SUDO_ASYNC_WORKERS", "32")),
+                thread_name_prefix="iam-sudo-aio",
+            )
+        return _executor
+
+
+async def find_role(name: str, principal: Optional[Principal]) -> RoleRecord:
+    return await _run(sudo.find_role, name, principal)
+
+
+async def real_assume_role(role_name: str) -> Credentials:
+    return await _run(sudo.real_assume_role, role_name)
+
+
+async def simulate_assume_role(
+    base_role: str, role_name: str, principal: str
+) -> Credentials:
+    return await _run(sudo.simulate_assume_role, base_role, role_name, principal)
+
+
+async def remote_assume_role(
+    role_name: str, base_role: str, principal: str
+) -> Credentials:
+    return await _run(sudo.remote_assume_role, role_name, base_role, principal)
+
+
+async def _run(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), partial(fn, *args))
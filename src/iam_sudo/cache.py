@@ -0,0 +1,161 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import datetime
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from os import path
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+def cache_dir() -> str:
+    return path.expanduser(
+        path.expandvars(os.getenv("IAM_SUDO_CACHE_DIR", "~/.cache/iam-sudo"))
+    )
+
+
+def active_profile() -> str:
+    profile = os.getenv("AWS_PROFILE") or os.getenv("AWS_DEFAULT_PROFILE") or "default"
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", profile)
+
+
+def cache_file(name: str) -> str:
+    return path.join(cache_dir(), name)
+
+
+def read_json(filename: str) -> Optional[dict]:
+    try:
+        with open(filename, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.debug("ignoring unreadable cache file %s, %s", filename, e)
+        return None
+
+
+def write_json(filename: str, doc: dict):
+    directory = path.dirname(filename)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(doc, f, default=_convert_timestamp)
+        os.replace(tmp, filename)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+class TTLCache(object):
+    """
+    a thread-safe, in-memory cache holding at most `max_size` entries for at most `ttl`
+    seconds each. When full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, max_size: int = 128, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_if(self, predicate: Callable[[Hashable], bool]):
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SingleFlight(object):
+    """
+    coalesces concurrent calls with the same key: while a call is in flight, callers
+    with the same key wait for it and share its result or its exception.
+    """
+
+    class _Call(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.result: Any = None
+            self.error: Optional[BaseException] = None
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "SingleFlight._Call"] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+def _convert_timestamp(v):
+    if isinstance(v, (datetime.date, datetime.datetime)):
+        return v.isoformat()
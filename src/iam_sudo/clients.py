@@ -0,0 +1,170 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from iam_sudo.metrics import metrics
+
+_session = None
+_clients: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+
+def session():
+    """
+    the boto3 session shared by all clients, created on first use.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            import boto3.session
+
+            _session = boto3.session.Session()
+        return _session
+
+
+def client(service_name: str, account: Optional[str] = None):
+    """
+    the shared client for `service_name`, created on first use. Creating clients is
+    not thread-safe in boto3, so it is done under a lock. For one of the accounts in
+    IAM_SUDO_ACCOUNTS, the client uses the hub role in that account. IAM calls are
+    rate limited per client and all calls are counted in the metrics.
+    """
+    key = service_name
+    if account and account in hub_accounts():
+        key = f"{service_name}@{account}"
+
+    result = _clients.get(key)
+    if result is None:
+        with _lock:
+            result = _clients.get(key)
+            if result is None:
+                s = _hub_session(account) if key != service_name else session()
+                result = s.client(service_name, config=client_config())
+                result.meta.events.register(
+                    f"before-call.{result.meta.service_model.endpoint_prefix}",
+                    metrics.count_aws_call,
+                )
+                limiter = iam_rate_limiter() if service_name == "iam" else None
+                if limiter:
+                    result.meta.events.register("before-call.iam", limiter.before_call)
+                _clients[key] = result
+    return result
+
+
+def client_config():
+    """
+    the botocore configuration of all clients: a connection pool large enough for the
+    worker threads, kept alive between calls, and adaptive retries which slow down
+    the client when it is throttled.
+    """
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=int(os.getenv("IAM_SUDO_MAX_POOL_CONNECTIONS", "32")),
+        tcp_keepalive=True,
+        retries={
+            "mode": "adaptive",
+            "max_attempts": int(os.getenv("IAM_SUDO_MAX_ATTEMPTS", "10")),
+        },
+    )
+
+
+class RateLimiter(object):
+    """
+    a token bucket, allowing `rate` calls per second on average and bursts of up to
+    `burst` calls. Callers wait until a token is available.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+    def before_call(self, **kwargs):
+        self.acquire()
+
+
+def iam_rate_limiter() -> Optional[RateLimiter]:
+    """
+    a rate limiter for the IAM calls of one account, as IAM throttles per account.
+    """
+    rate = float(os.getenv("IAM_SUDO_IAM_RATE", "10"))
+    if rate <= 0:
+        return None
+    return RateLimiter(rate, int(os.getenv("IAM_SUDO_IAM_BURST", "20")))
+
+
+def hub_accounts() -> List[str]:
+    """
+    the accounts in which roles are searched, from IAM_SUDO_ACCOUNTS. Empty when only
+    the account of the caller is searched.
+    """
+    return [a.strip() for a in os.getenv("IAM_SUDO_ACCOUNTS", "").split(",") if a.strip()]
+
+
+def hub_role_arn(account: str) -> str:
+    return f"arn:aws:iam::{account}:role/{os.getenv('IAM_SUDO_HUB_ROLE', 'IAMSudoHub')}"
+
+
+def _hub_session(account: str):
+    """
+    a session with the credentials of the hub role in `account`, which are renewed
+    when they are about to expire.
+    """
+    import boto3.session
+    import botocore.session
+    from botocore.credentials import DeferredRefreshableCredentials
+
+    def assume_hub_role() -> dict:
+        credentials = client("sts").assume_role(
+            RoleArn=hub_role_arn(account), RoleSessionName="iam-sudo-hub"
+        )["Credentials"]
+        return {
+            "access_key": credentials["AccessKeyId"],
+            "secret_key": credentials["SecretAccessKey"],
+            "token": credentials["SessionToken"],
+            "expiry_time": credentials["Expiration"].isoformat(),
+        }
+
+    hub = botocore.session.get_session()
+    hub._credentials = DeferredRefreshableCredentials(
+        refresh_using=assume_hub_role, method="sts-assume-role"
+    )
+    return boto3.session.Session(
+        botocore_session=hub, region_name=session().region_name
+    )
+
+
+def reset():
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
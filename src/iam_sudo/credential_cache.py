@@ -0,0 +1,165 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from os import path
+from typing import Callable, Optional
+
+from iam_sudo.cache import cache_dir
+from iam_sudo.credentials import Credentials
+from iam_sudo.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+try:
+    from cryptography.fernet import Fernet
+except ImportError:
+    Fernet = None
+
+
+class CredentialCache(object):
+    """
+    caches credentials on disk, encrypted, until `margin` seconds before they expire.
+    Parallel processes requesting the same credentials wait on a file lock, so that
+    only one of them fetches them. The key is derived from IAM_SUDO_CACHE_KEY or kept
+    in the keyring of the OS, never in the cache directory. Without the `cryptography`
+    package or a key, credentials are not cached at all.
+    """
+
+    def __init__(self, directory: str = None, margin: int = 300):
+        self.directory = directory if directory else path.join(cache_dir(), "credentials")
+        self.margin = margin
+
+    def available(self) -> bool:
+        """
+        true if credentials can be encrypted, and therefore cached.
+        """
+        return self._fernet() is not None
+
+    def get(self, key: str, fetch: Callable[[], Credentials]) -> Credentials:
+        fernet = self._fernet()
+        if fernet is None:
+            metrics.count("credential_cache.disabled")
+            return fetch()
+
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        filename = path.join(self.directory, key)
+        with _file_lock(filename + ".lock"):
+            credentials = self._read(fernet, filename)
+            if credentials and not credentials.expires_within(self.margin):
+                logging.debug("using cached credentials")
+                metrics.count("credential_cache.hit")
+                return credentials
+
+            metrics.count("credential_cache.miss")
+            credentials = fetch()
+            self._write(fernet, filename, credentials)
+            return credentials
+
+    def _read(self, fernet: "Fernet", filename: str) -> Optional[Credentials]:
+        try:
+            with open(filename, "rb") as f:
+                return Credentials(json.loads(fernet.decrypt(f.read())))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.debug("ignoring unreadable cached credentials, %s", e)
+            return None
+
+    def _write(self, fernet: "Fernet", filename: str, credentials: Credentials):
+        data = fernet.encrypt(credentials.to_json().encode("utf-8"))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, filename)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    def _fernet(self) -> Optional["Fernet"]:
+        """
+        the cipher of the cached credentials, or None if they cannot be encrypted.
+        """
+        if Fernet is None:
+            self._disable("install iam-sudo[cache-encryption] to cache credentials")
+            return None
+
+        key = os.getenv("IAM_SUDO_CACHE_KEY")
+        if key:
+            return Fernet(
+                base64.urlsafe_b64encode(hashlib.sha256(key.encode("utf-8")).digest())
+            )
+
+        key = _keyring_key()
+        if key is None:
+            self._disable("set IAM_SUDO_CACHE_KEY or install keyring to cache credentials")
+            return None
+        return Fernet(key)
+
+    def _disable(self, reason: str):
+        logging.debug("credential cache disabled, %s", reason)
+
+
+def _keyring_key() -> Optional[bytes]:
+    """
+    the key of the credential cache in the keyring of the OS, generated on first use,
+    or None if there is no keyring.
+    """
+    try:
+        import keyring
+
+        key = keyring.get_password("iam-sudo", "credential-cache")
+        if not key:
+            key = Fernet.generate_key().decode("ascii")
+            keyring.set_password("iam-sudo", "credential-cache", key)
+        return key.encode("ascii")
+    except Exception as e:
+        logging.debug("no keyring for the credential cache key, %s", e)
+        return None
+
+
+def cache_key(**kwargs) -> str:
+    """
+    a file name safe key for the credentials requested with `kwargs`.
+    """
+    doc = json.dumps(kwargs, sort_keys=True, default=str)
+    return hashlib.sha256(doc.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def _file_lock(filename: str):
+    with open(filename, "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+credential_cache = CredentialCache(
+    margin=int(os.getenv("IAM_SUDO_CREDENTIAL_MARGIN", "300"))
+)
@@ -65,6 +65,21 @@ aws configure set aws_session_token "{self.aws_session_token}"
     def expiration(self):
         return self.credentials["Expiration"]
 
+    @property
+    def expires_at(self) -> datetime.datetime:
+        expiration = self.expiration
+        if isinstance(expiration, str):
+            expiration = datetime.datetime.fromisoformat(
+                expiration.replace("Z", "+00:00")
+            )
+        if not expiration.tzinfo:
+            expiration = expiration.replace(tzinfo=datetime.timezone.utc)
+        return expiration
+
+    def expires_within(self, seconds: float) -> bool:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return self.expires_at - now < datetime.timedelta(seconds=seconds)
+
     def __repr__(self):
         return self.format("json")
 
@@ -0,0 +1,311 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+applies the IAM calls which change roles, as recorded by CloudTrail, to the role
+inventory and the cached policies of the roles, so that they stay accurate without
+rescanning the account. An event only names the role which changed: the role itself
+is always read again from IAM, so that a forged event cannot alter the cached roles.
+
+The function receiving the events appends them to a change log in DynamoDB, which
+every instance of the function issuing credentials follows, so that all of them
+apply every change.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from iam_sudo import clients
+from iam_sudo.cache import TTLCache
+from iam_sudo.metrics import metrics
+from iam_sudo.roles import RoleScope, policy_snapshots
+
+ROLE_EVENTS = frozenset(["CreateRole", "DeleteRole", "UpdateAssumeRolePolicy"])
+POLICY_EVENTS = frozenset(
+    ["PutRolePolicy", "DeleteRolePolicy", "AttachRolePolicy", "DetachRolePolicy"]
+)
+
+
+class RoleChange(namedtuple("RoleChange", ["event_name", "account", "role_name"])):
+    """
+    a successful IAM call changing the role `role_name` in `account`.
+    """
+
+    @staticmethod
+    def from_record(record: dict, account: Optional[str] = None) -> Optional["RoleChange"]:
+        """
+        the change in the CloudTrail `record`, or None if it is not a successful call
+        changing a role.
+        """
+        event_name = record.get("eventName")
+        if (
+            record.get("eventSource") != "iam.amazonaws.com"
+            or record.get("errorCode")
+            or event_name not in ROLE_EVENTS | POLICY_EVENTS
+        ):
+            return None
+
+        role_name = (record.get("requestParameters") or {}).get("roleName")
+        if not role_name:
+            return None
+
+        return RoleChange(event_name, record.get("recipientAccountId") or account, role_name)
+
+
+def is_event(doc: dict) -> bool:
+    """
+    true if `doc` is an EventBridge event, a batch of CloudTrail or SQS records, or a
+    single CloudTrail record, rather than a request for credentials.
+    """
+    return "detail-type" in doc or "Records" in doc or "eventName" in doc
+
+
+def iter_changes(doc: dict) -> Iterator[RoleChange]:
+    """
+    the role changes in `doc`: an EventBridge event, a CloudTrail log file, a batch of
+    SQS messages holding any of these, or a single CloudTrail record.
+    """
+    if "detail-type" in doc:
+        change = RoleChange.from_record(doc.get("detail") or {}, doc.get("account"))
+        if change:
+            yield change
+    elif "Records" in doc:
+        for record in doc["Records"]:
+            if "body" in record:
+                try:
+                    yield from iter_changes(json.loads(record["body"]))
+                except ValueError as e:
+                    logging.warning("ignoring message which is not an event, %s", e)
+            else:
+                yield from iter_changes(record)
+    elif "eventName" in doc:
+        change = RoleChange.from_record(doc)
+        if change:
+            yield change
+
+
+class InventoryUpdater(object):
+    """
+    applies role changes to `inventory`, default the shared role inventory, and to
+    the cached policies of the roles. A changed role is read again from IAM, and
+    removed from the inventory if it no longer exists.
+    """
+
+    def __init__(self, inventory=None, snapshots: TTLCache = None):
+        if inventory is None:
+            from iam_sudo.inventory import inventory
+        self.inventory = inventory
+        self.snapshots = snapshots if snapshots is not None else policy_snapshots
+
+    def apply(self, change: RoleChange):
+        logging.debug(
+            "applying %s of role %s in account %s",
+            change.event_name,
+            change.role_name,
+            change.account,
+        )
+        metrics.count(f"events.{change.event_name}")
+        if change.event_name in ROLE_EVENTS:
+            self.inventory.refresh_role(change.role_name, change.account)
+
+        if change.event_name in POLICY_EVENTS or change.event_name == "DeleteRole":
+            self.snapshots.discard_if(
+                lambda version: _is_version_of(version, change.account, change.role_name)
+            )
+
+    def apply_all(self, changes: Iterable[RoleChange]) -> int:
+        """
+        applies `changes` in order, and returns the number of changes applied.
+        """
+        count = 0
+        for change in changes:
+            self.apply(change)
+            count += 1
+        return count
+
+
+def apply_events(doc: dict, inventory=None, scope: Optional[RoleScope] = None) -> int:
+    """
+    applies the role changes in the event `doc` to `inventory`, default the shared
+    role inventory, limited to the roles within `scope`, and returns the number of
+    changes applied.
+    """
+    updater = InventoryUpdater(inventory)
+    if scope:
+        updater.inventory.use_scope(scope)
+    return updater.apply_all(iter_changes(doc))
+
+
+class ChangeLog(object):
+    """
+    the role changes shared between the function receiving the events and the
+    instances of the function issuing credentials, in the DynamoDB table `table`. A
+    change is kept for `retention` seconds, after which DynamoDB expires it.
+    """
+
+    partition = "role-changes"
+
+    def __init__(self, table: str, retention: int = 86400):
+        self.table = table
+        self.retention = retention
+
+    def append(self, changes: Iterable[RoleChange]) -> int:
+        """
+        appends `changes` to the log, and returns the number of changes appended.
+        """
+        count = 0
+        for change in changes:
+            now = time.time()
+            item = {
+                "pk": {"S": self.partition},
+                "sk": {"S": f"{_sequence(now)}-{uuid.uuid4().hex[:8]}"},
+                "event_name": {"S": change.event_name},
+                "role_name": {"S": change.role_name},
+                "expires_at": {"N": str(int(now) + self.retention)},
+            }
+            if change.account:
+                item["account"] = {"S": change.account}
+            clients.client("dynamodb").put_item(TableName=self.table, Item=item)
+            count += 1
+        return count
+
+    def since(self, timestamp: float) -> List[Tuple[str, RoleChange]]:
+        """
+        the changes appended after `timestamp`, in order, with their sequence numbers.
+        """
+        result = []
+        kwargs = {
+            "TableName": self.table,
+            "KeyConditionExpression": "#pk = :pk AND #sk > :sk",
+            "ExpressionAttributeNames": {"#pk": "pk", "#sk": "sk"},
+            "ExpressionAttributeValues": {
+                ":pk": {"S": self.partition},
+                ":sk": {"S": _sequence(timestamp)},
+            },
+        }
+        while True:
+            response = clients.client("dynamodb").query(**kwargs)
+            for item in response.get("Items", []):
+                change = RoleChange(
+                    item["event_name"]["S"],
+                    item.get("account", {}).get("S"),
+                    item["role_name"]["S"],
+                )
+                result.append((item["sk"]["S"], change))
+            if not response.get("LastEvaluatedKey"):
+                return result
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+class ChangeFollower(object):
+    """
+    applies the changes appended to `log` since its creation, at most once every
+    `interval` seconds. The log is read back `overlap` seconds, so that changes
+    appended by a host with a clock behind this one are not missed; changes read
+    twice are applied once.
+    """
+
+    def __init__(
+        self,
+        log: ChangeLog,
+        updater: InventoryUpdater = None,
+        interval: float = 10,
+        overlap: float = 60,
+    ):
+        self.log = log
+        self.updater = updater if updater else InventoryUpdater()
+        self.interval = interval
+        self.overlap = overlap
+        self._position = time.time()
+        self._polled = 0.0
+        self._applied = set()
+        self._lock = threading.Lock()
+
+    def poll(self) -> int:
+        """
+        applies the new changes in the log, if the last poll is more than `interval`
+        seconds ago, and returns the number of changes applied.
+        """
+        with self._lock:
+            now = time.time()
+            if now - self._polled < self.interval:
+                return 0
+            self._polled = now
+
+            count = 0
+            for sequence, change in self.log.since(self._position - self.overlap):
+                if sequence in self._applied:
+                    continue
+                self.updater.apply(change)
+                self._applied.add(sequence)
+                count += 1
+
+            self._position = now
+            oldest = _sequence(now - self.overlap)
+            self._applied = {s for s in self._applied if s > oldest}
+            return count
+
+
+_follower: Optional[ChangeFollower] = None
+_follower_lock = threading.Lock()
+
+
+def change_log() -> Optional[ChangeLog]:
+    """
+    the change log in the table IAM_SUDO_ROLE_CHANGES_TABLE, or None if not set.
+    """
+    table = os.getenv("IAM_SUDO_ROLE_CHANGES_TABLE")
+    return ChangeLog(table) if table else None
+
+
+def follow_changes() -> int:
+    """
+    applies the new role changes in the change log to the shared role inventory,
+    and returns the number of changes applied. A failure to read the log is logged,
+    so that credentials are still issued, from a cache which may be stale.
+    """
+    global _follower
+    with _follower_lock:
+        if not _follower:
+            log = change_log()
+            if not log:
+                return 0
+            _follower = ChangeFollower(
+                log,
+                interval=float(os.getenv("IAM_SUDO_ROLE_CHANGES_INTERVAL", "10")),
+            )
+    try:
+        return _follower.poll()
+    except Exception as e:
+        logging.warning("failed to read the role change log, %s", e)
+        return 0
+
+
+def _sequence(timestamp: float) -> str:
+    return f"{int(max(timestamp, 0) * 1_000_000_000):020d}"
+
+
+def _is_version_of(version, account: Optional[str], role_name: str) -> bool:
+    parts = str(version[0]).split(":") if version else []
+    return (
+        len(parts) > 5
+        and parts[5].split("/")[-1] == role_name
+        and (not account or parts[4] == account)
+    )
@@ -0,0 +1,78 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+
+from iam_sudo.cache import read_json, write_json
+from iam_sudo.clients import client, session
+
+
+class CallerIdentity(object):
+    """
+    the account of the caller, resolved once per set of credentials. When a filename
+    is set, it is also stored on disk so that subsequent CLI invocations can reuse it.
+    """
+
+    def __init__(self, filename: str = None):
+        self.filename = filename
+        self._accounts: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def account(self) -> str:
+        key = credentials_key()
+        with self._lock:
+            account = self._accounts.get(key)
+            if not account:
+                account = self._load_from_file(key)
+            if not account:
+                account = client("sts").get_caller_identity()["Account"]
+                self._save_to_file(key, account)
+            self._accounts[key] = account
+            return account
+
+    def clear(self):
+        with self._lock:
+            self._accounts.clear()
+
+    def _load_from_file(self, key: str) -> Optional[str]:
+        if not self.filename:
+            return None
+        doc = read_json(self.filename)
+        if doc and doc.get("key") == key:
+            return doc.get("Account")
+        return None
+
+    def _save_to_file(self, key: str, account: str):
+        if not self.filename:
+            return
+        try:
+            write_json(self.filename, {"key": key, "Account": account})
+        except OSError as e:
+            logging.debug("failed to write identity cache %s, %s", self.filename, e)
+
+
+def credentials_key() -> str:
+    """
+    identifies the active credentials without exposing them: a hash of the access key.
+    """
+    credentials = session().get_credentials()
+    access_key = credentials.access_key if credentials else ""
+    return hashlib.sha256(access_key.encode("utf-8")).hexdigest()[:32]
+
+
+caller_identity = CallerIdentity()
@@ -0,0 +1,564 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from iam_sudo.cache import read_json, write_json
+from iam_sudo.clients import hub_accounts
+from iam_sudo.metrics import metrics
+from iam_sudo.principal import Principal
+from iam_sudo.role_index import RoleIndex
+from iam_sudo.roles import ALL_ROLES, Role, RoleQuery, RoleRecord, Roles, RoleScope
+from iam_sudo.snapshot import Snapshot
+
+CACHE_VERSION = 2
+
+# the maximum number of allowed role names looked up one by one instead of a scan
+MAX_TARGETED_LOOKUPS = 10
+
+
+class RoleInventory(object):
+    """
+    a TTL-bounded cache of the roles in the account within a scope. The roles are kept
+    in memory as compact records and, when a filename is set, on disk so that
+    subsequent CLI invocations can reuse them.
+    """
+
+    multi_account = False
+
+    def __init__(
+        self,
+        ttl: int = 300,
+        max_size: int = 10000,
+        filename: str = None,
+        account: Optional[str] = None,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.filename = filename
+        self.account = account
+        self._scope = ALL_ROLES
+        self._roles: Optional[Dict[str, RoleRecord]] = None
+        self._index: Optional[RoleIndex] = None
+        self._timestamp = 0.0
+        self._exceeded_at = 0.0
+        self._lock = threading.RLock()
+
+    def is_fresh(self) -> bool:
+        return (
+            self._roles is not None
+            and self.ttl > 0
+            and time.time() - self._timestamp < self.ttl
+        )
+
+    def get_all(self) -> Roles:
+        with self._lock:
+            if not self.is_fresh():
+                self._load_from_file()
+            if self.is_fresh():
+                return Roles(list(self._roles.values()))
+            return self.refresh()
+
+    def find(
+        self,
+        name: str,
+        principal: Optional[Principal] = None,
+        scope: Optional[RoleScope] = None,
+    ) -> Roles:
+        """
+        roles with `name` in their name and with `principal`, if specified.
+        """
+        return self.query(name, principal, scope).to_roles()
+
+    def query(
+        self,
+        name: str,
+        principal: Optional[Principal] = None,
+        scope: Optional[RoleScope] = None,
+    ) -> RoleQuery:
+        """
+        a lazy query on the roles within `scope` with `name` in their name and with
+        `principal`, if specified. When the roles are not cached, the role named
+        `name` or, if there are only a few, the allowed role names are looked up
+        directly, before the account is scanned. When no cached role matches, the
+        role named `name` is looked up, as it may have been created since the scan.
+        """
+        with self._lock:
+            self.use_scope(scope)
+            if not self.is_fresh():
+                self._load_from_file()
+            metrics.count("role_cache.hit" if self.is_fresh() else "role_cache.miss")
+            if self.is_fresh():
+                return RoleQuery(self._find_cached(name, principal))
+        return RoleQuery(self._search(name, principal))
+
+    def _find_cached(self, name: str, principal: Optional[Principal]) -> Iterator[RoleRecord]:
+        roles = self._find_in_index(name, principal)
+        if roles:
+            yield from roles
+        else:
+            yield from self._lookup(name, principal)
+
+    def _search(self, name: str, principal: Optional[Principal]) -> Iterator[RoleRecord]:
+        names = self._scope.candidates(name)
+        if names is not None and len(names) <= MAX_TARGETED_LOOKUPS:
+            for n in names:
+                yield from self._lookup(n, principal)
+            return
+
+        yield from self._lookup(name, principal)
+
+        rest = self._refresh_if_stale()
+        if rest is not None:
+            roles = RoleQuery(rest).name_contains(name).with_principal(principal)
+        elif self._roles is None:
+            roles = (
+                Role.query_all(self.account, self._scope)
+                .name_contains(name)
+                .with_principal(principal)
+            )
+        else:
+            roles = self._find_in_index(name, principal)
+        yield from (r for r in roles if r.name != name)
+
+    def _refresh_if_stale(self) -> Optional[Iterator[RoleRecord]]:
+        """
+        rescans the account, unless another thread did so while the lock was not held,
+        or the account has more roles than fit in the cache. If the rescan finds that
+        the account has more roles than fit in the cache, the roles of the scan are
+        returned as a stream.
+        """
+        with self._lock:
+            if not self.is_fresh():
+                self._load_from_file()
+            if not self.is_fresh() and not self.exceeds_max_size():
+                return self._scan()
+            return None
+
+    def _lookup(self, name: str, principal: Optional[Principal]) -> Iterator[RoleRecord]:
+        if not name:
+            return
+        for role in self.lookup(name):
+            if self._scope.contains(role) and (
+                not principal or principal in role.principals
+            ):
+                yield role
+
+    def _find_in_index(self, name: str, principal: Optional[Principal]) -> List[RoleRecord]:
+        with self._lock:
+            if self._index is None:
+                self._index = RoleIndex(self._roles.values())
+            return self._index.find(name, principal)
+
+    def _is_account(self, account: Optional[str]) -> bool:
+        return not account or not self.account or account == self.account
+
+    def use_scope(self, scope: Optional[RoleScope]):
+        """
+        limits the cache to the roles within `scope`, dropping the cached roles when
+        the scope changes.
+        """
+        scope = scope if scope else ALL_ROLES
+        with self._lock:
+            if scope == self._scope:
+                return
+            self._scope = scope
+            self._roles = None
+            self._index = None
+            self._timestamp = 0.0
+            self._exceeded_at = 0.0
+
+    def exceeds_max_size(self) -> bool:
+        """
+        true if the last refresh, less than ttl seconds ago, found more roles than fit
+        in the cache.
+        """
+        return self.ttl > 0 and time.time() - self._exceeded_at < self.ttl
+
+    def refresh(self) -> Roles:
+        """
+        rescans the whole account, as IAM cannot list only the roles which changed,
+        and returns all its roles. Roles which did not change keep their existing
+        instance, so that anything derived from them remains valid.
+        """
+        with self._lock:
+            rest = self._scan()
+            if rest is not None:
+                return Roles(list(rest))
+            return Roles(list(self._roles.values()))
+
+    def _scan(self) -> Optional[Iterator[RoleRecord]]:
+        """
+        rescans the account into the cache. When the account has more roles than fit
+        in the cache, the scan stops after max_size + 1 roles and the cache is
+        invalidated. The roles of the scan are then returned as a stream, those read
+        so far followed by the rest, so that the caller needs no second scan.
+        """
+        with self._lock:
+            started = time.monotonic()
+            previous = self._roles if self._roles is not None else {}
+            stream = iter(Role.query_all(self.account, self._scope))
+            roles: List[RoleRecord] = []
+            with metrics.timer("list_roles"):
+                for r in stream:
+                    roles.append(_unchanged_or(previous.get(r.name), r))
+                    if len(roles) > self.max_size:
+                        break
+
+            if len(roles) > self.max_size:
+                logging.warning(
+                    "account has more roles than fit in the cache size of %s",
+                    self.max_size,
+                )
+                self.invalidate()
+                self._exceeded_at = time.time()
+                return chain(roles, stream)
+
+            logging.debug(
+                "role inventory%s refreshed in %.3fs, %s of %s roles changed",
+                f" of account {self.account}" if self.account else "",
+                time.monotonic() - started,
+                sum(1 for r in roles if previous.get(r.name) is not r),
+                len(roles),
+            )
+            self._roles = {r.name: r for r in roles}
+            self._index = None
+            self._timestamp = time.time()
+            self._exceeded_at = 0.0
+            self._save_to_file()
+            return None
+
+    def replace(
+        self,
+        roles: Iterable[RoleRecord],
+        timestamp: Optional[float] = None,
+        scope: Optional[RoleScope] = None,
+    ):
+        """
+        replaces the cached roles by those of `roles` within `scope`, as if the
+        account was scanned at `timestamp`, default now. The cache is then used by
+        queries with the same scope.
+        """
+        with self._lock:
+            self.use_scope(scope)
+            self._roles = {r.name: r for r in roles if self._scope.contains(r)}
+            self._index = None
+            self._timestamp = timestamp if timestamp is not None else time.time()
+            self._exceeded_at = 0.0
+            self._save_to_file()
+
+    def lookup(self, name: str) -> Roles:
+        """
+        the role named `name`, looked up directly in IAM.
+        """
+        role = self.refresh_role(name)
+        return Roles([role] if role else [])
+
+    def refresh_role(self, name: str, account: Optional[str] = None) -> Optional[RoleRecord]:
+        """
+        reads the role named `name` from IAM into the cache, or removes it from the
+        cache if it no longer exists. Ignored for roles of another `account`.
+        """
+        if not self._is_account(account):
+            return None
+        role = Role.get_by_role_name(name, self.account)
+        if not role:
+            self.remove(name)
+            return None
+
+        record = RoleRecord.create(role)
+        self.put(record)
+        return record
+
+    def put(self, role: Union[Role, RoleRecord]):
+        role = RoleRecord.create(role)
+        with self._lock:
+            if self._roles is None:
+                self._load_from_file()
+            if (
+                self._roles is not None
+                and self._is_account(role.account)
+                and self._scope.contains(role)
+                and (role.name in self._roles or len(self._roles) < self.max_size)
+            ):
+                self._roles[role.name] = role
+                if self._index is not None:
+                    self._index.add(role)
+                self._save_to_file()
+
+    def remove(self, name: str, account: Optional[str] = None):
+        if not self._is_account(account):
+            return
+        with self._lock:
+            if self._roles is None:
+                self._load_from_file()
+            if self._roles is not None and self._roles.pop(name, None) is not None:
+                if self._index is not None:
+                    self._index.discard(name)
+                self._save_to_file()
+
+    def invalidate(self):
+        with self._lock:
+            self._roles = None
+            self._index = None
+            self._timestamp = 0.0
+            if self.filename:
+                try:
+                    os.unlink(self.filename)
+                except FileNotFoundError:
+                    pass
+
+    def _load_from_file(self):
+        if not self.filename:
+            return
+        doc = read_json(self.filename)
+        if not doc or doc.get("version") != CACHE_VERSION:
+            return
+        if RoleScope.from_dict(doc.get("scope", {})) != self._scope:
+            return
+        self._roles = {
+            r["RoleName"]: RoleRecord.from_dict(r) for r in doc.get("roles", [])
+        }
+        self._index = None
+        self._timestamp = doc.get("timestamp", 0.0)
+
+    def _save_to_file(self):
+        if not self.filename:
+            return
+        try:
+            write_json(
+                self.filename,
+                {
+                    "version": CACHE_VERSION,
+                    "timestamp": self._timestamp,
+                    "scope": self._scope.to_dict(),
+                    "roles": [r.to_dict() for r in self._roles.values()],
+                },
+            )
+        except OSError as e:
+            logging.debug("failed to write role cache %s, %s", self.filename, e)
+
+
+def _unchanged_or(existing: Optional[RoleRecord], role: RoleRecord) -> RoleRecord:
+    if (
+        existing is not None
+        and existing.role_id == role.role_id
+        and existing.principals == role.principals
+    ):
+        return existing
+    return role
+
+
+class MultiAccountInventory(object):
+    """
+    the role inventories of several accounts, searched in parallel. Each account has
+    its own cache entry, so that a search costs about as much as the scan of the
+    slowest account.
+    """
+
+    multi_account = True
+
+    def __init__(
+        self,
+        accounts: List[str],
+        ttl: int = 300,
+        max_size: int = 10000,
+        max_workers: int = 16,
+    ):
+        self.inventories = {
+            account: RoleInventory(ttl, max_size, account=account) for account in accounts
+        }
+        self.latency: Dict[str, float] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="iam-sudo-account"
+        )
+        self._filename: Optional[str] = None
+
+    @property
+    def filename(self) -> Optional[str]:
+        return self._filename
+
+    @filename.setter
+    def filename(self, filename: Optional[str]):
+        self._filename = filename
+        base, ext = os.path.splitext(filename) if filename else (None, None)
+        for account, inventory in self.inventories.items():
+            inventory.filename = f"{base}-{account}{ext}" if filename else None
+
+    def get_all(self) -> Roles:
+        return self._merge(lambda i: i.get_all())
+
+    def find(
+        self,
+        name: str,
+        principal: Optional[Principal] = None,
+        scope: Optional[RoleScope] = None,
+    ) -> Roles:
+        return self._merge(lambda i: i.find(name, principal, scope))
+
+    def query(
+        self,
+        name: str,
+        principal: Optional[Principal] = None,
+        scope: Optional[RoleScope] = None,
+    ) -> RoleQuery:
+        return RoleQuery(self.find(name, principal, scope))
+
+    def lookup(self, name: str) -> Roles:
+        return self._merge(lambda i: i.lookup(name))
+
+    def refresh(self) -> Roles:
+        return self._merge(lambda i: i.refresh())
+
+    def use_scope(self, scope: Optional[RoleScope]):
+        for inventory in self.inventories.values():
+            inventory.use_scope(scope)
+
+    def refresh_role(self, name: str, account: Optional[str] = None) -> Optional[RoleRecord]:
+        inventory = self.inventories.get(account)
+        return inventory.refresh_role(name) if inventory else None
+
+    def put(self, role: Union[Role, RoleRecord]):
+        inventory = self.inventories.get(role.account)
+        if inventory:
+            inventory.put(role)
+
+    def remove(self, name: str, account: Optional[str] = None):
+        for a, inventory in self.inventories.items():
+            if account is None or a == account:
+                inventory.remove(name)
+
+    def invalidate(self):
+        for inventory in self.inventories.values():
+            inventory.invalidate()
+
+    def replace(
+        self,
+        roles: Iterable[RoleRecord],
+        timestamp: Optional[float] = None,
+        scope: Optional[RoleScope] = None,
+    ):
+        by_account = {account: [] for account in self.inventories}
+        for role in roles:
+            if role.account in by_account:
+                by_account[role.account].append(role)
+        for account, inventory in self.inventories.items():
+            inventory.replace(by_account[account], timestamp, scope)
+
+    def _merge(self, operation: Callable[[RoleInventory], Roles]) -> Roles:
+        def timed(item: Tuple[str, RoleInventory]) -> Roles:
+            account, inventory = item
+            started = time.monotonic()
+            try:
+                return operation(inventory)
+            finally:
+                self.latency[account] = time.monotonic() - started
+                logging.debug(
+                    "searched account %s in %.3fs", account, self.latency[account]
+                )
+
+        result = Roles()
+        for roles in self._executor.map(timed, self.inventories.items()):
+            result.extend(roles)
+        return result
+
+
+class SnapshotInventory(object):
+    """
+    the roles of a snapshot, for offline lookups. The snapshot is never refreshed, and
+    changes to the roles are ignored.
+    """
+
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        self.multi_account = snapshot.multi_account
+        self.filename: Optional[str] = None
+
+    def get_all(self) -> Roles:
+        return Roles(list(self.snapshot))
+
+    def find(
+        self,
+        name: str,
+        principal: Optional[Principal] = None,
+        scope: Optional[RoleScope] = None,
+    ) -> Roles:
+        return self.query(name, principal, scope).to_roles()
+
+    def query(
+        self,
+        name: str,
+        principal: Optional[Principal] = None,
+        scope: Optional[RoleScope] = None,
+    ) -> RoleQuery:
+        roles = RoleQuery(self.snapshot.find(name, principal))
+        return roles.where(scope.contains) if scope else roles
+
+    def lookup(self, name: str) -> Roles:
+        return self.snapshot.get(name)
+
+    def refresh(self) -> Roles:
+        return self.get_all()
+
+    def refresh_role(self, name: str, account: Optional[str] = None) -> Optional[RoleRecord]:
+        roles = self.lookup(name)
+        return roles[0] if roles else None
+
+    def use_scope(self, scope: Optional[RoleScope]):
+        pass
+
+    def put(self, role: Union[Role, RoleRecord]):
+        pass
+
+    def remove(self, name: str, account: Optional[str] = None):
+        pass
+
+    def invalidate(self):
+        pass
+
+    def replace(
+        self,
+        roles: Iterable[RoleRecord],
+        timestamp: Optional[float] = None,
+        scope: Optional[RoleScope] = None,
+    ):
+        pass
+
+
+def _create_inventory() -> Union[RoleInventory, MultiAccountInventory, SnapshotInventory]:
+    snapshot = os.getenv("IAM_SUDO_INVENTORY_SNAPSHOT")
+    if snapshot:
+        return SnapshotInventory(Snapshot.open(snapshot))
+
+    ttl = int(os.getenv("IAM_SUDO_ROLE_CACHE_TTL", "300"))
+    max_size = int(os.getenv("IAM_SUDO_ROLE_CACHE_SIZE", "10000"))
+    accounts = hub_accounts()
+    if accounts:
+        return MultiAccountInventory(
+            accounts,
+            ttl=ttl,
+            max_size=max_size,
+            max_workers=int(os.getenv("IAM_SUDO_ACCOUNT_WORKERS", "16")),
+        )
+    return RoleInventory(ttl=ttl, max_size=max_size)
+
+
+inventory = _create_inventory()
@@ -17,9 +17,10 @@ import json
 import logging
 import os
 
-import jsonschema
-
-from iam_sudo.sudo import simulate_assume_role
+from iam_sudo.credentials import Credentials
+from iam_sudo.events import change_log, follow_changes, is_event, iter_changes
+from iam_sudo.metrics import metrics
+from iam_sudo.sudo import simulate_assume_role, simulate_assume_roles
 from iam_sudo.sudo_policy import Policy
 
 schema = {
@@ -32,8 +33,18 @@ schema = {
     },
 }
 
+batch_schema = {
+    "type": "object",
+    "required": ["requests"],
+    "properties": {
+        "requests": {"type": "array", "items": schema, "minItems": 1, "maxItems": 100},
+    },
+}
+
+
+def is_valid_request(request, schema=schema) -> bool:
+    import jsonschema
 
-def is_valid_request(request) -> bool:
     try:
         jsonschema.validate(request, schema)
         return True
@@ -42,20 +53,48 @@ def is_valid_request(request) -> bool:
         return False
 
 
-_policy = None
+def handler(request, context):
+    """
+    simulates the role or the roles of `request`, after applying the new role changes
+    in the change log. The timings of the stages and the counters of the request are
+    logged as CloudWatch embedded metrics.
+    """
+    try:
+        with metrics.timer("request"):
+            return handle(request)
+    finally:
+        metrics.flush_emf()
 
 
-def handler(request, context):
-    if not os.getenv("IAM_SUDO_POLICY"):
+def events_handler(event, context):
+    """
+    appends the role changes in the IAM change events of `event` to the change log,
+    which the function issuing credentials follows. Deploy it as a separate function
+    which only EventBridge or SQS may invoke: the function issuing credentials never
+    takes events, and reads every logged role again from IAM.
+    """
+    try:
+        with metrics.timer("events"):
+            return handle_events(event)
+    finally:
+        metrics.flush_emf()
+
+
+def handle(request) -> dict:
+    if not os.getenv("IAM_SUDO_POLICY") and not os.getenv("IAM_SUDO_POLICY_SOURCE"):
         raise Exception("an explicit sudo policy is required")
 
     if not os.getenv("IAM_SUDO_BASE_ROLE"):
         raise Exception("an explicit sudo base role is required")
 
-    global _policy
-    if not _policy:
-        _policy = Policy.get_default()
-        logging.info("%s", _policy)
+    Policy.get_default()
+    follow_changes()
+
+    if is_event(request):
+        raise Exception("invalid request received, send events to the events handler.")
+
+    if "requests" in request:
+        return handle_batch(request)
 
     if is_valid_request(request):
         credentials = simulate_assume_role(
@@ -68,3 +107,38 @@ def handler(request, context):
 
     else:
         raise Exception("invalid request received.")
+
+
+def handle_events(event) -> dict:
+    if not is_event(event):
+        raise Exception("invalid event received.")
+
+    log = change_log()
+    if not log:
+        raise Exception("a role change table is required")
+
+    return {"logged": log.append(iter_changes(event))}
+
+
+def handle_batch(request) -> dict:
+    if not is_valid_request(request, batch_schema):
+        raise Exception("invalid batch request received.")
+
+    results = simulate_assume_roles(
+        [
+            {
+                "base_role": r.get("base_role", os.getenv("IAM_SUDO_BASE_ROLE")),
+                "principal": r.get("principal"),
+                "role_name": r["role_name"],
+            }
+            for r in request["requests"]
+        ]
+    )
+    return {
+        "results": [
+            {"credentials": json.loads(r.to_json())}
+            if isinstance(r, Credentials)
+            else {"error": f"{r}"}
+            for r in results
+        ]
+    }
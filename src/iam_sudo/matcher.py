@@ -0,0 +1,183 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from iam_sudo.principal import Principal
+
+
+class GlobMatcher(object):
+    """
+    matches a string against a list of glob patterns in a single operation. Literal
+    patterns are looked up in a set, the others are combined into a single regular
+    expression.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        patterns = list(patterns)
+        self.literals = frozenset(p for p in patterns if not has_magic(p))
+        self.globs = sorted(set(p for p in patterns if has_magic(p)))
+        self.regex = _compile(translate(p) for p in self.globs)
+
+    def matches(self, s: str) -> bool:
+        return s in self.literals or (
+            self.regex is not None and self.regex.fullmatch(s) is not None
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "literals": sorted(self.literals),
+            "regex": self.regex.pattern if self.regex is not None else None,
+        }
+
+    @staticmethod
+    def from_dict(d: dict) -> "GlobMatcher":
+        result = GlobMatcher([])
+        result.literals = frozenset(d["literals"])
+        result.regex = _recompile(d["regex"])
+        return result
+
+
+class PrincipalMatcher(object):
+    """
+    matches a principal against a list of principal glob patterns in a single operation,
+    by matching the type and identifier separated by a NUL character.
+    """
+
+    def __init__(self, principals: Iterable[Principal]):
+        self.globs: List[Tuple[str, str]] = sorted(
+            set((p.typ, p.identifier) for p in principals)
+        )
+        self.regex = _compile(
+            f"{translate(typ)}\0{translate(identifier)}" for typ, identifier in self.globs
+        )
+
+    def matches(self, principal: Principal) -> bool:
+        return (
+            self.regex is not None
+            and self.regex.fullmatch(f"{principal.typ}\0{principal.identifier}")
+            is not None
+        )
+
+    def to_dict(self) -> dict:
+        return {"regex": self.regex.pattern if self.regex is not None else None}
+
+    @staticmethod
+    def from_dict(d: dict) -> "PrincipalMatcher":
+        result = PrincipalMatcher([])
+        result.regex = _recompile(d["regex"])
+        return result
+
+
+def has_magic(pattern: str) -> bool:
+    return any(c in pattern for c in "*?[")
+
+
+def literal_prefix(pattern: str) -> str:
+    """
+    the part of `pattern` before its first wildcard, with which every match starts.
+    """
+    for i, c in enumerate(pattern):
+        if c in "*?[":
+            return pattern[:i]
+    return pattern
+
+
+def translate(pattern: str) -> str:
+    """
+    translates the shell-style `pattern` into a regular expression, without anchors
+    so that it can be combined with others. Follows the semantics of fnmatch.
+    """
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            if not result or result[-1] != ".*":
+                result.append(".*")
+        elif c == "?":
+            result.append(".")
+        elif c == "[":
+            j = i
+            if j < n and pattern[j] == "!":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 1
+            if j >= n:
+                result.append("\\[")
+            else:
+                result.append(_translate_set(pattern, i, j))
+                i = j + 1
+        else:
+            result.append(re.escape(c))
+    return "".join(result)
+
+
+def _translate_set(pattern: str, i: int, j: int) -> str:
+    """
+    translates the set `pattern[i:j]`, without its brackets, as fnmatch does: empty
+    ranges are removed, and backslashes, hyphens outside ranges and set operations
+    are escaped.
+    """
+    stuff = pattern[i:j]
+    if "-" not in stuff:
+        stuff = stuff.replace("\\", "\\\\")
+    else:
+        chunks = []
+        k = i + 2 if pattern[i] == "!" else i + 1
+        while True:
+            k = pattern.find("-", k, j)
+            if k < 0:
+                break
+            chunks.append(pattern[i:k])
+            i = k + 1
+            k = k + 3
+        chunk = pattern[i:j]
+        if chunk:
+            chunks.append(chunk)
+        else:
+            chunks[-1] += "-"
+        for k in range(len(chunks) - 1, 0, -1):
+            if chunks[k - 1][-1] > chunks[k][0]:
+                chunks[k - 1] = chunks[k - 1][:-1] + chunks[k][1:]
+                del chunks[k]
+        stuff = "-".join(
+            s.replace("\\", "\\\\").replace("-", "\\-") for s in chunks
+        )
+    stuff = re.sub(r"([&~|])", r"\\\1", stuff)
+    if not stuff:
+        return "(?!)"
+    if stuff == "!":
+        return "."
+    if stuff[0] == "!":
+        stuff = "^" + stuff[1:]
+    elif stuff[0] in ("^", "["):
+        stuff = "\\" + stuff
+    return f"[{stuff}]"
+
+
+def _compile(expressions: Iterable[str]):
+    expressions = list(expressions)
+    if not expressions:
+        return None
+    return _recompile("|".join(f"(?:{e})" for e in expressions))
+
+
+def _recompile(pattern: Optional[str]):
+    return re.compile(pattern, re.DOTALL) if pattern is not None else None
@@ -0,0 +1,185 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, TextIO
+
+
+class Timing(object):
+    """
+    the number of times a stage ran, and its total, minimum and maximum duration in
+    seconds, so that the memory used does not grow with the number of samples.
+    """
+
+    __slots__ = ("count", "total", "minimum", "maximum")
+
+    def __init__(
+        self, count: int = 0, total: float = 0.0, minimum: float = 0.0, maximum: float = 0.0
+    ):
+        self.count = count
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def add(self, seconds: float):
+        self.minimum = min(self.minimum, seconds) if self.count else seconds
+        self.maximum = max(self.maximum, seconds) if self.count else seconds
+        self.count += 1
+        self.total += seconds
+
+    def copy(self) -> "Timing":
+        return Timing(self.count, self.total, self.minimum, self.maximum)
+
+    def to_statistic_set(self) -> dict:
+        """
+        the timing in milliseconds, as an embedded metric format statistic set.
+        """
+        return {
+            "SampleCount": self.count,
+            "Sum": round(self.total * 1000, 3),
+            "Min": round(self.minimum * 1000, 3),
+            "Max": round(self.maximum * 1000, 3),
+        }
+
+    def __repr__(self):
+        return f"Timing({self.count}, {self.total}, {self.minimum}, {self.maximum})"
+
+
+class Metrics(object):
+    """
+    an in-process registry of the timings of the stages of a request and of counters,
+    such as the AWS calls made and the cache hits and misses. Hooks added with
+    `add_hook` are called with the name and duration of each timed stage, to pass
+    them on to a tracer.
+    """
+
+    def __init__(self):
+        self._timings: Dict[str, Timing] = {}
+        self._counters: Dict[str, int] = {}
+        self._hooks: List[Callable[[str, float], None]] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Callable[[str, float], None]):
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[str, float], None]):
+        self._hooks.remove(hook)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        times the block as `stage`, also when it raises an exception.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            timing = self._timings.get(stage)
+            if timing is None:
+                timing = self._timings[stage] = Timing()
+            timing.add(seconds)
+        for hook in self._hooks:
+            hook(stage, seconds)
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def count_aws_call(self, model, **kwargs):
+        """
+        counts an AWS call, as a handler of the botocore before-call event.
+        """
+        self.count(f"{model.service_model.endpoint_prefix}.{model.name}")
+
+    def timings(self) -> Dict[str, Timing]:
+        with self._lock:
+            return {k: v.copy() for k, v in self._timings.items()}
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+
+    def summary(self) -> List[str]:
+        """
+        a line per stage with the number of times it ran and its total and maximum
+        duration, followed by a line per counter.
+        """
+        lines = []
+        for stage, timing in sorted(self.timings().items()):
+            lines.append(
+                f"{stage:<24} {timing.count:>6} x {timing.total * 1000:>10.1f} ms"
+                f"  max {timing.maximum * 1000:>8.1f} ms"
+            )
+        for name, value in sorted(self.counters().items()):
+            lines.append(f"{name:<24} {value:>6}")
+        return lines
+
+    def to_emf(self, namespace: str, dimensions: Optional[Dict[str, str]] = None) -> dict:
+        """
+        the timings in milliseconds, as statistic sets, and the counters as a
+        CloudWatch embedded metric format document.
+        """
+        dimensions = dimensions if dimensions else {}
+        timings, counters = self.timings(), self.counters()
+        doc = dict(dimensions)
+        metrics = []
+        for stage, timing in timings.items():
+            doc[stage] = timing.to_statistic_set()
+            metrics.append({"Name": stage, "Unit": "Milliseconds"})
+        for name, value in counters.items():
+            doc[name] = value
+            metrics.append({"Name": name, "Unit": "Count"})
+
+        doc["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": metrics,
+                }
+            ],
+        }
+        return doc
+
+    def flush_emf(self, stream: TextIO = None, dimensions: Optional[Dict[str, str]] = None):
+        """
+        writes the metrics as an embedded metric format document on a single line of
+        `stream`, default stdout, from which CloudWatch extracts them, and resets them.
+        """
+        if not self.timings() and not self.counters():
+            return
+        namespace = os.getenv("IAM_SUDO_METRICS_NAMESPACE", "iam-sudo")
+        stream = stream if stream else sys.stdout
+        stream.write(json.dumps(self.to_emf(namespace, dimensions)) + "\n")
+        stream.flush()
+        self.reset()
+
+
+metrics = Metrics()
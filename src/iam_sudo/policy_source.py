@@ -0,0 +1,159 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import abc
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlparse
+
+from iam_sudo.clients import client
+from iam_sudo.sudo_policy import Policy, default_policy_document
+
+
+class PolicySource(abc.ABC):
+    """
+    a source of the sudo policy document.
+    """
+
+    @abc.abstractmethod
+    def fetch(self, version: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        the policy document and its version. If the version is still `version`, the
+        document is None.
+        """
+
+
+class EnvironmentPolicySource(PolicySource):
+    def __init__(self, get_document: Callable[[], str] = default_policy_document):
+        self.get_document = get_document
+
+    def fetch(self, version: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        document = self.get_document()
+        current = hashlib.sha256(document.encode("utf-8")).hexdigest()
+        return (None if current == version else document), current
+
+
+class FilePolicySource(PolicySource):
+    def __init__(self, path: str):
+        self.path = path
+
+    def fetch(self, version: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        st = os.stat(self.path)
+        current = f"{st.st_mtime_ns}-{st.st_size}"
+        if current == version:
+            return None, version
+        with open(self.path, "r") as f:
+            return f.read(), current
+
+
+class ParameterStorePolicySource(PolicySource):
+    def __init__(self, name: str, ssm=None):
+        self.name = name
+        self.ssm = ssm
+
+    def fetch(self, version: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        ssm = self.ssm if self.ssm else client("ssm")
+        parameter = ssm.get_parameter(Name=self.name, WithDecryption=True)["Parameter"]
+        current = str(parameter["Version"])
+        if current == version:
+            return None, version
+        return parameter["Value"], current
+
+
+class S3PolicySource(PolicySource):
+    def __init__(self, bucket: str, key: str, s3=None):
+        self.bucket = bucket
+        self.key = key
+        self.s3 = s3
+
+    def fetch(self, version: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        from botocore.exceptions import ClientError
+
+        s3 = self.s3 if self.s3 else client("s3")
+        kwargs = {"Bucket": self.bucket, "Key": self.key}
+        if version:
+            kwargs["IfNoneMatch"] = version
+        try:
+            response = s3.get_object(**kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("304", "NotModified"):
+                return None, version
+            raise
+        return response["Body"].read().decode("utf-8"), response["ETag"]
+
+
+class PolicyProvider(object):
+    """
+    provides the policy from `source`, checking for a new version at most once every
+    `ttl` seconds. A new version replaces the policy in one assignment, so that
+    concurrent requests see either the old or the new policy. If a new version cannot
+    be loaded, the current policy remains in effect.
+    """
+
+    def __init__(self, source: PolicySource, ttl: float = 60):
+        self.source = source
+        self.ttl = ttl
+        self.version: Optional[str] = None
+        self._policy: Optional[Policy] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Policy:
+        if self._policy is not None and time.monotonic() - self._checked < self.ttl:
+            return self._policy
+
+        with self._lock:
+            if self._policy is None or time.monotonic() - self._checked >= self.ttl:
+                self._reload()
+        return self._policy
+
+    def _reload(self):
+        try:
+            document, version = self.source.fetch(self.version)
+            if document is not None:
+                policy = Policy.load(document)
+                self._policy, self.version = policy, version
+                logging.info("loaded sudo policy version %s\n%s", version, policy)
+        except Exception as e:
+            if self._policy is None:
+                raise
+            logging.error(
+                "failed to reload the sudo policy, keeping version %s, %s",
+                self.version,
+                e,
+            )
+        self._checked = time.monotonic()
+
+
+def policy_source_from_url(url: Optional[str]) -> PolicySource:
+    """
+    the policy source for `url`: file:///<path>, ssm:///<parameter-name> or
+    s3://<bucket>/<key>. Without a url, the policy is read from IAM_SUDO_POLICY.
+    """
+    if not url:
+        return EnvironmentPolicySource()
+
+    u = urlparse(url)
+    if u.scheme == "file":
+        return FilePolicySource(u.path)
+    if u.scheme == "ssm":
+        return ParameterStorePolicySource(u.netloc + u.path if u.netloc else u.path)
+    if u.scheme == "s3":
+        return S3PolicySource(u.netloc, u.path.lstrip("/"))
+    raise ValueError(f"unsupported policy source {url}")
@@ -13,7 +13,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import click
 
 class Principal(object):
     def __init__(self, typ: str, identifier: str):
@@ -26,6 +25,9 @@ class Principal(object):
     def __eq__(self, other):
         return self.typ == other.typ and self.identifier == other.identifier
 
+    def __hash__(self):
+        return hash((self.typ, self.identifier))
+
     @staticmethod
     def create_from_dict(d: dict) -> "Principal":
         if "type" in d and "identifier" in d:
@@ -41,6 +43,8 @@ class Principal(object):
 
     @staticmethod
     def click_option(ctx, param, value):
+        import click
+
         if value is not None:
             try:
                 return Principal.create_from_string(value)
@@ -0,0 +1,94 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+from iam_sudo.principal import Principal
+from iam_sudo.roles import Role, Roles
+
+NGRAM_SIZE = 3
+
+
+class RoleIndex(object):
+    """
+    an index on the role names and principals, to find roles by a substring of their
+    name and their principal without scanning all roles.
+    """
+
+    def __init__(self, roles: Iterable[Role] = ()):
+        self.by_name: Dict[str, Role] = {}
+        self.by_ngram: Dict[str, Set[str]] = defaultdict(set)
+        self.by_principal: Dict[Principal, Set[str]] = defaultdict(set)
+        for role in roles:
+            self.add(role)
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def add(self, role: Role):
+        self.discard(role.name)
+        self.by_name[role.name] = role
+        for ngram in _ngrams(role.name):
+            self.by_ngram[ngram].add(role.name)
+        for principal in role.principals:
+            self.by_principal[principal].add(role.name)
+
+    def discard(self, name: str):
+        role = self.by_name.pop(name, None)
+        if not role:
+            return
+        for ngram in _ngrams(name):
+            _discard(self.by_ngram, ngram, name)
+        for principal in role.principals:
+            _discard(self.by_principal, principal, name)
+
+    def get(self, name: str) -> Optional[Role]:
+        return self.by_name.get(name)
+
+    def names_containing(self, substring: str) -> Set[str]:
+        if len(substring) < NGRAM_SIZE:
+            return {n for n in self.by_name if substring in n}
+
+        postings = sorted(
+            (self.by_ngram.get(ngram, set()) for ngram in _ngrams(substring)), key=len
+        )
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates &= posting
+        return {n for n in candidates if substring in n}
+
+    def names_with_principal(self, principal: Principal) -> Set[str]:
+        return self.by_principal.get(principal, set())
+
+    def find(self, name: str, principal: Optional[Principal] = None) -> Roles:
+        names = self.names_containing(name)
+        if principal:
+            names &= self.names_with_principal(principal)
+        return Roles([self.by_name[n] for n in sorted(names)])
+
+
+def _ngrams(s: str) -> Set[str]:
+    return {s[i : i + NGRAM_SIZE] for i in range(len(s) - NGRAM_SIZE + 1)}
+
+
+def _discard(index: dict, key, name: str):
+    names = index.get(key)
+    if names is not None:
+        names.discard(name)
+        if not names:
+            del index[key]
@@ -14,14 +14,98 @@
 # limitations under the License.
 #
 import json
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
-from typing import List, Optional
-
-import boto3
+from types import MappingProxyType
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
 
+from iam_sudo.cache import TTLCache
+from iam_sudo.clients import client
+from iam_sudo.metrics import metrics
 from iam_sudo.principal import Principal
 
-iam = boto3.client("iam")
+policy_snapshots = TTLCache(
+    max_size=int(os.getenv("IAM_SUDO_POLICY_CACHE_SIZE", "256")),
+    ttl=int(os.getenv("IAM_SUDO_POLICY_CACHE_TTL", "300")),
+)
+
+_policy_fetcher: Optional[ThreadPoolExecutor] = None
+_policy_fetcher_lock = threading.Lock()
+
+
+def policy_fetcher() -> ThreadPoolExecutor:
+    """
+    the thread pool on which the policies of roles are fetched. Only leaf tasks are
+    submitted to it, so that it cannot deadlock on tasks waiting for each other.
+    """
+    global _policy_fetcher
+    with _policy_fetcher_lock:
+        if not _policy_fetcher:
+            _policy_fetcher = ThreadPoolExecutor(
+                max_workers=int(os.getenv("IAM_SUDO_POLICY_FETCH_WORKERS", "8")),
+                thread_name_prefix="iam-sudo-policy",
+            )
+        return _policy_fetcher
+
+
+class PolicySnapshot(
+    namedtuple("PolicySnapshot", ["attached_policies", "inline_policies"])
+):
+    """
+    the attached policy arns and the inline policy documents of a role, read at one
+    moment in time.
+    """
+
+    @property
+    def merged_inlined_policy(self) -> dict:
+        return merge_policies(self.inline_policies.values())
+
+
+class RoleScope(
+    namedtuple("RoleScope", ["path_prefixes", "name_prefix", "names"])
+):
+    """
+    the roles which may be simulated at all: those with a path starting with one of
+    the `path_prefixes` and a name starting with `name_prefix`. When the allowed role
+    names have no wildcards, `names` holds them, otherwise it is None.
+    """
+
+    def contains(self, role) -> bool:
+        return (
+            role.name.startswith(self.name_prefix)
+            and (self.names is None or role.name in self.names)
+            and any(role.path.startswith(p) for p in self.path_prefixes)
+        )
+
+    def candidates(self, name: str) -> Optional[List[str]]:
+        """
+        the allowed role names with `name` in them, or None if the names are not known.
+        """
+        if self.names is None:
+            return None
+        return sorted(n for n in self.names if name in n)
+
+    def to_dict(self) -> dict:
+        return {
+            "path_prefixes": list(self.path_prefixes),
+            "name_prefix": self.name_prefix,
+            "names": sorted(self.names) if self.names is not None else None,
+        }
+
+    @staticmethod
+    def from_dict(d: dict) -> "RoleScope":
+        names = d.get("names")
+        return RoleScope(
+            tuple(d.get("path_prefixes", ["/"])),
+            d.get("name_prefix", ""),
+            frozenset(names) if names is not None else None,
+        )
+
+
+ALL_ROLES = RoleScope(("/",), "", None)
 
 
 class Roles(list):
@@ -31,20 +115,142 @@ class Roles(list):
 
     @staticmethod
     def load_from_file(path: str) -> "Roles":
-        with open(path, "r") as f:
+        """
+        the roles in the JSON array or the snapshot in `path`.
+        """
+        from iam_sudo.snapshot import MAGIC, Snapshot
+
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) == MAGIC:
+                return Roles(list(Snapshot.open(path)))
+            f.seek(0)
             return Roles(list(map(lambda r: Role(r), json.load(f))))
 
+    def query(self) -> "RoleQuery":
+        return RoleQuery(self)
+
     def filter_by_substring_of_name(self, role_name: str) -> "Roles":
-        return Roles(list((filter(lambda r: role_name in r.name, self))))
+        return self.query().name_contains(role_name).to_roles()
 
     def filter_by_principal(self, principal: Principal) -> "Roles":
-        return Roles(list(filter(lambda r: principal in r.principals, self)))
+        return self.query().with_principal(principal).to_roles()
+
+
+class RoleQuery(object):
+    """
+    a lazy, chainable query on a stream of roles. The filters are applied while
+    iterating, so that the roles need not be held in memory at once. Like the stream
+    it wraps, a query can be iterated only once.
+    """
+
+    def __init__(self, roles: Iterable):
+        self._roles = roles
+
+    def __iter__(self) -> Iterator:
+        return iter(self._roles)
+
+    def where(self, predicate: Callable[[Any], bool]) -> "RoleQuery":
+        return RoleQuery(filter(predicate, self._roles))
 
+    def name_contains(self, substring: str) -> "RoleQuery":
+        return self.where(lambda r: substring in r.name)
+
+    def with_principal(self, principal: Optional[Principal]) -> "RoleQuery":
+        if not principal:
+            return self
+        return self.where(lambda r: principal in r.principals)
+
+    def records(self) -> "RoleQuery":
+        """
+        the roles as compact records, dropping the rest of the IAM payload.
+        """
+        return RoleQuery(map(RoleRecord.create, self._roles))
+
+    def to_roles(self) -> Roles:
+        return Roles(list(self._roles))
+
+
+class RolePolicies(object):
+    """
+    the policies of a role, for any class with a `name` and a `version`.
+    """
+
+    __slots__ = ()
+
+    @property
+    def account(self) -> Optional[str]:
+        parts = self.arn.split(":")
+        return parts[4] if len(parts) > 5 else None
+
+    @property
+    def attached_policies(self) -> list:
+        result = []
+        iam = client("iam", self.account)
+        for response in iam.get_paginator("list_attached_role_policies").paginate(
+            RoleName=self.name
+        ):
+            for policy in response["AttachedPolicies"]:
+                result.append(policy["PolicyArn"])
+        return result
+
+    @property
+    def inline_policy_names(self) -> list:
+        result = []
+        iam = client("iam", self.account)
+        for response in iam.get_paginator("list_role_policies").paginate(
+            RoleName=self.name
+        ):
+            result.extend(response["PolicyNames"])
+        return result
 
-class Role(dict):
+    @property
+    def inline_policies(self) -> dict:
+        return self._get_inline_policies(self.inline_policy_names)
+
+    @property
+    def merged_inlined_policy(self) -> dict:
+        return merge_policies(self.inline_policies.values())
+
+    def get_policy_snapshot(self) -> PolicySnapshot:
+        """
+        the attached and inline policies of the role, memoized per role version for
+        at most IAM_SUDO_POLICY_CACHE_TTL seconds.
+        """
+        snapshot = policy_snapshots.get(self.version)
+        if snapshot is None:
+            metrics.count("policy_cache.miss")
+            snapshot = self.fetch_policy_snapshot()
+            policy_snapshots.put(self.version, snapshot)
+        else:
+            metrics.count("policy_cache.hit")
+        return snapshot
+
+    def fetch_policy_snapshot(self) -> PolicySnapshot:
+        """
+        reads the attached and inline policies of the role, fetching the inline policy
+        documents concurrently.
+        """
+        attached_policies = policy_fetcher().submit(lambda: self.attached_policies)
+        inline_policies = self._get_inline_policies(self.inline_policy_names)
+        return PolicySnapshot(
+            tuple(attached_policies.result()), MappingProxyType(inline_policies)
+        )
+
+    def _get_inline_policies(self, names: List[str]) -> dict:
+        def get_role_policy(policy_name: str) -> dict:
+            r = client("iam", self.account).get_role_policy(
+                RoleName=self.name, PolicyName=policy_name
+            )
+            return r["PolicyDocument"]
+
+        return dict(zip(names, policy_fetcher().map(get_role_policy, names)))
+
+
+class Role(dict, RolePolicies):
     def __init__(self, role: dict):
         super(Role, self).__init__()
         self.update(role)
+        self._principals: Optional[List[Principal]] = None
 
     @property
     def name(self):
@@ -54,8 +260,17 @@ class Role(dict):
     def arn(self):
         return self["Arn"]
 
+    @property
+    def path(self):
+        return self.get("Path", "/")
+
     @property
     def principals(self) -> List[Principal]:
+        if self._principals is None:
+            self._principals = self._parse_principals()
+        return self._principals
+
+    def _parse_principals(self) -> List[Principal]:
         result = []
         statement = self.get("AssumeRolePolicyDocument", {}).get("Statement", [])
         p = statement[0].get("Principal") if statement else None
@@ -70,49 +285,132 @@ class Role(dict):
         return result
 
     @property
-    def attached_policies(self) -> list:
-        result = []
-        for response in iam.get_paginator("list_attached_role_policies").paginate(
-            RoleName=self.name
-        ):
-            for policy in response["AttachedPolicies"]:
-                result.append(policy["PolicyArn"])
-        return result
+    def version(self) -> tuple:
+        """
+        identifies this incarnation of the role: a role which is deleted and created
+        again gets a new id and creation date.
+        """
+        return (
+            self.arn,
+            self.get("RoleId"),
+            str(self.get("CreateDate")),
+            str(self.get("RoleLastUsed", {}).get("LastUsedDate")),
+        )
 
-    @property
-    def inline_policies(self) -> dict:
-        result = {}
-        for response in iam.get_paginator("list_role_policies").paginate(
-            RoleName=self.name
-        ):
-            for policy_name in response["PolicyNames"]:
-                r = iam.get_role_policy(RoleName=self.name, PolicyName=policy_name)
-                result[policy_name] = r["PolicyDocument"]
+    @staticmethod
+    def get_all() -> Roles:
+        from iam_sudo.inventory import inventory
 
-        return result
+        return inventory.get_all()
 
-    @property
-    def merged_inlined_policy(self) -> dict:
-        result = {}
-        for name, doc in self.inline_policies.items():
-            if result:
-                result["Statement"].extend(doc.get("Statement", []))
-            else:
-                result = deepcopy(doc)
+    @staticmethod
+    def list_all(account: Optional[str] = None, scope: Optional[RoleScope] = None) -> Roles:
+        return Roles(list(Role.iterate_all(account, scope)))
 
-        return result
+    @staticmethod
+    def iterate_all(
+        account: Optional[str] = None, scope: Optional[RoleScope] = None
+    ) -> Iterator["Role"]:
+        """
+        yields all roles in the account within `scope`, one page of list_roles at a
+        time. IAM lists the roles per path prefix, the names are filtered here.
+        """
+        scope = scope if scope else ALL_ROLES
+        paginator = client("iam", account).get_paginator("list_roles")
+        for prefix in scope.path_prefixes:
+            kwargs = {"PathPrefix": prefix} if prefix != "/" else {}
+            for response in paginator.paginate(**kwargs):
+                yield from filter(scope.contains, map(Role, response["Roles"]))
 
     @staticmethod
-    def get_all() -> Roles:
-        result = []
-        for response in iam.get_paginator("list_roles").paginate():
-            result.extend(map(lambda r: Role(r), response["Roles"]))
-        return Roles(result)
+    def query_all(account: Optional[str] = None, scope: Optional[RoleScope] = None) -> RoleQuery:
+        """
+        a lazy query on the compact records of all roles in the account within `scope`.
+        """
+        return RoleQuery(Role.iterate_all(account, scope)).records()
 
     @staticmethod
-    def get_by_role_name(name: str) -> Optional["Role"]:
+    def get_by_role_name(name: str, account: Optional[str] = None) -> Optional["Role"]:
+        iam = client("iam", account)
         try:
             r = iam.get_role(RoleName=name)
             return Role(r["Role"])
-        except iam.exceptions.NoSuchEntity:
+        except iam.exceptions.NoSuchEntityException:
             return None
+
+
+class RoleRecord(RolePolicies):
+    """
+    the compact form of a role, holding only what is needed to find, authorize and
+    simulate it.
+    """
+
+    __slots__ = ("name", "arn", "path", "role_id", "principals", "version")
+
+    def __init__(
+        self,
+        name: str,
+        arn: str,
+        path: str = "/",
+        role_id: Optional[str] = None,
+        principals: Tuple[Principal, ...] = (),
+        version: tuple = (),
+    ):
+        self.name = name
+        self.arn = arn
+        self.path = path
+        self.role_id = role_id
+        self.principals = principals
+        self.version = version
+
+    def __repr__(self):
+        return f"RoleRecord({self.arn})"
+
+    @staticmethod
+    def create(role: Union[Role, "RoleRecord"]) -> "RoleRecord":
+        if isinstance(role, RoleRecord):
+            return role
+        return RoleRecord(
+            role.name,
+            role.arn,
+            role.get("Path", "/"),
+            role.get("RoleId"),
+            tuple(role.principals),
+            role.version,
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "RoleName": self.name,
+            "Arn": self.arn,
+            "Path": self.path,
+            "RoleId": self.role_id,
+            "Principals": [[p.typ, p.identifier] for p in self.principals],
+            "Version": list(self.version),
+        }
+
+    @staticmethod
+    def from_dict(d: dict) -> "RoleRecord":
+        return RoleRecord(
+            d["RoleName"],
+            d["Arn"],
+            d.get("Path", "/"),
+            d.get("RoleId"),
+            tuple(Principal(typ, identifier) for typ, identifier in d.get("Principals", [])),
+            tuple(d.get("Version", [])),
+        )
+
+
+def merge_policies(docs: Iterable[dict]) -> dict:
+    result = {}
+    for doc in docs:
+        statements = doc.get("Statement", [])
+        if isinstance(statements, dict):
+            statements = [statements]
+        if result:
+            result["Statement"].extend(deepcopy(statements))
+        else:
+            result = deepcopy(doc)
+            result["Statement"] = deepcopy(statements)
+
+    return result
@@ -0,0 +1,161 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import hmac
+import json
+import logging
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlparse
+
+from iam_sudo.credentials import Credentials
+from iam_sudo.sudo import AssumeRoleError
+
+CredentialsFetcher = Callable[[str, Optional[str], Optional[str]], Credentials]
+
+
+class CredentialProvider(object):
+    """
+    provides the credentials of a role, fetched with `fetch(role_name, principal,
+    base_role)`. The credentials are kept in memory and fetched again `margin`
+    seconds before they expire.
+    """
+
+    def __init__(self, fetch: CredentialsFetcher, margin: int = 300):
+        self.fetch = fetch
+        self.margin = margin
+        self._credentials: Dict[Tuple, Credentials] = {}
+        self._locks: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def put(
+        self,
+        credentials: Credentials,
+        role_name: str,
+        principal: str = None,
+        base_role: str = None,
+    ):
+        self._credentials[(role_name, principal, base_role)] = credentials
+
+    def get(
+        self, role_name: str, principal: str = None, base_role: str = None
+    ) -> Credentials:
+        key = (role_name, principal, base_role)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            credentials = self._credentials.get(key)
+            if not credentials or credentials.expires_within(self.margin):
+                credentials = self.fetch(role_name, principal, base_role)
+                self._credentials[key] = credentials
+            return credentials
+
+
+class CredentialServer(ThreadingHTTPServer):
+    """
+    serves credentials in the format of the container credential provider, on the path
+    /roles/<role-name>?principal=<principal>&base_role=<base-role>. Point an AWS SDK to
+    it with AWS_CONTAINER_CREDENTIALS_FULL_URI and AWS_CONTAINER_AUTHORIZATION_TOKEN.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        provider: CredentialProvider,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        token: str = None,
+    ):
+        super(CredentialServer, self).__init__((host, port), _CredentialRequestHandler)
+        self.provider = provider
+        self.token = token if token else secrets.token_urlsafe(32)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def role_url(self, role_name: str, principal: str = None, base_role: str = None):
+        url = f"{self.url}/roles/{quote(role_name, safe='')}"
+        query = urlencode(
+            [(k, v) for k, v in [("principal", principal), ("base_role", base_role)] if v]
+        )
+        return f"{url}?{query}" if query else url
+
+    def environment(self, role_name: str, principal: str = None, base_role: str = None):
+        return {
+            "AWS_CONTAINER_CREDENTIALS_FULL_URI": self.role_url(
+                role_name, principal, base_role
+            ),
+            "AWS_CONTAINER_AUTHORIZATION_TOKEN": self.token,
+        }
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(
+            target=self.serve_forever, name="iam-sudo-server", daemon=True
+        )
+        thread.start()
+        return thread
+
+
+class _CredentialRequestHandler(BaseHTTPRequestHandler):
+    server: CredentialServer
+
+    def do_GET(self):
+        if not hmac.compare_digest(
+            self.headers.get("Authorization", "").encode("utf-8"),
+            self.server.token.encode("utf-8"),
+        ):
+            return self._reply(401, {"code": "Unauthorized", "message": "invalid token"})
+
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "roles" or not parts[1]:
+            return self._reply(404, {"code": "NotFound", "message": "no such resource"})
+
+        query = parse_qs(url.query)
+        try:
+            credentials = self.server.provider.get(
+                unquote(parts[1]),
+                query.get("principal", [None])[0],
+                query.get("base_role", [None])[0],
+            )
+        except AssumeRoleError as e:
+            return self._reply(400, {"code": "AssumeRoleError", "message": f"{e}"})
+
+        self._reply(
+            200,
+            {
+                "AccessKeyId": credentials.aws_access_key_id,
+                "SecretAccessKey": credentials.aws_secret_access_key,
+                "Token": credentials.aws_session_token,
+                "Expiration": credentials.expires_at.isoformat(),
+            },
+        )
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
@@ -0,0 +1,200 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import json
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from iam_sudo.roles import PolicySnapshot
+
+# the limits STS imposes on the session policies passed to AssumeRole
+MAX_PLAINTEXT_SIZE = 2048
+MAX_MANAGED_POLICIES = 10
+
+
+class SessionPolicy(object):
+    """
+    the session policy of a simulated role: the managed policy arns and the packed
+    inline policy.
+    """
+
+    def __init__(self, policy_arns: List[str], policy: Optional[dict]):
+        self.policy_arns = policy_arns
+        self.policy = policy
+        self.document = minify(policy) if policy else None
+
+    @staticmethod
+    def create(snapshot: PolicySnapshot) -> "SessionPolicy":
+        policy = snapshot.merged_inlined_policy
+        return SessionPolicy(
+            list(snapshot.attached_policies), pack_policy(policy) if policy else None
+        )
+
+    @property
+    def size(self) -> int:
+        """
+        the plaintext size of the session policies, as STS measures it.
+        """
+        return sum(len(arn) for arn in self.policy_arns) + (
+            len(self.document) if self.document else 0
+        )
+
+    def problems(self) -> List[str]:
+        result = []
+        if len(self.policy_arns) > MAX_MANAGED_POLICIES:
+            result.append(
+                f"{len(self.policy_arns)} managed policies exceed the maximum of {MAX_MANAGED_POLICIES}"
+            )
+        if self.size > MAX_PLAINTEXT_SIZE:
+            result.append(
+                f"session policy of {self.size} characters exceeds the maximum of {MAX_PLAINTEXT_SIZE}: "
+                f"{sum(len(arn) for arn in self.policy_arns)} characters in {len(self.policy_arns)} managed policy arns, "
+                f"{len(self.document) if self.document else 0} characters in "
+                f"{len(self.policy['Statement']) if self.policy else 0} inline policy statements"
+            )
+        return result
+
+    def assume_role_kwargs(self) -> dict:
+        result = {}
+        if self.policy_arns:
+            result["PolicyArns"] = [{"arn": arn} for arn in self.policy_arns]
+        if self.document:
+            result["Policy"] = self.document
+        return result
+
+
+def minify(policy: dict) -> str:
+    return json.dumps(policy, separators=(",", ":"))
+
+
+def pack_policy(policy: dict) -> dict:
+    """
+    an equivalent, smaller version of `policy`: statement ids are removed, duplicate
+    and covered actions and resources are dropped, and statements which differ only in
+    their actions or only in their resources are merged.
+    """
+    statements = [_normalize(s) for s in _as_list(policy.get("Statement", []))]
+    statements = _merge(statements, merge_key="Action", group_key="Resource")
+    statements = _merge(statements, merge_key="Resource", group_key="Action")
+    statements = _deduplicate(statements)
+
+    result = OrderedDict()
+    if "Version" in policy:
+        result["Version"] = policy["Version"]
+    result["Statement"] = [_denormalize(s) for s in statements]
+    return result
+
+
+def collapse(patterns: List[str], ignore_case: bool = False) -> List[str]:
+    """
+    `patterns` without duplicates and without the patterns covered by other
+    wildcard patterns. For instance, s3:GetObject is covered by s3:Get*.
+    """
+
+    def key(p: str) -> str:
+        return p.lower() if ignore_case else p
+
+    unique = list(OrderedDict((key(p), p) for p in patterns).values())
+    wildcards = [key(p) for p in unique if "*" in p or "?" in p]
+    return [
+        p
+        for p in unique
+        if not any(w != key(p) and _covers(w, key(p)) for w in wildcards)
+    ]
+
+
+def _covers(wildcard: str, pattern: str) -> bool:
+    """
+    true if every value matched by the IAM `pattern` is matched by `wildcard`.
+    """
+    return _wildcard_regex(wildcard).fullmatch(pattern) is not None
+
+
+@lru_cache(maxsize=1024)
+def _wildcard_regex(wildcard: str):
+    """
+    the regular expression of the IAM `wildcard`, in which only * and ? are special.
+    A * covers anything, including the wildcards of another pattern, while a ? only
+    covers a single character or a ?, as a * may match more than one character.
+    """
+    parts = []
+    for c in wildcard:
+        if c == "*":
+            parts.append(".*")
+        elif c == "?":
+            parts.append("[^*]")
+        else:
+            parts.append(re.escape(c))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+def _normalize(statement: dict) -> dict:
+    result = OrderedDict(
+        (k, v) for k, v in statement.items() if k not in ("Sid",)
+    )
+    for k, ignore_case in [
+        ("Action", True),
+        ("NotAction", True),
+        ("Resource", False),
+        ("NotResource", False),
+    ]:
+        if k in result:
+            result[k] = tuple(sorted(collapse(_as_list(result[k]), ignore_case)))
+    return result
+
+
+def _denormalize(statement: dict) -> dict:
+    result = OrderedDict()
+    for k, v in statement.items():
+        if isinstance(v, tuple):
+            v = v[0] if len(v) == 1 else list(v)
+        result[k] = v
+    return result
+
+
+def _merge(statements: List[dict], merge_key: str, group_key: str) -> List[dict]:
+    """
+    merges the `merge_key` values of statements which are identical apart from that
+    key. Only positive Action and Resource lists can be merged: the union of two
+    NotAction statements is not the statement with the union of the NotActions.
+    """
+    groups: "OrderedDict[Tuple, dict]" = OrderedDict()
+    for statement in statements:
+        if merge_key not in statement or group_key not in statement:
+            groups[("unmergeable", len(groups))] = statement
+            continue
+
+        rest = {k: v for k, v in statement.items() if k != merge_key}
+        key = minify(rest)
+        merged = groups.get(key)
+        if merged is None:
+            groups[key] = statement
+        else:
+            ignore_case = merge_key == "Action"
+            values = collapse(list(merged[merge_key]) + list(statement[merge_key]), ignore_case)
+            merged = OrderedDict(merged)
+            merged[merge_key] = tuple(sorted(values))
+            groups[key] = merged
+    return list(groups.values())
+
+
+def _deduplicate(statements: List[dict]) -> List[dict]:
+    return list(OrderedDict((minify(s), s) for s in statements).values())
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
@@ -0,0 +1,390 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+a compact, binary snapshot of the role inventory, which can be memory-mapped.
+
+A snapshot consists of a header followed by these sections:
+
+- the string table: the offsets of the strings followed by their UTF-8 bytes. Every
+  string in the snapshot is stored once and referred to by its index.
+- the role table: a fixed-size row per role.
+- the principal table: the type and identifier of each trust principal.
+- the attached policy table: the arn of each attached policy.
+- the inline policy table: the name and minified document of each inline policy.
+- the name index: the positions of the roles, sorted by name.
+
+All integers are unsigned, 32 bits and little-endian.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from iam_sudo.principal import Principal
+from iam_sudo.roles import PolicySnapshot, RoleRecord, Roles
+
+MAGIC = b"IAMSUDO\x00"
+FORMAT_VERSION = 1
+
+# the snapshot holds the policies of the roles
+HAS_POLICIES = 0x1
+# the snapshot holds roles of more than one account
+MULTI_ACCOUNT = 0x2
+
+NONE = 0xFFFFFFFF
+
+_header = struct.Struct("<8sIIIIIIId")
+_role = struct.Struct("<12I")
+_pair = struct.Struct("<2I")
+_uint = struct.Struct("<I")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class SnapshotRole(RoleRecord):
+    """
+    a role of a snapshot, which reads its policies from the snapshot if it has them.
+    """
+
+    __slots__ = ("_snapshot", "_position")
+
+    def fetch_policy_snapshot(self) -> PolicySnapshot:
+        snapshot = self._snapshot.policy_snapshot(self._position)
+        if snapshot is None:
+            return super(SnapshotRole, self).fetch_policy_snapshot()
+        return snapshot
+
+
+class Snapshot(object):
+    """
+    a read-only view on a snapshot in `buffer`. Roles and strings are decoded on
+    access, so that opening a memory-mapped snapshot costs next to nothing.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        if len(buffer) < _header.size:
+            raise SnapshotError("not an iam-sudo snapshot")
+        (
+            magic,
+            version,
+            self.flags,
+            n_strings,
+            n_roles,
+            n_principals,
+            n_attached,
+            n_inline,
+            self.created,
+        ) = _header.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise SnapshotError("not an iam-sudo snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"unsupported snapshot version {version}")
+
+        self._n_strings = n_strings
+        self._n_roles = n_roles
+        self._n_principals = n_principals
+        self._n_attached = n_attached
+        self._n_inline = n_inline
+        self._strings = _header.size
+        self._string_data = self._strings + (n_strings + 1) * _uint.size
+        if self._string_data > len(buffer):
+            raise SnapshotError("truncated iam-sudo snapshot")
+        string_data_size = _uint.unpack_from(buffer, self._strings + n_strings * _uint.size)[0]
+        self._string_data_size = string_data_size
+        self._roles = self._string_data + string_data_size
+        self._principals = self._roles + n_roles * _role.size
+        self._attached = self._principals + n_principals * _pair.size
+        self._inline = self._attached + n_attached * _uint.size
+        self._name_index = self._inline + n_inline * _pair.size
+        if self._name_index + n_roles * _uint.size > len(buffer):
+            raise SnapshotError("truncated iam-sudo snapshot")
+
+    @staticmethod
+    def open(path: str) -> "Snapshot":
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _header.size:
+                raise SnapshotError("not an iam-sudo snapshot")
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return Snapshot(buffer)
+        except SnapshotError:
+            buffer.close()
+            raise
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    @property
+    def has_policies(self) -> bool:
+        return bool(self.flags & HAS_POLICIES)
+
+    @property
+    def multi_account(self) -> bool:
+        return bool(self.flags & MULTI_ACCOUNT)
+
+    def __len__(self) -> int:
+        return self._n_roles
+
+    def __iter__(self) -> Iterator[SnapshotRole]:
+        return (self.role(i) for i in range(self._n_roles))
+
+    def string(self, i: int) -> Optional[str]:
+        if i == NONE:
+            return None
+        _check(i, 1, self._n_strings, "string")
+        start, end = _pair.unpack_from(self._buffer, self._strings + i * _uint.size)
+        if not start <= end <= self._string_data_size:
+            raise SnapshotError(f"corrupt iam-sudo snapshot, string {i} out of bounds")
+        try:
+            return self._buffer[
+                self._string_data + start : self._string_data + end
+            ].decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise SnapshotError(f"corrupt iam-sudo snapshot, string {i}: {e}")
+
+    def role(self, position: int) -> SnapshotRole:
+        row = self._row(position)
+        name, arn, path, role_id, create_date, last_used = map(self.string, row[:6])
+        start, count = row[6], row[7]
+        _check(start, count, self._n_principals, "principal")
+        principals = tuple(
+            Principal(self.string(typ), self.string(identifier))
+            for typ, identifier in (
+                _pair.unpack_from(self._buffer, self._principals + i * _pair.size)
+                for i in range(start, start + count)
+            )
+        )
+        result = SnapshotRole(
+            name, arn, path, role_id, principals, (arn, role_id, create_date, last_used)
+        )
+        result._snapshot = self
+        result._position = position
+        return result
+
+    def policy_snapshot(self, position: int) -> Optional[PolicySnapshot]:
+        if not self.has_policies:
+            return None
+        row = self._row(position)
+        attached_start, attached_count, inline_start, inline_count = row[8:]
+        _check(attached_start, attached_count, self._n_attached, "attached policy")
+        _check(inline_start, inline_count, self._n_inline, "inline policy")
+        attached = tuple(
+            self.string(_uint.unpack_from(self._buffer, self._attached + i * _uint.size)[0])
+            for i in range(attached_start, attached_start + attached_count)
+        )
+        inline = {}
+        for i in range(inline_start, inline_start + inline_count):
+            name, document = _pair.unpack_from(self._buffer, self._inline + i * _pair.size)
+            try:
+                inline[self.string(name)] = json.loads(self.string(document))
+            except ValueError as e:
+                raise SnapshotError(f"corrupt iam-sudo snapshot, inline policy {i}: {e}")
+        return PolicySnapshot(attached, MappingProxyType(inline))
+
+    def name(self, position: int) -> str:
+        return self.string(self._row(position)[0])
+
+    def get(self, name: str) -> Roles:
+        """
+        the roles named `name`, found by a binary search of the name index.
+        """
+        names = _NameIndex(self)
+        start = bisect.bisect_left(names, name)
+        end = bisect.bisect_right(names, name, lo=start)
+        return Roles([self.role(names.position(i)) for i in range(start, end)])
+
+    def find(self, name: str, principal: Optional[Principal] = None) -> Roles:
+        """
+        the roles with `name` in their name and with `principal`, if specified, sorted
+        by name.
+        """
+        names = _NameIndex(self)
+        result = Roles()
+        for i in range(len(names)):
+            if name in names[i]:
+                role = self.role(names.position(i))
+                if not principal or principal in role.principals:
+                    result.append(role)
+        return result
+
+    def _row(self, position: int) -> Tuple[int, ...]:
+        if not 0 <= position < self._n_roles:
+            raise IndexError(position)
+        return _role.unpack_from(self._buffer, self._roles + position * _role.size)
+
+
+class _NameIndex(object):
+    """
+    the role names in sorted order, as a sequence for bisect.
+    """
+
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self) -> int:
+        return len(self.snapshot)
+
+    def __getitem__(self, i: int) -> str:
+        return self.snapshot.name(self.position(i))
+
+    def position(self, i: int) -> int:
+        s = self.snapshot
+        position = _uint.unpack_from(s._buffer, s._name_index + i * _uint.size)[0]
+        _check(position, 1, s._n_roles, "role")
+        return position
+
+
+def _check(start: int, count: int, size: int, name: str):
+    """
+    raises a SnapshotError if the `count` entries from `start` are not within a
+    section of `size` entries.
+    """
+    if start + count > size:
+        raise SnapshotError(f"corrupt iam-sudo snapshot, {name} {start} out of bounds")
+
+
+class SnapshotWriter(object):
+    """
+    collects roles and their policies, and writes them as a snapshot.
+    """
+
+    def __init__(self, include_policies: bool = True):
+        self.include_policies = include_policies
+        self._strings: Dict[str, int] = {}
+        self._roles: List[Tuple[int, ...]] = []
+        self._names: List[str] = []
+        self._principals: List[Tuple[int, int]] = []
+        self._attached: List[int] = []
+        self._inline: List[Tuple[int, int]] = []
+        self._accounts = set()
+
+    def __len__(self) -> int:
+        return len(self._roles)
+
+    def add(self, role: RoleRecord, policies: Optional[PolicySnapshot] = None):
+        if self.include_policies and policies is None:
+            raise ValueError(f"the policies of role {role.name} are missing")
+
+        arn, role_id, create_date, last_used = (tuple(role.version) + (None,) * 4)[:4]
+        principals_start = len(self._principals)
+        self._principals.extend(
+            (self._intern(p.typ), self._intern(p.identifier)) for p in role.principals
+        )
+        attached_start, inline_start = len(self._attached), len(self._inline)
+        if policies is not None and self.include_policies:
+            self._attached.extend(self._intern(arn) for arn in policies.attached_policies)
+            self._inline.extend(
+                (self._intern(name), self._intern(json.dumps(doc, separators=(",", ":"))))
+                for name, doc in policies.inline_policies.items()
+            )
+
+        self._roles.append(
+            (
+                self._intern(role.name),
+                self._intern(role.arn),
+                self._intern(role.path),
+                self._intern(role_id),
+                self._intern(create_date),
+                self._intern(last_used),
+                principals_start,
+                len(self._principals) - principals_start,
+                attached_start,
+                len(self._attached) - attached_start,
+                inline_start,
+                len(self._inline) - inline_start,
+            )
+        )
+        self._names.append(role.name)
+        self._accounts.add(role.account)
+
+    def to_bytes(self) -> bytes:
+        strings = sorted(self._strings, key=self._strings.get)
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = [0]
+        for e in encoded:
+            offsets.append(offsets[-1] + len(e))
+
+        flags = (HAS_POLICIES if self.include_policies else 0) | (
+            MULTI_ACCOUNT if len(self._accounts) > 1 else 0
+        )
+        parts = [
+            _header.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                flags,
+                len(strings),
+                len(self._roles),
+                len(self._principals),
+                len(self._attached),
+                len(self._inline),
+                time.time(),
+            ),
+            struct.pack(f"<{len(offsets)}I", *offsets),
+            b"".join(encoded),
+            b"".join(_role.pack(*row) for row in self._roles),
+            b"".join(_pair.pack(*p) for p in self._principals),
+            struct.pack(f"<{len(self._attached)}I", *self._attached),
+            b"".join(_pair.pack(*p) for p in self._inline),
+            struct.pack(
+                f"<{len(self._roles)}I",
+                *sorted(range(len(self._roles)), key=self._names.__getitem__),
+            ),
+        ]
+        return b"".join(parts)
+
+    def write(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.to_bytes())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _intern(self, s: Optional[str]) -> int:
+        if s is None:
+            return NONE
+        i = self._strings.get(s)
+        if i is None:
+            i = self._strings[s] = len(self._strings)
+        return i
+
+
+def write_snapshot(
+    path: str,
+    roles: Iterable[Tuple[RoleRecord, Optional[PolicySnapshot]]],
+    include_policies: bool = True,
+) -> int:
+    """
+    writes the `roles` and their policies as a snapshot to `path`, and returns the
+    number of roles written.
+    """
+    writer = SnapshotWriter(include_policies)
+    for role, policies in roles:
+        writer.add(role, policies)
+    writer.write(path)
+    return len(writer)
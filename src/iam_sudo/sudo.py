@@ -16,29 +16,62 @@
 import datetime
 import json
 import logging
-from typing import Optional
-import botocore
-
-import boto3
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional, Union
 
+from iam_sudo.cache import SingleFlight
+from iam_sudo.clients import client
 from iam_sudo.credentials import Credentials
 from iam_sudo.principal import Principal
-from iam_sudo.roles import Role
+from iam_sudo.identity import caller_identity
+from iam_sudo.inventory import inventory
+from iam_sudo.metrics import metrics
+from iam_sudo.roles import Role, RoleRecord, RoleScope
+from iam_sudo.session_policy import SessionPolicy
 from iam_sudo.sudo_policy import Policy
 
-sts = boto3.client("sts")
-
 
 class AssumeRoleError(Exception):
     def __init__(self, e):
         super(AssumeRoleError, self).__init__(e)
 
 
-def find_role(name: str, principal: Optional[Principal]) -> Role:
-    roles = Role.get_all().filter_by_substring_of_name(name)
-    if principal:
-        roles = roles.filter_by_principal(principal)
+_searches = SingleFlight()
+_simulations = SingleFlight()
+
 
+def find_role(
+    name: str, principal: Optional[Principal], scope: Optional[RoleScope] = None
+) -> RoleRecord:
+    """
+    the role within `scope` matching `name` and `principal`. Concurrent identical
+    searches share a single search.
+    """
+    return _searches.do(
+        (name, principal, scope), partial(_find_role, name, principal, scope)
+    )
+
+
+def _find_role(
+    name: str, principal: Optional[Principal], scope: Optional[RoleScope]
+) -> RoleRecord:
+    """
+    the role within `scope` matching `name` and `principal`. Role names are unique
+    within an account, so a search of a single account stops at the role named
+    `name`. Otherwise, only the first two candidates are kept to decide between a
+    single match and an ambiguous one.
+    """
+    exact, candidates = [], []
+    for role in inventory.query(name, principal, scope):
+        matches = exact if role.name == name else candidates
+        if len(matches) < 2:
+            matches.append(role)
+        if exact and not inventory.multi_account:
+            break
+
+    roles = exact if exact else candidates
     if len(roles) == 1:
         return roles[0]
 
@@ -46,21 +79,18 @@ def find_role(name: str, principal: Optional[Principal]) -> Role:
         f"matching name {name} and principal" if principal else f"matching name {name}"
     )
     if roles:
-        r = list(filter(lambda r: r.name == name, roles))
-        if len(r) == 1:
-            return r[0]
-
         raise AssumeRoleError(f"found multiple roles {msg}")
     else:
         raise AssumeRoleError(f"no roles {msg}")
 
 
-def resolve_base_role(role_name: str) -> str:
+def resolve_base_role(role_name: str, account: Optional[str] = None) -> str:
     if role_name.startswith("arn:"):
         return role_name
 
-    r = sts.get_caller_identity()
-    return f"arn:aws:iam::{r['Account']}:role/{role_name}"
+    if not account:
+        account = caller_identity.account()
+    return f"arn:aws:iam::{account}:role/{role_name}"
 
 
 def convert_timestamp(v):
@@ -76,7 +106,7 @@ def real_assume_role(role_name: str):
     session_name = "iam-sudo-{role.name}"
 
     try:
-        result = sts.assume_role(
+        result = client("sts").assume_role(
             RoleArn=role.arn,
             RoleSessionName=session_name[:60],
             DurationSeconds=3600,
@@ -88,72 +118,168 @@ def real_assume_role(role_name: str):
 
 
 def simulate_assume_role(base_role: str, role_name: str, principal: str) -> Credentials:
+    """
+    the credentials of the base role, limited to the policies of the role `role_name`.
+    Concurrent identical simulations share a single simulation and its credentials.
+    """
+    return _simulations.do(
+        (base_role, role_name, principal),
+        partial(_simulate_assume_role, base_role, role_name, principal),
+    )
+
+
+def _simulate_assume_role(base_role: str, role_name: str, principal: str) -> Credentials:
 
     policy = Policy.get_default()
 
-    base_role = resolve_base_role(base_role)
-    if not policy.is_allowed_base_role(base_role):
-        raise AssumeRoleError(f"Policy does not allow the base role {base_role}")
+    def check_base_role(base_role_arn: str) -> str:
+        if not policy.is_allowed_base_role(base_role_arn):
+            raise AssumeRoleError(f"Policy does not allow the base role {base_role_arn}")
+        return base_role_arn
+
+    # across accounts, the base role is taken from the account of the simulated role
+    base_role_arn = None
+    if base_role.startswith("arn:") or not inventory.multi_account:
+        with metrics.timer("resolve_base_role"):
+            base_role_arn = check_base_role(resolve_base_role(base_role))
 
-    if not policy.is_allowed_role_name(role_name):
-        raise AssumeRoleError(f"Policy does not allow the role {role_name}")
+    with metrics.timer("policy_check"):
+        if not policy.is_allowed_role_name(role_name):
+            raise AssumeRoleError(f"Policy does not allow the role {role_name}")
 
-    p = Principal.create_from_string(principal) if principal else None
-    if p and not policy.is_allowed_principal(p):
-        raise AssumeRoleError(f"Policy does not allow a role for principal {p}")
+        p = Principal.create_from_string(principal) if principal else None
+        if p and not policy.is_allowed_principal(p):
+            raise AssumeRoleError(f"Policy does not allow a role for principal {p}")
 
-    role = find_role(role_name, p)
+    with metrics.timer("find_role"):
+        role = find_role(role_name, p, policy.role_scope())
 
-    if not policy.is_allowed_role(role):
-        raise AssumeRoleError(f"Policy does not allow to assume the role {role.name}")
+    with metrics.timer("policy_check"):
+        if not policy.is_allowed_role(role):
+            raise AssumeRoleError(f"Policy does not allow to assume the role {role.name}")
+
+    if not base_role_arn:
+        with metrics.timer("resolve_base_role"):
+            base_role_arn = check_base_role(resolve_base_role(base_role, role.account))
 
     session_name = f"iam-sudo-{role_name}"
     kwargs = {
-        "RoleArn": base_role,
+        "RoleArn": base_role_arn,
         "RoleSessionName": session_name[:60],
         "DurationSeconds": 3600,
     }
 
-    policy_length = 0
-    if role.attached_policies:
-        kwargs["PolicyArns"] = [{"arn": arn} for arn in role.attached_policies]
-        policy_length = sum([len(a["arn"]) for arn in kwargs["PolicyArns"]])
+    with metrics.timer("policy_fetch"):
+        snapshot = role.get_policy_snapshot()
 
-    if role.inline_policies:
-        kwargs["Policy"] = json.dumps(role.merged_inlined_policy)
-        policy_length += len(kwargs["Policy"])
+    with metrics.timer("session_policy"):
+        session_policy = SessionPolicy.create(snapshot)
+        problems = session_policy.problems()
+    if problems:
+        raise AssumeRoleError(
+            f"the policies of role {role.name} cannot be passed as session policy, "
+            + "; ".join(problems)
+        )
+    kwargs.update(session_policy.assume_role_kwargs())
 
     try:
-        logging.info("combined policy length: %s", policy_length)
-        if policy_length > 2048:
-            logging.info("combined policy length > 2048")
-
-        result = sts.assume_role(**kwargs)
+        logging.info("combined policy length: %s", session_policy.size)
+        with metrics.timer("assume_role"):
+            result = client("sts").assume_role(**kwargs)
     except Exception as e:
         raise AssumeRoleError(e)
 
+    logging.info("packed policy size: %s%%", result.get("PackedPolicySize"))
     return Credentials(result["Credentials"])
 
 
+def simulate_assume_roles(
+    requests: List[dict], max_workers: int = None
+) -> List[Union[Credentials, AssumeRoleError]]:
+    """
+    simulates the roles of `requests` concurrently. Each request is a dictionary with
+    the `base_role`, `role_name` and `principal`. The credentials or the error of
+    each request is returned in the order of the requests.
+    """
+
+    def simulate(request: dict) -> Union[Credentials, AssumeRoleError]:
+        try:
+            return simulate_assume_role(
+                request["base_role"], request["role_name"], request.get("principal")
+            )
+        except AssumeRoleError as e:
+            return e
+        except Exception as e:
+            logging.exception("failed to simulate role %s", request.get("role_name"))
+            return AssumeRoleError(e)
+
+    if not max_workers:
+        max_workers = int(os.getenv("IAM_SUDO_BATCH_WORKERS", "8"))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(simulate, requests))
+
 
 def remote_assume_role(
     role_name: str, base_role: str, principal: str
 ) -> Credentials:
 
+    reply = _invoke(_remote_request(role_name, base_role, principal))
+    return Credentials(reply)
+
+
+def remote_assume_roles(
+    requests: List[dict],
+) -> List[Union[Credentials, AssumeRoleError]]:
+    """
+    simulates the roles of `requests` in a single invocation of the Lambda. Each
+    request is a dictionary with the `role_name` and optionally the `base_role` and
+    `principal`. The credentials or the error of each request is returned in the
+    order of the requests.
+    """
+    reply = _invoke(
+        {
+            "requests": [
+                _remote_request(r["role_name"], r.get("base_role"), r.get("principal"))
+                for r in requests
+            ]
+        }
+    )
+
+    results = reply.get("results", [])
+    if len(results) != len(requests):
+        raise AssumeRoleError(
+            f"expected {len(requests)} results from lambda, got {len(results)}"
+        )
+
+    return [
+        Credentials(r["credentials"])
+        if "credentials" in r
+        else AssumeRoleError(r.get("error", "unknown error"))
+        for r in results
+    ]
+
+
+def _remote_request(role_name: str, base_role: str, principal: str) -> dict:
     request = {"role_name": role_name}
     if principal:
         request["principal"] = principal
     if base_role:
         request["base_role"] = base_role
+    return request
+
+
+def _invoke(request: dict) -> dict:
+    from botocore.exceptions import ClientError
 
-    client = boto3.client("lambda")
     try:
-        response = client.invoke(
-            FunctionName="iam-sudo",
-            InvocationType="RequestResponse",
-            Payload=json.dumps(request).encode("utf-8"),
-        )
-    except botocore.exceptions.ClientError as e:
+        with metrics.timer("invoke"):
+            response = client("lambda").invoke(
+                FunctionName="iam-sudo",
+                InvocationType="RequestResponse",
+                Payload=json.dumps(request).encode("utf-8"),
+            )
+    except ClientError as e:
         raise AssumeRoleError(f"{e}")
 
     reply = {}
@@ -169,4 +295,4 @@ def remote_assume_role(
         )
         raise AssumeRoleError(f"{error_message}")
 
-    return Credentials(reply)
+    return reply
@@ -13,17 +13,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import hashlib
+import json
 import os
-from fnmatch import fnmatch
+import re
 from io import StringIO
-from re import fullmatch
-from typing import List
-
-import jsonschema
-from ruamel.yaml import YAML
+from typing import Iterable, Iterator, List, Optional
 
 import iam_sudo.principal as iam_principal
-from iam_sudo.roles import Role, Roles
+from iam_sudo.matcher import GlobMatcher, PrincipalMatcher, has_magic, literal_prefix
+from iam_sudo.roles import Role, Roles, RoleScope
+
+role_arn_pattern = re.compile(r"arn:aws:iam:[^:]*:[0-9]+:role/.*")
+
+ARTIFACT_FORMAT = "iam-sudo-policy"
+# version 2 added allowed-role-paths
+ARTIFACT_VERSION = 2
 
 schema = {
     "type": "object",
@@ -44,6 +49,12 @@ schema = {
             "type": "array",
             "items": {"type": "string"},
         },
+        "allowed-role-paths": {
+            "description": "path prefixes of allowed roles, default /",
+            "type": "array",
+            "items": {"type": "string", "pattern": "^/"},
+            "minItems": 1,
+        },
     },
 }
 
@@ -53,53 +64,185 @@ class Policy(object):
         self.allowed_role_names: List[str] = []
         self.allowed_principals: List[iam_principal.Principal] = []
         self.allowed_base_roles: List[str] = []
+        self.allowed_role_paths: List[str] = ["/"]
+
+    @property
+    def allowed_role_names(self) -> List[str]:
+        return self._allowed_role_names
+
+    @allowed_role_names.setter
+    def allowed_role_names(self, patterns: List[str]):
+        self._allowed_role_names = patterns
+        self._role_name_matcher = GlobMatcher(patterns)
+
+    @property
+    def allowed_principals(self) -> List[iam_principal.Principal]:
+        return self._allowed_principals
+
+    @allowed_principals.setter
+    def allowed_principals(self, principals: List[iam_principal.Principal]):
+        self._allowed_principals = principals
+        self._principal_matcher = PrincipalMatcher(principals)
+
+    @property
+    def allowed_base_roles(self) -> List[str]:
+        return self._allowed_base_roles
+
+    @allowed_base_roles.setter
+    def allowed_base_roles(self, patterns: List[str]):
+        self._allowed_base_roles = patterns
+        self._base_role_matcher = GlobMatcher(patterns)
 
     @staticmethod
     def load(doc: str) -> "Policy":
+        artifact = _parse_artifact(doc)
+        if artifact is not None:
+            return Policy.load_artifact(artifact)
+
+        import jsonschema
+        from ruamel.yaml import YAML
+
         yaml = YAML()
         policy = yaml.load(doc)
         jsonschema.validate(policy, schema)
 
         result = Policy()
-        result.allowed_role_names = policy["allowed-role-names"]
-        result.allowed_base_roles = policy["allowed-base-roles"]
-        for principal in policy["allowed-principals"]:
-            for typ, identifier in principal.items():
-                result.allowed_principals.append(
-                    iam_principal.Principal(typ, identifier)
-                )
+        result.allowed_role_names = list(policy["allowed-role-names"])
+        result.allowed_base_roles = list(policy["allowed-base-roles"])
+        result.allowed_role_paths = list(policy.get("allowed-role-paths", ["/"]))
+        result.allowed_principals = [
+            iam_principal.Principal(typ, identifier)
+            for principal in policy["allowed-principals"]
+            for typ, identifier in principal.items()
+        ]
+        return result
+
+    @staticmethod
+    def load_artifact(artifact: dict) -> "Policy":
+        """
+        loads a policy compiled by `to_artifact`, without YAML parsing, schema
+        validation or pattern compilation.
+        """
+        if artifact.get("format") != ARTIFACT_FORMAT:
+            raise ValueError("document is not a compiled iam-sudo policy")
+        known_keys = _artifact_keys.get(artifact.get("version"))
+        if known_keys is None:
+            raise ValueError(
+                f"unsupported compiled policy version {artifact.get('version')}"
+            )
+        body = {k: v for k, v in artifact.items() if k not in _artifact_header}
+        unknown_keys = set(body) - known_keys
+        if unknown_keys:
+            raise ValueError(
+                f"compiled policy has unknown fields {', '.join(sorted(unknown_keys))}"
+            )
+        if _content_hash(body) != artifact.get("sha256"):
+            raise ValueError("compiled policy does not match its sha256 hash")
+
+        result = Policy()
+        result._allowed_role_names = body["allowed-role-names"]
+        result._allowed_base_roles = body["allowed-base-roles"]
+        result.allowed_role_paths = body.get("allowed-role-paths", ["/"])
+        result._allowed_principals = [
+            iam_principal.Principal(typ, identifier)
+            for principal in body["allowed-principals"]
+            for typ, identifier in principal.items()
+        ]
+        matchers = body["matchers"]
+        result._role_name_matcher = GlobMatcher.from_dict(matchers["role-names"])
+        result._principal_matcher = PrincipalMatcher.from_dict(matchers["principals"])
+        result._base_role_matcher = GlobMatcher.from_dict(matchers["base-roles"])
         return result
 
+    def to_artifact(self) -> dict:
+        """
+        the policy with its patterns sorted and compiled, stamped with the format
+        version and the sha256 hash of the content.
+        """
+        body = self._artifact_body()
+        return {
+            "format": ARTIFACT_FORMAT,
+            "version": ARTIFACT_VERSION,
+            "sha256": _content_hash(body),
+            **body,
+        }
+
+    @property
+    def content_hash(self) -> str:
+        return _content_hash(self._artifact_body())
+
+    def _artifact_body(self) -> dict:
+        principals = sorted(set((p.typ, p.identifier) for p in self.allowed_principals))
+        body = {
+            "allowed-role-names": sorted(set(self.allowed_role_names)),
+            "allowed-principals": [{typ: identifier} for typ, identifier in principals],
+            "allowed-base-roles": sorted(set(self.allowed_base_roles)),
+            "matchers": {
+                "role-names": self._role_name_matcher.to_dict(),
+                "principals": self._principal_matcher.to_dict(),
+                "base-roles": self._base_role_matcher.to_dict(),
+            },
+        }
+        if self.allowed_role_paths != ["/"]:
+            body["allowed-role-paths"] = sorted(set(self.allowed_role_paths))
+        return body
+
     def is_allowed_role_name(self, role_name: str) -> bool:
-        for allowed in self.allowed_role_names:
-            if allowed == role_name or fnmatch(role_name, allowed):
-                return True
-        return False
+        return self._role_name_matcher.matches(role_name)
 
     def is_allowed_principal(self, principal: iam_principal.Principal) -> bool:
-        for allowed in self.allowed_principals:
-            if fnmatch(principal.typ, allowed.typ) and fnmatch(
-                principal.identifier, allowed.identifier
-            ):
-                return True
-        return False
+        return self._principal_matcher.matches(principal)
+
+    def is_allowed_role_path(self, path: str) -> bool:
+        return any(path.startswith(p) for p in self.allowed_role_paths)
+
+    def role_scope(self) -> RoleScope:
+        """
+        the narrowest search for roles allowed by this policy: the path prefixes
+        which are not within another one, the literal prefix shared by all allowed
+        role names and, when none of them has a wildcard, the names themselves.
+        """
+        paths = set(self.allowed_role_paths)
+        names = self.allowed_role_names
+        return RoleScope(
+            tuple(
+                sorted(
+                    p for p in paths if not any(p != q and p.startswith(q) for q in paths)
+                )
+            ),
+            os.path.commonprefix([literal_prefix(n) for n in names]) if names else "",
+            None if any(has_magic(n) for n in names) else frozenset(names),
+        )
 
     def is_allowed_base_role(self, base_role: str) -> bool:
-        if not fullmatch(r"arn:aws:iam:[^:]*:[0-9]+:role/.*", base_role):
+        if not role_arn_pattern.fullmatch(base_role):
             return False
 
-        for allowed in self.allowed_base_roles:
-            if fnmatch(base_role, allowed):
-                return True
-        return False
+        return self._base_role_matcher.matches(base_role)
+
+    def allowed_roles(self, roles: Iterable[Role]) -> Roles:
+        return Roles(list(self.iter_allowed_roles(roles)))
+
+    def iter_allowed_roles(self, roles: Iterable[Role]) -> Iterator[Role]:
+        """
+        lazily filters the allowed roles from `roles`, so that a stream of roles can be
+        evaluated without holding all of them in memory.
+        """
+        return filter(self.is_allowed_role, roles)
 
-    def allowed_roles(self, roles: Roles) -> Roles:
-        return Roles(list(filter(lambda r: self.is_allowed_role(r), roles)))
+    def allowed_principals_of(self, role: Role) -> List[iam_principal.Principal]:
+        """
+        the principals of `role` for which it may be simulated.
+        """
+        return [p for p in role.principals if self.is_allowed_principal(p)]
 
     def is_allowed_role(self, role: Role) -> bool:
         if not self.is_allowed_role_name(role.name):
             return False
 
+        if not self.is_allowed_role_path(role.path):
+            return False
+
         if not next(
             filter(lambda p: self.is_allowed_principal(p), role.principals), None
         ):
@@ -118,6 +261,10 @@ class Policy(object):
         out.write(f"allowed-base-roles:\n")
         for a in self.allowed_base_roles:
             out.write(f"  - {a}\n")
+        if self.allowed_role_paths != ["/"]:
+            out.write(f"allowed-role-paths:\n")
+            for a in self.allowed_role_paths:
+                out.write(f"  - {a}\n")
         return out.getvalue()
 
     @staticmethod
@@ -125,19 +272,60 @@ class Policy(object):
         return _load_default_policy()
 
 
-_policy: Policy = None
+_artifact_header = ("format", "version", "sha256")
+
+# the fields of the body of a compiled policy, per supported version
+_artifact_keys = {
+    1: frozenset(
+        ["allowed-role-names", "allowed-principals", "allowed-base-roles", "matchers"]
+    ),
+    2: frozenset(
+        [
+            "allowed-role-names",
+            "allowed-principals",
+            "allowed-base-roles",
+            "allowed-role-paths",
+            "matchers",
+        ]
+    ),
+}
+
+
+def _parse_artifact(doc: str) -> Optional[dict]:
+    if not doc.lstrip().startswith("{"):
+        return None
+    try:
+        artifact = json.loads(doc)
+    except ValueError:
+        return None
+    if isinstance(artifact, dict) and artifact.get("format") == ARTIFACT_FORMAT:
+        return artifact
+    return None
+
+
+def _content_hash(body: dict) -> str:
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+_provider = None
 
 
 def _load_default_policy():
-    global _policy
+    global _provider
+
+    if not _provider:
+        from iam_sudo.policy_source import PolicyProvider, policy_source_from_url
 
-    if not _policy:
-        _policy = Policy.load(_default_policy_document())
+        _provider = PolicyProvider(
+            policy_source_from_url(os.getenv("IAM_SUDO_POLICY_SOURCE")),
+            ttl=float(os.getenv("IAM_SUDO_POLICY_TTL", "60")),
+        )
 
-    return _policy
+    return _provider.get()
 
 
-def _default_policy_document() -> str:
+def default_policy_document() -> str:
     return os.getenv(
         "IAM_SUDO_POLICY",
         """
@@ -0,0 +1,131 @@
+#
+# Copyright 2021 - binx.io B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import datetime
+import logging
+import os
+import subprocess
+import sys
+import threading
+from typing import Callable, Dict, List
+
+from iam_sudo.credentials import Credentials
+from iam_sudo.server import CredentialProvider, CredentialServer
+
+# the credential sources which botocore prefers over the credential endpoint
+_credential_variables = [
+    "AWS_ACCESS_KEY_ID",
+    "AWS_SECRET_ACCESS_KEY",
+    "AWS_SESSION_TOKEN",
+    "AWS_SECURITY_TOKEN",
+    "AWS_PROFILE",
+    "AWS_DEFAULT_PROFILE",
+    "AWS_CONTAINER_CREDENTIALS_RELATIVE_URI",
+    "AWS_CONTAINER_CREDENTIALS_FULL_URI",
+    "AWS_CONTAINER_AUTHORIZATION_TOKEN",
+    "AWS_CONTAINER_AUTHORIZATION_TOKEN_FILE",
+    "AWS_WEB_IDENTITY_TOKEN_FILE",
+    "AWS_ROLE_ARN",
+    "AWS_ROLE_SESSION_NAME",
+]
+
+
+class CredentialRefresher(threading.Thread):
+    """
+    renews the credentials of `role_name` in `provider` before they expire, so that
+    they are always ready to be served.
+    """
+
+    def __init__(self, provider: CredentialProvider, role_name: str, retry: int = 30):
+        super(CredentialRefresher, self).__init__(name="iam-sudo-refresh", daemon=True)
+        self.provider = provider
+        self.role_name = role_name
+        self.retry = retry
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                credentials = self.provider.get(self.role_name)
+                now = datetime.datetime.now(datetime.timezone.utc)
+                wait = (credentials.expires_at - now).total_seconds() - self.provider.margin
+            except Exception as e:
+                logging.warning("failed to refresh credentials, %s", e)
+                wait = self.retry
+            self._stopped.wait(max(wait, 1))
+
+    def stop(self):
+        self._stopped.set()
+
+
+def run_with_refresh(
+    role_name: str,
+    cmd: List[str],
+    fetch: Callable[[], Credentials],
+    margin: int = 300,
+    credentials: Credentials = None,
+) -> subprocess.CompletedProcess:
+    """
+    runs `cmd` with credentials served from a local credential endpoint, which renews
+    them with `fetch` before they expire. This allows `cmd` to run longer than the
+    lifetime of a single set of credentials.
+    """
+    provider = CredentialProvider(lambda *args: fetch(), margin=margin)
+    if credentials:
+        provider.put(credentials, role_name)
+    provider.get(role_name)
+
+    server = CredentialServer(provider)
+    server.start()
+    refresher = CredentialRefresher(provider, role_name)
+    refresher.start()
+    try:
+        return subprocess.run(
+            args=cmd,
+            env=refreshable_env(server.environment(role_name)),
+            text=False,
+            shell=False,
+            stdin=sys.stdin,
+            stdout=sys.stdout,
+            stderr=sys.stderr,
+        )
+    finally:
+        refresher.stop()
+        server.shutdown()
+        server.server_close()
+
+
+def refreshable_env(endpoint: Dict[str, str]) -> Dict[str, str]:
+    """
+    the environment of the current process, in which all other credential sources
+    are replaced by the credential `endpoint`, as those would take precedence over
+    it: static credentials, profiles, container and web identity credentials, and
+    the shared credentials and config files. The region is passed explicitly, as
+    the config file is no longer read.
+    """
+    from iam_sudo.clients import session
+
+    region = os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION")
+    if not region:
+        region = session().region_name
+
+    env = {k: v for k, v in os.environ.items() if k not in _credential_variables}
+    env["AWS_SHARED_CREDENTIALS_FILE"] = os.devnull
+    env["AWS_CONFIG_FILE"] = os.devnull
+    if region:
+        env.setdefault("AWS_REGION", region)
+        env.setdefault("AWS_DEFAULT_REGION", region)
+    env.update(endpoint)
+    return env
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+import iam_sudo.sudo
+from iam_sudo import aio
+from iam_sudo.credentials import Credentials
+from iam_sudo.sudo import AssumeRoleError
+
+
+def test_simulate_assume_role_fan_out(monkeypatch):
+    threads = set()
+
+    def simulate_assume_role(base_role: str, role_name: str, principal: str):
+        threads.add(threading.current_thread().name)
+        if role_name == "missing":
+            raise AssumeRoleError("no roles matching name missing")
+        return Credentials(
+            {
+                "AccessKeyId": role_name,
+                "SecretAccessKey": base_role,
+                "SessionToken": "token",
+                "Expiration": "2021-02-27T10:00:00+00:00",
+            }
+        )
+
+    monkeypatch.setattr(iam_sudo.sudo, "simulate_assume_role", simulate_assume_role)
+
+    async def simulate_all():
+        return await asyncio.gather(
+            *[
+                aio.simulate_assume_role("IAMSudoUser", f"role-{i}", None)
+                for i in range(100)
+            ],
+            aio.simulate_assume_role("IAMSudoUser", "missing", None),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(simulate_all())
+    assert [r.aws_access_key_id for r in results[:100]] == [
+        f"role-{i}" for i in range(100)
+    ]
+    assert isinstance(results[100], AssumeRoleError)
+    assert all(name.startswith("iam-sudo-aio") for name in threads)
@@ -0,0 +1,75 @@
+import threading
+import time
+
+from iam_sudo.cache import SingleFlight, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    cache.discard_if(lambda k: k == "a")
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+
+def test_ttl_cache_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("iam_sudo.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(ttl=10)
+    cache.put("a", 1)
+    now[0] += 9
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+
+    cache = TTLCache(ttl=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("key", fn)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len(results) == 8 and all(r is results[0] for r in results)
+    assert flight.do("key", lambda: "again") == "again"
+
+
+def test_single_flight_forgets_failed_calls():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("failed")
+
+    try:
+        flight.do("key", fail)
+        assert False, "expected an exception"
+    except ValueError:
+        pass
+    assert not flight._calls
@@ -0,0 +1,52 @@
+import iam_sudo.clients
+from iam_sudo.clients import RateLimiter
+
+
+def test_rate_limiter(monkeypatch):
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr("iam_sudo.clients.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("iam_sudo.clients.time.sleep", sleep)
+
+    limiter = RateLimiter(rate=10, burst=2)
+    limiter.acquire()
+    limiter.acquire()
+    assert not sleeps
+
+    limiter.acquire()
+    limiter.acquire()
+    assert sleeps == [0.1, 0.1]
+
+    now[0] += 1.0
+    limiter.acquire()
+    assert len(sleeps) == 2
+
+
+def test_iam_client_is_tuned_and_rate_limited(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-central-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    monkeypatch.setenv("IAM_SUDO_MAX_POOL_CONNECTIONS", "64")
+    monkeypatch.setattr(iam_sudo.clients, "_clients", {})
+    monkeypatch.setattr(iam_sudo.clients, "_session", None)
+
+    calls = []
+    monkeypatch.setattr(RateLimiter, "before_call", lambda self, **kwargs: calls.append(kwargs))
+
+    iam = iam_sudo.clients.client("iam")
+    assert iam.meta.config.max_pool_connections == 64
+    assert iam.meta.config.retries["mode"] == "adaptive"
+    assert iam.meta.config.tcp_keepalive
+
+    iam.meta.events.emit(
+        "before-call.iam.ListRoles",
+        model=iam.meta.service_model.operation_model("ListRoles"),
+        params={"headers": {}, "body": {}},
+        context={},
+    )
+    assert len(calls) == 1
@@ -0,0 +1,142 @@
+import base64
+import datetime
+import os
+
+import pytest
+
+import iam_sudo.credential_cache
+from iam_sudo.credential_cache import CredentialCache, cache_key
+from iam_sudo.credentials import Credentials
+
+
+class FakeFernet(object):
+    """
+    stands in for cryptography's Fernet, which is an optional dependency.
+    """
+
+    def __init__(self, key: bytes):
+        self.key = base64.urlsafe_b64decode(key)
+
+    def encrypt(self, data: bytes) -> bytes:
+        return base64.b64encode(
+            bytes(b ^ self.key[i % len(self.key)] for i, b in enumerate(data))
+        )
+
+    def decrypt(self, data: bytes) -> bytes:
+        data = base64.b64decode(data)
+        return bytes(b ^ self.key[i % len(self.key)] for i, b in enumerate(data))
+
+    @staticmethod
+    def generate_key() -> bytes:
+        return base64.urlsafe_b64encode(os.urandom(32))
+
+
+@pytest.fixture
+def encrypted(monkeypatch):
+    monkeypatch.setattr(iam_sudo.credential_cache, "Fernet", FakeFernet)
+    monkeypatch.setenv("IAM_SUDO_CACHE_KEY", "passphrase")
+
+
+def credentials(seconds: int) -> Credentials:
+    return Credentials(
+        {
+            "AccessKeyId": "ASIA",
+            "SecretAccessKey": "secret",
+            "SessionToken": "token",
+            "Expiration": datetime.datetime.now(datetime.timezone.utc)
+            + datetime.timedelta(seconds=seconds),
+        }
+    )
+
+
+def test_reuse_until_near_expiry(tmp_path, encrypted):
+    fetched = []
+
+    def fetch(seconds: int):
+        fetched.append(1)
+        return credentials(seconds)
+
+    cache = CredentialCache(str(tmp_path), margin=300)
+    key = cache_key(mode="simulate", role_name="TaskRole")
+    assert cache.get(key, lambda: fetch(3600)).aws_session_token == "token"
+    assert cache.get(key, lambda: fetch(3600)).aws_session_token == "token"
+    assert len(fetched) == 1
+
+    other = cache_key(mode="simulate", role_name="OtherRole")
+    cache.get(other, lambda: fetch(200))
+    cache.get(other, lambda: fetch(200))
+    assert len(fetched) == 3
+
+
+def test_cache_key():
+    assert cache_key(a=1, b=None) == cache_key(b=None, a=1)
+    assert cache_key(a=1, b=None) != cache_key(a=1, b="x")
+
+
+def test_expiration_formats():
+    c = credentials(60)
+    assert not c.expires_within(30)
+    assert c.expires_within(90)
+
+    c.credentials["Expiration"] = "2021-02-27T10:00:00+00:00"
+    assert c.expires_within(0)
+    c.credentials["Expiration"] = "2021-02-27T10:00:00Z"
+    assert c.expires_at.tzinfo is not None
+
+
+def test_no_secrets_on_disk(tmp_path, encrypted):
+    cache = CredentialCache(str(tmp_path))
+    cache.get(cache_key(role_name="TaskRole"), lambda: credentials(3600))
+
+    files = [p for p in tmp_path.rglob("*") if p.is_file()]
+    assert files and not any(p.name == ".key" for p in files)
+    for p in files:
+        content = p.read_bytes()
+        assert b"secret" not in content and b"token" not in content and b"ASIA" not in content
+
+
+def test_not_cached_without_encryption(tmp_path, monkeypatch):
+    monkeypatch.setattr(iam_sudo.credential_cache, "Fernet", None)
+    fetched = []
+
+    def fetch():
+        fetched.append(1)
+        return credentials(3600)
+
+    cache = CredentialCache(str(tmp_path))
+    cache.get(cache_key(role_name="TaskRole"), fetch)
+    cache.get(cache_key(role_name="TaskRole"), fetch)
+    assert len(fetched) == 2
+    assert not list(tmp_path.rglob("*"))
+
+
+def test_cache_is_optional_without_encryption(tmp_path, monkeypatch, caplog):
+    import iam_sudo.__main__
+
+    monkeypatch.setattr(iam_sudo.credential_cache, "Fernet", None)
+    monkeypatch.setattr(iam_sudo.__main__, "credential_cache", CredentialCache(str(tmp_path)))
+    fetch = lambda: credentials(3600)
+
+    assert iam_sudo.__main__._cached(None, fetch, role_name="TaskRole") is fetch
+    assert "WARNING" not in caplog.text
+    assert iam_sudo.__main__._cached(True, fetch, role_name="TaskRole") is fetch
+    assert "credential cache disabled" in caplog.text
+
+
+def test_real_encryption(tmp_path, monkeypatch):
+    fernet = pytest.importorskip("cryptography.fernet")
+    monkeypatch.setattr(iam_sudo.credential_cache, "Fernet", fernet.Fernet)
+    monkeypatch.setenv("IAM_SUDO_CACHE_KEY", "passphrase")
+    fetched = []
+
+    def fetch():
+        fetched.append(1)
+        return credentials(3600)
+
+    cache = CredentialCache(str(tmp_path))
+    assert cache.available()
+    key = cache_key(role_name="TaskRole")
+    assert cache.get(key, fetch).aws_secret_access_key == "secret"
+    assert cache.get(key, fetch).aws_secret_access_key == "secret"
+    assert len(fetched) == 1
+    assert b"secret" not in (tmp_path / key).read_bytes()
@@ -0,0 +1,231 @@
+import json
+from os import path
+from urllib.parse import quote
+
+import iam_sudo.clients
+import iam_sudo.events
+from iam_sudo.cache import TTLCache
+from iam_sudo.events import (
+    ChangeFollower,
+    ChangeLog,
+    InventoryUpdater,
+    apply_events,
+    follow_changes,
+    is_event,
+    iter_changes,
+)
+from iam_sudo.inventory import RoleInventory
+from iam_sudo.principal import Principal
+from iam_sudo.roles import Role, Roles
+
+
+def load_roles(account=None, scope=None) -> Roles:
+    return Roles.load_from_file(path.join(path.dirname(__file__), "roles.json"))
+
+
+def cloudtrail_record(event_name: str, role_name: str, **kwargs) -> dict:
+    record = {
+        "eventSource": "iam.amazonaws.com",
+        "eventName": event_name,
+        "recipientAccountId": "123456789012",
+        "requestParameters": {"roleName": role_name},
+    }
+    record.update(kwargs)
+    return record
+
+
+def created_role(role_name: str) -> dict:
+    trust = {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Principal": {"Service": "ecs-tasks.amazonaws.com"},
+                "Action": "sts:AssumeRole",
+            }
+        ],
+    }
+    return cloudtrail_record(
+        "CreateRole",
+        role_name,
+        responseElements={
+            "role": {
+                "path": "/",
+                "roleName": role_name,
+                "roleId": "AROANEWROLE",
+                "arn": f"arn:aws:iam::123456789012:role/{role_name}",
+                "createDate": "Feb 27, 2021 10:00:00 AM",
+                "assumeRolePolicyDocument": quote(json.dumps(trust)),
+            }
+        },
+    )
+
+
+def fake_iam(monkeypatch) -> dict:
+    """
+    the roles in the fake IAM, by name, read by get_by_role_name.
+    """
+    roles = {r.name: r for r in load_roles()}
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(load_roles))
+    monkeypatch.setattr(
+        Role, "get_by_role_name", staticmethod(lambda name, account=None: roles.get(name))
+    )
+    return roles
+
+
+def test_iter_changes_of_event_shapes():
+    event = {
+        "detail-type": "AWS API Call via CloudTrail",
+        "source": "aws.iam",
+        "account": "123456789012",
+        "detail": cloudtrail_record("PutRolePolicy", "TaskRole"),
+    }
+    log = {
+        "Records": [
+            cloudtrail_record("DeleteRole", "OldRole"),
+            cloudtrail_record("DeleteRole", "Denied", errorCode="AccessDenied"),
+            cloudtrail_record("TagRole", "TaskRole"),
+        ]
+    }
+    messages = {"Records": [{"body": json.dumps(event)}, {"body": json.dumps(log)}]}
+
+    assert is_event(event) and is_event(log) and not is_event({"role_name": "TaskRole"})
+    assert [(c.event_name, c.account, c.role_name) for c in iter_changes(messages)] == [
+        ("PutRolePolicy", "123456789012", "TaskRole"),
+        ("DeleteRole", "123456789012", "OldRole"),
+    ]
+    assert list(iter_changes(created_role("NewRole"))) == [
+        ("CreateRole", "123456789012", "NewRole")
+    ]
+
+
+def test_changes_are_applied_to_the_inventory(monkeypatch):
+    roles = fake_iam(monkeypatch)
+    inventory = RoleInventory()
+    inventory.get_all()
+
+    role = roles["aws-account-destroyer"]
+    snapshots = TTLCache()
+    snapshots.put(role.version, "policies")
+    updater = InventoryUpdater(inventory, snapshots)
+
+    roles["NewRole"] = Role(
+        {
+            "Path": "/",
+            "RoleName": "NewRole",
+            "RoleId": "AROANEWROLE",
+            "Arn": "arn:aws:iam::123456789012:role/NewRole",
+            "AssumeRolePolicyDocument": {},
+        }
+    )
+    updater.apply_all(iter_changes(created_role("NewRole")))
+    assert [r.name for r in inventory.find("NewRole")] == ["NewRole"]
+
+    updater.apply_all(iter_changes(cloudtrail_record("AttachRolePolicy", role.name)))
+    assert snapshots.get(role.version) is None
+
+    del roles["NewRole"]
+    updater.apply_all(iter_changes(cloudtrail_record("DeleteRole", "NewRole")))
+    assert not inventory.find("NewRole")
+
+    count = apply_events(cloudtrail_record("UpdateAssumeRolePolicy", role.name), inventory)
+    assert count == 1 and list(inventory.find(role.name)[0].principals) == role.principals
+
+
+def test_forged_events_have_no_effect(monkeypatch):
+    roles = fake_iam(monkeypatch)
+    inventory = RoleInventory()
+    inventory.get_all()
+    forged_principal = Principal("Service", "ecs-tasks.amazonaws.com")
+
+    apply_events(created_role("aws-account-destroyer"), inventory)
+    role = inventory.find("aws-account-destroyer")[0]
+    assert list(role.principals) == roles["aws-account-destroyer"].principals
+    assert not inventory.find("aws-account-destroyer", forged_principal)
+
+    apply_events(created_role("ForgedRole"), inventory)
+    assert not inventory.find("ForgedRole")
+
+    apply_events(cloudtrail_record("DeleteRole", "aws-account-destroyer"), inventory)
+    assert inventory.find("aws-account-destroyer")
+
+
+class FakeDynamoDB(object):
+    """
+    a table queried by partition key and a lower bound of the sort key, one item per
+    page.
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def put_item(self, TableName, Item):
+        self.items.append(Item)
+
+    def query(self, ExpressionAttributeValues, ExclusiveStartKey=None, **kwargs):
+        after = ExpressionAttributeValues[":sk"]["S"]
+        if ExclusiveStartKey:
+            after = max(after, ExclusiveStartKey["sk"]["S"])
+        items = sorted(
+            (i for i in self.items if i["sk"]["S"] > after), key=lambda i: i["sk"]["S"]
+        )
+        response = {"Items": items[:1]}
+        if len(items) > 1:
+            response["LastEvaluatedKey"] = {"sk": items[0]["sk"]}
+        return response
+
+
+def test_changes_are_followed_through_the_log(monkeypatch):
+    roles = fake_iam(monkeypatch)
+    monkeypatch.setitem(iam_sudo.clients._clients, "dynamodb", FakeDynamoDB())
+    log = ChangeLog("iam-sudo-role-changes")
+    inventories = [RoleInventory(), RoleInventory()]
+    followers = [
+        ChangeFollower(log, InventoryUpdater(inventory), interval=0)
+        for inventory in inventories
+    ]
+    for inventory in inventories:
+        inventory.get_all()
+
+    roles["NewRole"] = Role(
+        {
+            "Path": "/",
+            "RoleName": "NewRole",
+            "RoleId": "AROANEWROLE",
+            "Arn": "arn:aws:iam::123456789012:role/NewRole",
+            "AssumeRolePolicyDocument": {},
+        }
+    )
+    changes = {"Records": [created_role("NewRole"), created_role("ForgedRole")]}
+    assert log.append(iter_changes(changes)) == 2
+
+    assert [f.poll() for f in followers] == [2, 2]
+    for inventory in inventories:
+        assert [r.name for r in inventory.find("NewRole")] == ["NewRole"]
+        assert not inventory.find("ForgedRole")
+
+    assert [f.poll() for f in followers] == [0, 0]
+
+    del roles["NewRole"]
+    log.append(iter_changes(cloudtrail_record("DeleteRole", "NewRole")))
+    assert [f.poll() for f in followers] == [1, 1]
+    assert not any(i.find("NewRole") for i in inventories)
+
+
+def test_changes_are_polled_once_per_interval(monkeypatch):
+    fake_iam(monkeypatch)
+    monkeypatch.setitem(iam_sudo.clients._clients, "dynamodb", FakeDynamoDB())
+    log = ChangeLog("iam-sudo-role-changes")
+    follower = ChangeFollower(log, InventoryUpdater(RoleInventory()), interval=3600)
+    log.append(iter_changes(cloudtrail_record("DeleteRole", "OldRole")))
+
+    assert follower.poll() == 1
+    log.append(iter_changes(cloudtrail_record("DeleteRole", "OtherRole")))
+    assert follower.poll() == 0
+
+
+def test_follow_changes_without_a_table(monkeypatch):
+    monkeypatch.delenv("IAM_SUDO_ROLE_CHANGES_TABLE", raising=False)
+    monkeypatch.setattr(iam_sudo.events, "_follower", None)
+    assert follow_changes() == 0
+    assert iam_sudo.events._follower is None
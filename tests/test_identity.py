@@ -0,0 +1,32 @@
+import iam_sudo.clients
+import iam_sudo.identity
+from iam_sudo.identity import CallerIdentity
+
+
+class FakeSTS(object):
+    def __init__(self):
+        self.calls = 0
+
+    def get_caller_identity(self):
+        self.calls += 1
+        return {"Account": "123456789012"}
+
+
+def test_account_is_resolved_once_per_credentials(monkeypatch, tmp_path):
+    sts = FakeSTS()
+    key = ["key-1"]
+    monkeypatch.setitem(iam_sudo.clients._clients, "sts", sts)
+    monkeypatch.setattr(iam_sudo.identity, "credentials_key", lambda: key[0])
+
+    filename = str(tmp_path / "identity.json")
+    identity = CallerIdentity(filename)
+    assert identity.account() == "123456789012"
+    assert identity.account() == "123456789012"
+    assert sts.calls == 1
+
+    assert CallerIdentity(filename).account() == "123456789012"
+    assert sts.calls == 1
+
+    key[0] = "key-2"
+    assert CallerIdentity(filename).account() == "123456789012"
+    assert sts.calls == 2
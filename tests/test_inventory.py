@@ -0,0 +1,298 @@
+import json
+from os import path
+
+from iam_sudo.inventory import RoleInventory
+from iam_sudo.roles import Role, RoleRecord, Roles
+
+
+def load_roles(account=None, scope=None) -> Roles:
+    return Roles.load_from_file(path.join(path.dirname(__file__), "roles.json"))
+
+
+def test_get_all_is_cached(monkeypatch):
+    calls = []
+
+    def iterate_all(account=None, scope=None):
+        calls.append(1)
+        return load_roles()
+
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(iterate_all))
+    inventory = RoleInventory(ttl=300)
+    assert len(inventory.get_all()) == len(load_roles())
+    assert len(inventory.get_all()) == len(load_roles())
+    assert len(calls) == 1
+
+    inventory.ttl = 0
+    inventory.get_all()
+    assert len(calls) == 2
+
+
+def test_refresh_keeps_unchanged_roles(monkeypatch):
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(load_roles))
+    inventory = RoleInventory()
+    before = {r.name: r for r in inventory.get_all()}
+    after = {r.name: r for r in inventory.refresh()}
+    assert all(before[name] is role for name, role in after.items())
+
+
+def test_max_size(monkeypatch):
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(load_roles))
+    inventory = RoleInventory(max_size=1)
+    assert len(inventory.get_all()) == len(load_roles())
+    assert not inventory.is_fresh()
+
+
+def test_file_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(load_roles))
+    filename = str(tmp_path / "roles.json")
+    RoleInventory(filename=filename).get_all()
+
+    with open(filename) as f:
+        assert len(json.load(f)["roles"]) == len(load_roles())
+
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(lambda account=None, scope=None: Roles()))
+    inventory = RoleInventory(filename=filename)
+    assert len(inventory.get_all()) == len(load_roles())
+
+    inventory.remove("aws-account-destroyer")
+    assert len(RoleInventory(filename=filename).get_all()) == len(load_roles()) - 1
+
+
+def test_query_streams_when_the_account_exceeds_the_cache(monkeypatch):
+    listed = []
+
+    def iterate_all(account=None, scope=None):
+        for role in load_roles():
+            listed.append(role.name)
+            yield role
+
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(iterate_all))
+    monkeypatch.setattr(Role, "get_by_role_name", staticmethod(lambda name, account=None: None))
+    inventory = RoleInventory(max_size=1)
+    inventory.get_all()
+    assert inventory.exceeds_max_size()
+
+    listed.clear()
+    query = inventory.query("account-destroyer")
+    assert not listed
+    assert next(iter(query)).name == "aws-account-destroyer"
+    assert listed == ["aws-account-destroyer"]
+
+
+def test_search_of_an_account_exceeding_the_cache_scans_once(monkeypatch):
+    scans, listed = [], []
+
+    def iterate_all(account=None, scope=None):
+        scans.append(scope)
+        for role in load_roles():
+            listed.append(role.name)
+            yield role
+
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(iterate_all))
+    monkeypatch.setattr(Role, "get_by_role_name", staticmethod(lambda name, account=None: None))
+    inventory = RoleInventory(max_size=1)
+
+    query = iter(inventory.query("destroyer"))
+    assert next(query).name == "aws-account-destroyer"
+    assert len(listed) == 2 and not inventory.is_fresh()
+
+    names = ["aws-account-destroyer"] + [r.name for r in query]
+    assert names == [r.name for r in load_roles() if "destroyer" in r.name]
+    assert len(scans) == 1 and inventory.exceeds_max_size()
+
+
+def test_roles_are_kept_as_records(monkeypatch, tmp_path):
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(load_roles))
+    filename = str(tmp_path / "roles.json")
+    roles = RoleInventory(filename=filename).get_all()
+    assert all(isinstance(r, RoleRecord) and not hasattr(r, "__dict__") for r in roles)
+
+    loaded = {r.name: r for r in RoleInventory(filename=filename).get_all()}
+    for role in load_roles():
+        record = loaded[role.name]
+        assert (record.arn, record.principals, record.version) == (
+            role.arn,
+            tuple(role.principals),
+            role.version,
+        )
+
+
+def test_find_role_stops_at_the_exact_name(monkeypatch):
+    import iam_sudo.sudo
+    from iam_sudo.sudo import AssumeRoleError, find_role
+
+    consumed = []
+
+    def query(name, principal=None, scope=None):
+        for role in load_roles().query().name_contains(name):
+            consumed.append(role.name)
+            yield role
+
+    monkeypatch.setattr(iam_sudo.sudo.inventory, "query", query)
+    assert find_role("aws-account-destroyer", None).name == "aws-account-destroyer"
+    assert consumed == ["aws-account-destroyer"]
+
+    try:
+        find_role("destroyer", None)
+        assert False, "expected an ambiguous match"
+    except AssumeRoleError as e:
+        assert "multiple roles" in str(e)
+
+
+def test_multi_account_inventory(monkeypatch, tmp_path):
+    import iam_sudo.clients
+    import iam_sudo.sudo
+    from iam_sudo.inventory import MultiAccountInventory
+    from iam_sudo.sudo import AssumeRoleError, find_role
+
+    class Paginator(object):
+        def __init__(self, roles):
+            self.roles = roles
+
+        def paginate(self):
+            return iter([{"Roles": self.roles}])
+
+    class IAM(object):
+        def __init__(self, account, names):
+            self.roles = [
+                {
+                    "RoleName": name,
+                    "RoleId": f"{account}-{name}",
+                    "Arn": f"arn:aws:iam::{account}:role/{name}",
+                }
+                for name in names
+            ]
+
+        def get_paginator(self, operation):
+            return Paginator(self.roles)
+
+        def get_role(self, RoleName):
+            for role in self.roles:
+                if role["RoleName"] == RoleName:
+                    return {"Role": role}
+            raise self.exceptions.NoSuchEntityException()
+
+        class exceptions(object):
+            class NoSuchEntityException(Exception):
+                pass
+
+    monkeypatch.setenv("IAM_SUDO_ACCOUNTS", "111111111111,222222222222")
+    monkeypatch.setitem(
+        iam_sudo.clients._clients, "iam@111111111111", IAM("111111111111", ["a-TaskRole", "Shared"])
+    )
+    monkeypatch.setitem(
+        iam_sudo.clients._clients, "iam@222222222222", IAM("222222222222", ["b-Lambda", "Shared"])
+    )
+
+    inventory = MultiAccountInventory(["111111111111", "222222222222"], max_workers=2)
+    inventory.filename = str(tmp_path / "roles.json")
+    assert [r.arn for r in inventory.find("Role")] == [
+        "arn:aws:iam::111111111111:role/a-TaskRole"
+    ]
+    assert set(inventory.latency) == {"111111111111", "222222222222"}
+    assert (tmp_path / "roles-222222222222.json").exists()
+
+    monkeypatch.setattr(iam_sudo.sudo, "inventory", inventory)
+    assert find_role("Lambda", None).account == "222222222222"
+    try:
+        find_role("Shared", None)
+        assert False, "expected an ambiguous match"
+    except AssumeRoleError as e:
+        assert "multiple roles" in str(e)
+
+
+def test_query_looks_up_exact_and_literal_names_before_a_scan(monkeypatch):
+    from iam_sudo.roles import RoleScope
+
+    roles = {r.name: r for r in load_roles()}
+    looked_up, scanned = [], []
+
+    def get_by_role_name(name, account=None):
+        looked_up.append(name)
+        return roles.get(name)
+
+    def iterate_all(account=None, scope=None):
+        scanned.append(scope)
+        return load_roles()
+
+    monkeypatch.setattr(Role, "get_by_role_name", staticmethod(get_by_role_name))
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(iterate_all))
+    inventory = RoleInventory()
+
+    assert next(iter(inventory.query("aws-account-destroyer"))).name == "aws-account-destroyer"
+    assert looked_up == ["aws-account-destroyer"] and not scanned
+
+    scope = RoleScope(("/",), "aws-", frozenset(["aws-account-destroyer", "aws-other"]))
+    assert [r.name for r in inventory.query("destroyer", scope=scope)] == [
+        "aws-account-destroyer"
+    ]
+    assert looked_up[1:] == ["aws-account-destroyer"] and not scanned
+
+    looked_up.clear()
+    assert len(inventory.find("destroyer")) > 1
+    assert looked_up == ["destroyer"] and scanned == [RoleScope(("/",), "", None)]
+
+
+def test_iterate_all_lists_per_path_prefix(monkeypatch):
+    import iam_sudo.clients
+    from iam_sudo.roles import RoleScope
+
+    listed = []
+
+    class Paginator(object):
+        def paginate(self, **kwargs):
+            listed.append(kwargs)
+            return iter(
+                [
+                    {
+                        "Roles": [
+                            {"RoleName": "sudo-a", "Arn": "arn", "Path": kwargs["PathPrefix"]},
+                            {"RoleName": "other", "Arn": "arn", "Path": kwargs["PathPrefix"]},
+                        ]
+                    }
+                ]
+            )
+
+    class IAM(object):
+        def get_paginator(self, operation):
+            return Paginator()
+
+    monkeypatch.setitem(iam_sudo.clients._clients, "iam", IAM())
+    roles = list(Role.iterate_all(scope=RoleScope(("/a/", "/b/"), "sudo-", None)))
+    assert listed == [{"PathPrefix": "/a/"}, {"PathPrefix": "/b/"}]
+    assert [(r.name, r.path) for r in roles] == [("sudo-a", "/a/"), ("sudo-a", "/b/")]
+
+
+def test_concurrent_searches_scan_the_account_once(monkeypatch):
+    import threading
+    import time
+
+    scanned = []
+    started = threading.Barrier(8)
+
+    def iterate_all(account=None, scope=None):
+        scanned.append(scope)
+        time.sleep(0.05)
+        return load_roles()
+
+    def get_by_role_name(name, account=None):
+        time.sleep(0.05)
+        return None
+
+    monkeypatch.setattr(Role, "get_by_role_name", staticmethod(get_by_role_name))
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(iterate_all))
+    inventory = RoleInventory(ttl=300)
+    found = []
+
+    def search():
+        started.wait()
+        found.append(len(inventory.find("destroyer")))
+
+    threads = [threading.Thread(target=search) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(scanned) == 1
+    assert len(found) == 8 and len(set(found)) == 1 and found[0] > 1
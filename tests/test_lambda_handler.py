@@ -0,0 +1,85 @@
+import pytest
+
+import iam_sudo.events
+import iam_sudo.lambda_handler
+import iam_sudo.sudo
+from iam_sudo.credentials import Credentials
+from iam_sudo.lambda_handler import events_handler, handler
+from iam_sudo.sudo import AssumeRoleError
+
+policy = """
+allowed-role-names:
+  - "*"
+allowed-principals:
+  - "*": "*"
+allowed-base-roles:
+  - "arn:aws:iam::*:role/*"
+"""
+
+
+def fake_simulate_assume_role(base_role: str, role_name: str, principal: str):
+    if role_name == "missing":
+        raise AssumeRoleError(f"no roles matching name {role_name}")
+    return Credentials(
+        {
+            "AccessKeyId": role_name,
+            "SecretAccessKey": base_role,
+            "SessionToken": f"{principal}",
+            "Expiration": "2021-02-27T10:00:00+00:00",
+        }
+    )
+
+
+def test_batch(monkeypatch):
+    monkeypatch.setenv("IAM_SUDO_POLICY", policy)
+    monkeypatch.setenv("IAM_SUDO_BASE_ROLE", "IAMSudoUser")
+    monkeypatch.setattr(
+        iam_sudo.sudo, "simulate_assume_role", fake_simulate_assume_role
+    )
+
+    response = handler(
+        {
+            "requests": [
+                {"role_name": "TaskRole", "principal": "Service:ecs-tasks.amazonaws.com"},
+                {"role_name": "missing"},
+                {"role_name": "OtherRole", "base_role": "OtherBase"},
+            ]
+        },
+        None,
+    )
+
+    results = response["results"]
+    assert results[0]["credentials"]["AccessKeyId"] == "TaskRole"
+    assert results[0]["credentials"]["SecretAccessKey"] == "IAMSudoUser"
+    assert results[0]["credentials"]["SessionToken"] == "Service:ecs-tasks.amazonaws.com"
+    assert results[1] == {"error": "no roles matching name missing"}
+    assert results[2]["credentials"]["SecretAccessKey"] == "OtherBase"
+
+
+def test_events_are_only_taken_by_the_events_handler(monkeypatch):
+    monkeypatch.setenv("IAM_SUDO_POLICY", policy)
+    monkeypatch.setenv("IAM_SUDO_BASE_ROLE", "IAMSudoUser")
+    logged = []
+    monkeypatch.setattr(
+        iam_sudo.events.ChangeLog,
+        "append",
+        lambda self, changes: logged.extend(changes) or len(logged),
+    )
+    event = {
+        "eventSource": "iam.amazonaws.com",
+        "eventName": "CreateRole",
+        "requestParameters": {"roleName": "TaskRole"},
+    }
+
+    with pytest.raises(Exception, match="events handler"):
+        handler(event, None)
+
+    with pytest.raises(Exception, match="role change table is required"):
+        events_handler(event, None)
+
+    monkeypatch.setenv("IAM_SUDO_ROLE_CHANGES_TABLE", "iam-sudo-role-changes")
+    assert events_handler(event, None) == {"logged": 1}
+    assert logged == [("CreateRole", None, "TaskRole")]
+
+    with pytest.raises(Exception, match="invalid event"):
+        events_handler({"role_name": "TaskRole"}, None)
@@ -0,0 +1,92 @@
+from fnmatch import fnmatchcase
+
+from iam_sudo.matcher import GlobMatcher, PrincipalMatcher
+from iam_sudo.principal import Principal
+
+patterns = [
+    "*",
+    "N*",
+    "*N*",
+    "No",
+    "a?c",
+    "[abc]*",
+    "[!abc]x",
+    "[]x]",
+    "[unclosed",
+    "arn:aws:iam::*:role/N*",
+    "a.b+c(d)",
+    "**",
+]
+
+names = [
+    "",
+    "No",
+    "OhNo",
+    "Yes",
+    "*",
+    "abc",
+    "axc",
+    "bx",
+    "xx",
+    "]",
+    "[unclosed",
+    "a.b+c(d)",
+    "aXb+c(d)",
+    "arn:aws:iam::12344534545:role/No",
+    "arn:aws:iam::12344534545:role/Yes",
+]
+
+
+def test_glob_matcher_is_fnmatch():
+    for pattern in patterns:
+        matcher = GlobMatcher([pattern])
+        for name in names:
+            assert matcher.matches(name) == fnmatchcase(name, pattern), (pattern, name)
+
+    matcher = GlobMatcher(patterns[1:4])
+    for name in names:
+        assert matcher.matches(name) == any(fnmatchcase(name, p) for p in patterns[1:4])
+
+    assert not GlobMatcher([]).matches("")
+
+
+def test_principal_matcher():
+    matcher = PrincipalMatcher(
+        [Principal("Service", "ecs*"), Principal("*", "arn:aws:iam::12*:*")]
+    )
+    assert matcher.matches(Principal("Service", "ecs-tasks.amazonaws.com"))
+    assert matcher.matches(Principal("AWS", "arn:aws:iam::123456789013:root"))
+    assert not matcher.matches(Principal("Service", "lambda.amazonaws.com"))
+    assert not matcher.matches(Principal("AWS", "ecs-tasks.amazonaws.com"))
+    assert not PrincipalMatcher([]).matches(Principal("*", "*"))
+
+
+def test_glob_matcher_ranges_are_fnmatch():
+    import warnings
+
+    ranges = [
+        "[]-[.]",
+        "[?--]",
+        "[z-a]x",
+        "[a-c-e]",
+        "[!a-]",
+        "[--0]",
+        "[!]",
+        "[a&&b]",
+        "[a||b]",
+        "[~~]",
+        "[\\]",
+        "[[:alpha:]]",
+        "[^a]",
+        "[a-]",
+    ]
+    samples = list("abdex-./[]?,&|~\\^:0") + ["", "zx", "ax"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for pattern in ranges:
+            matcher = GlobMatcher([pattern])
+            for name in samples:
+                assert matcher.matches(name) == fnmatchcase(name, pattern), (pattern, name)
+        combined = GlobMatcher(ranges)
+    for name in samples:
+        assert combined.matches(name) == any(fnmatchcase(name, p) for p in ranges)
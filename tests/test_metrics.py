@@ -0,0 +1,90 @@
+import io
+import json
+
+import iam_sudo.lambda_handler
+from iam_sudo.credentials import Credentials
+from iam_sudo.lambda_handler import handler
+from iam_sudo.metrics import Metrics, metrics
+
+
+def test_timer_records_stages_and_calls_hooks():
+    m = Metrics()
+    traced = []
+    m.add_hook(lambda stage, seconds: traced.append(stage))
+
+    with m.timer("find_role"):
+        pass
+    try:
+        with m.timer("assume_role"):
+            raise ValueError("failed")
+    except ValueError:
+        pass
+    m.count("policy_cache.hit")
+    m.count("policy_cache.hit")
+
+    assert traced == ["find_role", "assume_role"]
+    assert sorted(m.timings()) == ["assume_role", "find_role"]
+    assert m.timings()["find_role"].count == 1
+    assert m.counters() == {"policy_cache.hit": 2}
+    assert len(m.summary()) == 3
+
+
+def test_timings_are_aggregated():
+    m = Metrics()
+    for i in range(1000):
+        m.record("find_role", i / 1000)
+
+    timing = m.timings()["find_role"]
+    assert (timing.count, timing.minimum, timing.maximum) == (1000, 0.0, 0.999)
+    assert round(timing.total, 3) == 499.5
+
+
+def test_emf_document():
+    m = Metrics()
+    m.record("find_role", 0.25)
+    m.record("find_role", 0.05)
+    m.count("iam.ListRoles", 3)
+
+    doc = m.to_emf("iam-sudo", {"Function": "iam-sudo"})
+    assert doc["find_role"] == {"SampleCount": 2, "Sum": 300.0, "Min": 50.0, "Max": 250.0}
+    assert doc["iam.ListRoles"] == 3
+    assert doc["Function"] == "iam-sudo"
+    directive = doc["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "iam-sudo"
+    assert directive["Dimensions"] == [["Function"]]
+    assert {"Name": "find_role", "Unit": "Milliseconds"} in directive["Metrics"]
+    assert {"Name": "iam.ListRoles", "Unit": "Count"} in directive["Metrics"]
+
+    stream = io.StringIO()
+    m.flush_emf(stream)
+    assert json.loads(stream.getvalue())["iam.ListRoles"] == 3
+    assert m.counters() == {} and m.timings() == {}
+
+
+def test_handler_logs_metrics_of_request(monkeypatch, capsys):
+    def simulate_assume_role(base_role: str, role_name: str, principal: str):
+        metrics.count("iam.GetRole")
+        return Credentials(
+            {
+                "AccessKeyId": role_name,
+                "SecretAccessKey": base_role,
+                "SessionToken": "token",
+                "Expiration": "2021-02-27T10:00:00+00:00",
+            }
+        )
+
+    monkeypatch.setenv(
+        "IAM_SUDO_POLICY",
+        '{"allowed-role-names": ["*"], "allowed-principals": [{"*": "*"}], '
+        '"allowed-base-roles": ["arn:aws:iam::*:role/*"]}',
+    )
+    monkeypatch.setenv("IAM_SUDO_BASE_ROLE", "IAMSudoUser")
+    monkeypatch.setattr(iam_sudo.lambda_handler, "simulate_assume_role", simulate_assume_role)
+    metrics.reset()
+
+    handler({"role_name": "TaskRole"}, None)
+
+    doc = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert doc["iam.GetRole"] == 1
+    assert doc["request"]["SampleCount"] == 1
+    assert metrics.counters() == {}
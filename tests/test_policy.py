@@ -1,7 +1,7 @@
 import json
 from os import path
 from iam_sudo.sudo_policy import Policy
-from iam_sudo.roles import Roles
+from iam_sudo.roles import Role, Roles
 from iam_sudo.principal import Principal
 
 
@@ -101,3 +101,95 @@ def test_load_policy():
     assert len(allowed_roles) == 2
     assert allowed_roles[0].name == "aws-account-destroyer-build-trigger"
     assert allowed_roles[1].name == "aws-account-destroyer-event-trigger"
+
+
+def test_list_streams_allowed_roles(monkeypatch):
+    from click.testing import CliRunner
+
+    import iam_sudo.clients
+    from iam_sudo.__main__ import cli
+
+    with open(path.join(path.dirname(__file__), "roles.json")) as f:
+        roles = json.load(f)
+    pages = [{"Roles": roles[i : i + 2]} for i in range(0, len(roles), 2)]
+    consumed = []
+
+    class Paginator(object):
+        def paginate(self):
+            for page in pages:
+                consumed.append(page)
+                yield page
+
+    class IAM(object):
+        def get_paginator(self, operation: str):
+            assert operation == "list_roles"
+            return Paginator()
+
+    policy = Policy.load(
+        """
+    allowed-role-names:
+      - "*account-destroyer*"
+    allowed-principals:
+      - Service: "lambda*"
+      - Service: "events*"
+    allowed-base-roles:
+      - arn:aws:iam::*:role/*
+    """
+    )
+    monkeypatch.setitem(iam_sudo.clients._clients, "iam", IAM())
+    monkeypatch.setattr(Policy, "get_default", staticmethod(lambda: policy))
+
+    allowed = policy.iter_allowed_roles(Role.iterate_all())
+    assert next(allowed).name == "aws-account-destroyer-build-trigger"
+    assert len(consumed) < len(pages)
+
+    result = CliRunner().invoke(cli, ["list"])
+    assert result.exit_code == 0, result.output
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert [line["role_name"] for line in lines] == [
+        "aws-account-destroyer-build-trigger",
+        "aws-account-destroyer-event-trigger",
+    ]
+    assert lines[0]["principals"] == ["Service:lambda.amazonaws.com"]
+
+
+def test_role_scope():
+    policy = Policy.load(
+        """
+allowed-role-names:
+  - "sudo-task-*"
+  - "sudo-lambda"
+allowed-principals:
+  - "*": "*"
+allowed-base-roles:
+  - "arn:aws:iam::*:role/*"
+allowed-role-paths:
+  - /sudo/
+  - /sudo/tasks/
+  - /services/
+"""
+    )
+    scope = policy.role_scope()
+    assert scope.path_prefixes == ("/services/", "/sudo/")
+    assert scope.name_prefix == "sudo-"
+    assert scope.names is None
+
+    role = Role(
+        {
+            "RoleName": "sudo-lambda",
+            "Arn": "arn:aws:iam::123456789012:role/sudo/sudo-lambda",
+            "Path": "/sudo/",
+        }
+    )
+    assert scope.contains(role)
+    assert not scope.contains(Role(dict(role, Path="/")))
+    assert not policy.is_allowed_role_path("/")
+
+    policy.allowed_role_names = ["sudo-task", "sudo-lambda"]
+    scope = policy.role_scope()
+    assert scope.names == {"sudo-task", "sudo-lambda"}
+    assert scope.candidates("task") == ["sudo-task"]
+
+    loaded = Policy.load_artifact(policy.to_artifact())
+    assert loaded.allowed_role_paths == ["/services/", "/sudo/", "/sudo/tasks/"]
+    assert Policy().role_scope().path_prefixes == ("/",)
@@ -0,0 +1,111 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from iam_sudo.__main__ import cli
+from iam_sudo.principal import Principal
+from iam_sudo.sudo_policy import Policy, _content_hash
+
+policy_document = """
+allowed-role-names:
+  - "*account-destroyer*"
+  - "TaskRole"
+allowed-principals:
+  - Service: "lambda*"
+  - Service: "events*"
+allowed-base-roles:
+  - arn:aws:iam::444093529715:role/aws-*
+"""
+
+
+def test_artifact_roundtrip():
+    policy = Policy.load(policy_document)
+    artifact = policy.to_artifact()
+    assert artifact["sha256"] == policy.content_hash
+
+    compiled = Policy.load(json.dumps(artifact))
+    assert compiled.content_hash == policy.content_hash
+    assert compiled.to_artifact() == artifact
+
+    for name in ["aws-account-destroyer", "TaskRole", "TaskRole2", "other"]:
+        assert compiled.is_allowed_role_name(name) == policy.is_allowed_role_name(name)
+    for principal in [
+        Principal("Service", "lambda.amazonaws.com"),
+        Principal("Service", "ecs-tasks.amazonaws.com"),
+        Principal("AWS", "events"),
+    ]:
+        assert compiled.is_allowed_principal(principal) == policy.is_allowed_principal(
+            principal
+        )
+    for base_role in [
+        "arn:aws:iam::444093529715:role/aws-sudo",
+        "arn:aws:iam::444093529715:role/IAMSudoUser",
+    ]:
+        assert compiled.is_allowed_base_role(base_role) == policy.is_allowed_base_role(
+            base_role
+        )
+
+
+def test_artifact_is_verified():
+    artifact = Policy.load(policy_document).to_artifact()
+    artifact["allowed-role-names"].append("*")
+    with pytest.raises(ValueError):
+        Policy.load_artifact(artifact)
+
+    artifact = Policy.load(policy_document).to_artifact()
+    artifact["version"] = 99
+    with pytest.raises(ValueError):
+        Policy.load_artifact(artifact)
+
+
+def test_artifact_fields_are_checked():
+    policy = Policy.load(policy_document + "allowed-role-paths:\n  - /sudo/\n")
+    artifact = policy.to_artifact()
+    assert artifact["version"] == 2
+    assert not Policy.load_artifact(artifact).is_allowed_role_path("/")
+
+    # a version 1 reader would ignore the paths, and allow every role
+    artifact["version"] = 1
+    with pytest.raises(ValueError, match="allowed-role-paths"):
+        Policy.load_artifact(artifact)
+
+    artifact = Policy.load(policy_document).to_artifact()
+    artifact["version"] = 1
+    assert Policy.load_artifact(artifact).content_hash == artifact["sha256"]
+
+    artifact = Policy.load(policy_document).to_artifact()
+    artifact["denied-role-names"] = ["*"]
+    artifact["sha256"] = _content_hash(
+        {k: v for k, v in artifact.items() if k not in ("format", "version", "sha256")}
+    )
+    with pytest.raises(ValueError, match="denied-role-names"):
+        Policy.load_artifact(artifact)
+
+
+def test_compile_command():
+    result = CliRunner().invoke(cli, ["policy", "compile"], input=policy_document)
+    assert result.exit_code == 0
+    artifact = json.loads(result.output)
+    assert artifact["sha256"] == Policy.load(policy_document).content_hash
+
+    result = CliRunner().invoke(cli, ["policy", "compile"], input="allowed-role-names: 1")
+    assert result.exit_code != 0
+
+
+def test_simulated_credentials_are_cached_per_policy_content(monkeypatch):
+    import iam_sudo.__main__
+
+    policy = Policy.load(policy_document)
+    keys = []
+    monkeypatch.setattr(Policy, "get_default", staticmethod(lambda: policy))
+    monkeypatch.setattr(
+        iam_sudo.__main__, "_cached", lambda cache, fetch, **kwargs: keys.append(kwargs)
+    )
+    monkeypatch.setattr(iam_sudo.__main__, "_use_credentials", lambda *args: None)
+
+    result = CliRunner().invoke(
+        cli, ["simulate", "--local", "--role-name", "TaskRole", "--profile", "task"]
+    )
+    assert result.exit_code == 0, result.output
+    assert keys[0]["policy"] == policy.content_hash
@@ -0,0 +1,126 @@
+import io
+
+import pytest
+from botocore.exceptions import ClientError
+
+from iam_sudo.policy_source import (
+    EnvironmentPolicySource,
+    FilePolicySource,
+    ParameterStorePolicySource,
+    PolicyProvider,
+    PolicySource,
+    S3PolicySource,
+    policy_source_from_url,
+)
+
+
+def policy_document(role_name: str) -> str:
+    return f"""
+allowed-role-names:
+  - "{role_name}"
+allowed-principals:
+  - "*": "*"
+allowed-base-roles:
+  - "arn:aws:iam::*:role/*"
+"""
+
+
+class LocalParameterStore(object):
+    def __init__(self):
+        self.parameters = {}
+
+    def put_parameter(self, Name: str, Value: str):
+        version = self.parameters.get(Name, {}).get("Version", 0) + 1
+        self.parameters[Name] = {"Name": Name, "Value": Value, "Version": version}
+
+    def get_parameter(self, Name: str, WithDecryption: bool = False):
+        return {"Parameter": dict(self.parameters[Name])}
+
+
+class LocalObjectStore(object):
+    def __init__(self):
+        self.objects = {}
+        self.gets = 0
+
+    def put_object(self, Bucket: str, Key: str, Body: str):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket: str, Key: str, IfNoneMatch: str = None):
+        self.gets += 1
+        body = self.objects[(Bucket, Key)]
+        etag = f'"{hash(body)}"'
+        if IfNoneMatch == etag:
+            raise ClientError(
+                {"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject"
+            )
+        return {"Body": io.BytesIO(body.encode("utf-8")), "ETag": etag}
+
+
+def test_file_source(tmp_path):
+    path = tmp_path / "policy.yaml"
+    path.write_text(policy_document("First*"))
+    provider = PolicyProvider(FilePolicySource(str(path)), ttl=0)
+    policy = provider.get()
+    assert policy.is_allowed_role_name("FirstRole")
+    assert provider.get() is policy
+
+    path.write_text(policy_document("Second*"))
+    assert provider.get().is_allowed_role_name("SecondRole")
+    assert not provider.get().is_allowed_role_name("FirstRole")
+
+
+def test_parameter_store_source():
+    ssm = LocalParameterStore()
+    ssm.put_parameter(Name="/iam-sudo/policy", Value=policy_document("First*"))
+    provider = PolicyProvider(ParameterStorePolicySource("/iam-sudo/policy", ssm), ttl=0)
+    policy = provider.get()
+    assert provider.get() is policy
+    assert provider.version == "1"
+
+    ssm.put_parameter(Name="/iam-sudo/policy", Value="not: [a valid policy")
+    assert provider.get() is policy
+
+    ssm.put_parameter(Name="/iam-sudo/policy", Value=policy_document("Second*"))
+    assert provider.get().is_allowed_role_name("SecondRole")
+    assert provider.version == "3"
+
+
+def test_s3_source():
+    s3 = LocalObjectStore()
+    s3.put_object(Bucket="bucket", Key="policy.yaml", Body=policy_document("First*"))
+    provider = PolicyProvider(S3PolicySource("bucket", "policy.yaml", s3), ttl=3600)
+    policy = provider.get()
+    assert provider.get() is policy
+    assert s3.gets == 1
+
+    provider.ttl = 0
+    assert provider.get() is policy
+    s3.put_object(Bucket="bucket", Key="policy.yaml", Body=policy_document("Second*"))
+    assert provider.get().is_allowed_role_name("SecondRole")
+
+
+def test_initial_load_failure_is_raised():
+    provider = PolicyProvider(EnvironmentPolicySource(lambda: "allowed-role-names: 1"))
+    with pytest.raises(Exception):
+        provider.get()
+
+
+def test_policy_source_from_url():
+    assert isinstance(policy_source_from_url(None), EnvironmentPolicySource)
+    assert policy_source_from_url("file:///etc/policy.yaml").path == "/etc/policy.yaml"
+    assert policy_source_from_url("ssm:///iam-sudo/policy").name == "/iam-sudo/policy"
+    source = policy_source_from_url("s3://bucket/path/policy.yaml")
+    assert (source.bucket, source.key) == ("bucket", "path/policy.yaml")
+    with pytest.raises(ValueError):
+        policy_source_from_url("http://example.com/policy.yaml")
+
+
+def test_policy_source_is_abstract():
+    with pytest.raises(TypeError):
+        PolicySource()
+
+    class IncompleteSource(PolicySource):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteSource()
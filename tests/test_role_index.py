@@ -0,0 +1,40 @@
+from os import path
+
+from iam_sudo.principal import Principal
+from iam_sudo.role_index import RoleIndex
+from iam_sudo.roles import Roles
+
+
+def load_roles() -> Roles:
+    return Roles.load_from_file(path.join(path.dirname(__file__), "roles.json"))
+
+
+def test_find_matches_linear_scan():
+    roles = load_roles()
+    index = RoleIndex(roles)
+    for name in ["", "a", "aws", "destroyer", "account-destroyer-", "no-such-role"]:
+        expected = roles.filter_by_substring_of_name(name)
+        assert sorted(r.name for r in index.find(name)) == sorted(
+            r.name for r in expected
+        )
+
+    lambda_principal = Principal("Service", "lambda.amazonaws.com")
+    expected = roles.filter_by_substring_of_name("destroyer").filter_by_principal(
+        lambda_principal
+    )
+    found = index.find("destroyer", lambda_principal)
+    assert [r.name for r in found] == [r.name for r in expected]
+    assert [r.name for r in found] == ["aws-account-destroyer-build-trigger"]
+
+
+def test_add_and_discard():
+    roles = load_roles()
+    index = RoleIndex(roles)
+    index.discard("aws-account-destroyer-build-trigger")
+    assert not index.get("aws-account-destroyer-build-trigger")
+    assert not index.find("build-trigger")
+    assert not index.names_with_principal(Principal("Service", "lambda.amazonaws.com"))
+
+    index.add(next(r for r in roles if r.name == "aws-account-destroyer-build-trigger"))
+    assert len(index.find("build-trigger")) == 1
+    assert len(index) == len(roles)
@@ -0,0 +1,116 @@
+import threading
+
+import iam_sudo.clients
+import iam_sudo.roles
+from iam_sudo.cache import TTLCache
+from iam_sudo.roles import Role
+
+
+class FakePaginator(object):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self.pages)
+
+
+class FakeIAM(object):
+    def __init__(self, attached: list, inline: dict):
+        self.attached = attached
+        self.inline = inline
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_paginator(self, operation: str):
+        with self.lock:
+            self.calls.append(operation)
+        if operation == "list_attached_role_policies":
+            return FakePaginator(
+                [{"AttachedPolicies": [{"PolicyArn": arn} for arn in self.attached]}]
+            )
+        if operation == "list_role_policies":
+            return FakePaginator([{"PolicyNames": list(self.inline.keys())}])
+        raise NotImplementedError(operation)
+
+    def get_role_policy(self, RoleName: str, PolicyName: str):
+        with self.lock:
+            self.calls.append("get_role_policy")
+        return {"PolicyDocument": self.inline[PolicyName]}
+
+
+def statement(action: str) -> dict:
+    return {"Effect": "Allow", "Action": action, "Resource": "*"}
+
+
+def test_policy_snapshot(monkeypatch):
+    inline = {
+        f"policy-{i}": {"Version": "2012-10-17", "Statement": [statement(f"s3:Get{i}")]}
+        for i in range(20)
+    }
+    iam = FakeIAM(["arn:aws:iam::aws:policy/ReadOnlyAccess"], inline)
+    monkeypatch.setitem(iam_sudo.clients._clients, "iam", iam)
+
+    snapshot = Role({"RoleName": "r", "Arn": "arn:aws:iam::1:role/r"}).fetch_policy_snapshot()
+
+    assert snapshot.attached_policies == ("arn:aws:iam::aws:policy/ReadOnlyAccess",)
+    assert dict(snapshot.inline_policies) == inline
+    assert list(snapshot.inline_policies.keys()) == list(inline.keys())
+    assert iam.calls.count("get_role_policy") == 20
+    assert iam.calls.count("list_role_policies") == 1
+
+    merged = snapshot.merged_inlined_policy
+    assert [s["Action"] for s in merged["Statement"]] == [
+        f"s3:Get{i}" for i in range(20)
+    ]
+    assert len(inline["policy-0"]["Statement"]) == 1
+
+
+def test_policy_snapshot_is_memoized(monkeypatch):
+    iam = FakeIAM([], {"p": {"Statement": [statement("s3:GetObject")]}})
+    monkeypatch.setitem(iam_sudo.clients._clients, "iam", iam)
+    monkeypatch.setattr(iam_sudo.roles, "policy_snapshots", TTLCache())
+
+    role = {"RoleName": "r", "Arn": "arn:aws:iam::1:role/r", "RoleId": "AROA1"}
+    snapshot = Role(role).get_policy_snapshot()
+    assert Role(role).get_policy_snapshot() is snapshot
+    assert iam.calls.count("get_role_policy") == 1
+
+    recreated = Role(dict(role, RoleId="AROA2"))
+    assert recreated.get_policy_snapshot() is not snapshot
+    assert iam.calls.count("get_role_policy") == 2
+
+
+def test_get_by_role_name_of_missing_role(monkeypatch):
+    import boto3.session
+    from botocore.stub import Stubber
+
+    iam = boto3.session.Session(
+        aws_access_key_id="AKIDEXAMPLE",
+        aws_secret_access_key="secret",
+        region_name="eu-central-1",
+    ).client("iam")
+    monkeypatch.setitem(iam_sudo.clients._clients, "iam", iam)
+
+    with Stubber(iam) as stubber:
+        stubber.add_client_error(
+            "get_role", service_error_code="NoSuchEntity", http_status_code=404
+        )
+        assert Role.get_by_role_name("missing") is None
+        stubber.assert_no_pending_responses()
+
+
+def test_policy_fetcher_is_created_once(monkeypatch):
+    monkeypatch.setattr(iam_sudo.roles, "_policy_fetcher", None)
+    start = threading.Barrier(8)
+    pools = []
+
+    def get():
+        start.wait()
+        pools.append(iam_sudo.roles.policy_fetcher())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(map(id, pools))) == 1
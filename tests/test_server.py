@@ -0,0 +1,64 @@
+import datetime
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+from botocore.credentials import ContainerProvider
+
+from iam_sudo.credentials import Credentials
+from iam_sudo.server import CredentialProvider, CredentialServer
+from iam_sudo.sudo import AssumeRoleError
+
+
+@pytest.fixture
+def server():
+    fetched = []
+
+    def fetch(role_name: str, principal: str, base_role: str) -> Credentials:
+        if role_name == "missing":
+            raise AssumeRoleError("no roles matching name missing")
+        fetched.append((role_name, principal, base_role))
+        return Credentials(
+            {
+                "AccessKeyId": f"ASIA{len(fetched)}",
+                "SecretAccessKey": role_name,
+                "SessionToken": f"{principal}",
+                "Expiration": datetime.datetime.now(datetime.timezone.utc)
+                + datetime.timedelta(hours=1),
+            }
+        )
+
+    server = CredentialServer(CredentialProvider(fetch), token="secret")
+    server.fetched = fetched
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_sdk_container_provider(server):
+    environment = server.environment("TaskRole", "Service:ecs-tasks.amazonaws.com")
+    credentials = ContainerProvider(environ=environment).load()
+    assert credentials.access_key == "ASIA1"
+    assert credentials.secret_key == "TaskRole"
+    assert credentials.token == "Service:ecs-tasks.amazonaws.com"
+
+    ContainerProvider(environ=environment).load().get_frozen_credentials()
+    assert server.fetched == [("TaskRole", "Service:ecs-tasks.amazonaws.com", None)]
+
+
+def test_errors(server):
+    def get(url: str, token: str) -> int:
+        request = urllib.request.Request(url, headers={"Authorization": token})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            assert "message" in json.load(e)
+            return e.code
+
+    assert get(server.role_url("TaskRole"), "secret") == 200
+    assert get(server.role_url("TaskRole"), "wrong") == 401
+    assert get(server.role_url("missing"), "secret") == 400
+    assert get(f"{server.url}/other", "secret") == 404
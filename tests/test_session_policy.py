@@ -0,0 +1,100 @@
+import json
+
+from iam_sudo.roles import PolicySnapshot
+from iam_sudo.session_policy import SessionPolicy, collapse, pack_policy
+
+
+def test_collapse():
+    assert collapse(["s3:GetObject", "s3:Get*", "S3:getobject", "ec2:Describe*"], True) == [
+        "s3:Get*",
+        "ec2:Describe*",
+    ]
+    assert collapse(["*", "s3:Get*"], True) == ["*"]
+    assert collapse(["arn:aws:s3:::b/*", "arn:aws:s3:::b/k", "arn:aws:s3:::B/k"]) == [
+        "arn:aws:s3:::b/*",
+        "arn:aws:s3:::B/k",
+    ]
+    assert collapse(["arn:aws:s3:::b/[ab]*", "arn:aws:s3:::b/a1"]) == [
+        "arn:aws:s3:::b/[ab]*",
+        "arn:aws:s3:::b/a1",
+    ]
+    assert collapse(["arn:aws:s3:::b/a?", "arn:aws:s3:::b/a*"]) == ["arn:aws:s3:::b/a*"]
+    assert collapse(["arn:aws:s3:::b/a?c", "arn:aws:s3:::b/a?"]) == [
+        "arn:aws:s3:::b/a?c",
+        "arn:aws:s3:::b/a?",
+    ]
+
+
+def test_pack_policy_keeps_denies_on_literal_brackets():
+    resources = ["arn:aws:s3:::b/[ab]*", "arn:aws:s3:::b/a1"]
+    policy = {
+        "Version": "2012-10-17",
+        "Statement": [
+            {"Effect": "Deny", "Action": "s3:*", "Resource": resources},
+            {"Effect": "Deny", "Action": "s3:*", "NotResource": resources},
+        ],
+    }
+    assert pack_policy(policy) == {
+        "Version": "2012-10-17",
+        "Statement": [
+            {"Effect": "Deny", "Action": "s3:*", "Resource": resources},
+            {"Effect": "Deny", "Action": "s3:*", "NotResource": resources},
+        ],
+    }
+
+
+def test_pack_policy():
+    policy = {
+        "Version": "2012-10-17",
+        "Statement": [
+            {"Sid": "a", "Effect": "Allow", "Action": "s3:GetObject", "Resource": "*"},
+            {"Sid": "b", "Effect": "Allow", "Action": ["s3:PutObject"], "Resource": "*"},
+            {"Effect": "Allow", "Action": "s3:GetObject", "Resource": "*"},
+            {"Effect": "Allow", "Action": "sqs:*", "Resource": "arn:aws:sqs:::q1"},
+            {"Effect": "Allow", "Action": "sqs:*", "Resource": "arn:aws:sqs:::q2"},
+            {"Effect": "Allow", "NotAction": "iam:*", "Resource": "*"},
+            {"Effect": "Allow", "NotAction": "sts:*", "Resource": "*"},
+            {"Effect": "Deny", "Action": "s3:DeleteObject", "Resource": "*"},
+        ],
+    }
+    assert pack_policy(policy) == {
+        "Version": "2012-10-17",
+        "Statement": [
+            {"Effect": "Allow", "Action": ["s3:GetObject", "s3:PutObject"], "Resource": "*"},
+            {"Effect": "Allow", "Action": "sqs:*", "Resource": ["arn:aws:sqs:::q1", "arn:aws:sqs:::q2"]},
+            {"Effect": "Allow", "NotAction": "iam:*", "Resource": "*"},
+            {"Effect": "Allow", "NotAction": "sts:*", "Resource": "*"},
+            {"Effect": "Deny", "Action": "s3:DeleteObject", "Resource": "*"},
+        ],
+    }
+
+
+def test_session_policy_too_large():
+    inline = {
+        "p": {
+            "Version": "2012-10-17",
+            "Statement": {"Effect": "Allow", "Action": "s3:GetObject", "Resource": "*"},
+        },
+        "q": {
+            "Version": "2012-10-17",
+            "Statement": [
+                {"Effect": "Allow", "Action": "s3:GetObject", "Resource": f"arn:aws:s3:::bucket-{i}/*"}
+                for i in range(100)
+            ],
+        },
+    }
+    session_policy = SessionPolicy.create(PolicySnapshot((), inline))
+    assert json.loads(session_policy.document)["Statement"] == [
+        {"Effect": "Allow", "Action": "s3:GetObject", "Resource": "*"}
+    ]
+    assert session_policy.problems() == []
+
+    arns = tuple(f"arn:aws:iam::aws:policy/Policy{i}" for i in range(11))
+    problems = SessionPolicy.create(PolicySnapshot(arns, {})).problems()
+    assert problems == ["11 managed policies exceed the maximum of 10"]
+
+    inline["p"]["Statement"]["Resource"] = "arn:aws:s3:::other/*"
+    problems = SessionPolicy.create(PolicySnapshot((), inline)).problems()
+    assert len(problems) == 1
+    assert problems[0].startswith("session policy of ")
+    assert "in 1 inline policy statements" in problems[0]
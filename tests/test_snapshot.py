@@ -0,0 +1,180 @@
+import json
+import time
+from os import path
+from types import SimpleNamespace
+
+import pytest
+from click.testing import CliRunner
+
+import iam_sudo.__main__
+import iam_sudo.snapshot
+import iam_sudo.sudo
+from iam_sudo.inventory import RoleInventory, SnapshotInventory
+from iam_sudo.principal import Principal
+from iam_sudo.roles import PolicySnapshot, Role, RoleRecord, Roles
+from iam_sudo.snapshot import Snapshot, SnapshotError, SnapshotWriter, write_snapshot
+from iam_sudo.sudo import find_role
+
+
+def load_roles() -> Roles:
+    return Roles.load_from_file(path.join(path.dirname(__file__), "roles.json"))
+
+
+def policies(role) -> PolicySnapshot:
+    return PolicySnapshot(
+        ("arn:aws:iam::aws:policy/ReadOnlyAccess",),
+        {"inline": {"Version": "2012-10-17", "Statement": [{"Effect": "Allow", "Action": f"s3:Get{role.name}", "Resource": "*"}]}},
+    )
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    filename = str(tmp_path / "roles.snapshot")
+    roles = [RoleRecord.create(r) for r in load_roles()]
+    assert write_snapshot(filename, ((r, policies(r)) for r in roles)) == len(roles)
+    s = Snapshot.open(filename)
+    yield s
+    s.close()
+
+
+def test_roles_round_trip(snapshot):
+    expected = {r.name: r for r in load_roles()}
+    assert len(snapshot) == len(expected)
+    for role in snapshot:
+        original = expected[role.name]
+        assert (role.arn, role.path, role.principals, role.version) == (
+            original.arn,
+            original.get("Path"),
+            tuple(original.principals),
+            original.version,
+        )
+        assert role.fetch_policy_snapshot() == policies(role)
+
+
+def test_find(snapshot):
+    roles = load_roles()
+    for name in ["", "a", "aws", "destroyer", "no-such-role"]:
+        assert [r.name for r in snapshot.find(name)] == sorted(
+            r.name for r in roles.filter_by_substring_of_name(name)
+        )
+
+    lambda_principal = Principal("Service", "lambda.amazonaws.com")
+    assert [r.name for r in snapshot.find("destroyer", lambda_principal)] == [
+        "aws-account-destroyer-build-trigger"
+    ]
+    assert [r.name for r in snapshot.get("aws-account-destroyer")] == ["aws-account-destroyer"]
+    assert not snapshot.get("aws-account")
+
+
+def test_find_role_in_snapshot(snapshot, monkeypatch):
+    monkeypatch.setattr(iam_sudo.sudo, "inventory", SnapshotInventory(snapshot))
+    role = find_role("aws-account-destroyer", None)
+    assert role.arn.endswith(":role/aws-account-destroyer")
+    assert find_role("build-trigger", None).name == "aws-account-destroyer-build-trigger"
+
+
+def test_invalid_snapshot(tmp_path):
+    with pytest.raises(SnapshotError):
+        Snapshot(b"IAMSUDO")
+    with pytest.raises(SnapshotError):
+        Snapshot(b"X" * 64)
+
+    data = SnapshotWriter(include_policies=False)
+    data.add(RoleRecord.create(load_roles()[0]))
+    with pytest.raises(SnapshotError):
+        Snapshot(data.to_bytes()[:-1])
+    with pytest.raises(SnapshotError):
+        Snapshot(data.to_bytes()[:40])
+
+    for content in [b"", b"IAMSUDO\x00\x01"]:
+        filename = tmp_path / "invalid.snapshot"
+        filename.write_bytes(content)
+        with pytest.raises(SnapshotError):
+            Snapshot.open(str(filename))
+
+
+def test_corrupt_snapshot(tmp_path, monkeypatch):
+    writer = SnapshotWriter()
+    for role in load_roles():
+        writer.add(RoleRecord.create(role), policies(role))
+    data = writer.to_bytes()
+    snapshot = Snapshot(data)
+    roles_offset, name_index_offset = snapshot._roles, snapshot._name_index
+
+    def corrupt(offset: int) -> bytearray:
+        result = bytearray(data)
+        result[offset : offset + 4] = b"\xfe\xff\xff\x7f"
+        return result
+
+    for field in range(12):
+        corrupted = Snapshot(corrupt(roles_offset + field * 4))
+        with pytest.raises(SnapshotError):
+            for role in corrupted:
+                role.fetch_policy_snapshot()
+    with pytest.raises(SnapshotError):
+        Snapshot(corrupt(name_index_offset)).find("destroyer")
+
+    filename = tmp_path / "corrupt.snapshot"
+    filename.write_bytes(corrupt(roles_offset))
+    monkeypatch.setenv("IAM_SUDO_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(iam_sudo.__main__, "inventory", RoleInventory())
+    result = CliRunner().invoke(
+        iam_sudo.__main__.cli, ["inventory", "import", "--input", str(filename)]
+    )
+    assert result.exit_code == 1 and "corrupt iam-sudo snapshot" in result.output
+
+
+def test_import(snapshot, monkeypatch, tmp_path):
+    monkeypatch.setenv("IAM_SUDO_CACHE_DIR", str(tmp_path / "cache"))
+    inventory = RoleInventory()
+    monkeypatch.setattr(iam_sudo.__main__, "inventory", inventory)
+
+    filename = str(tmp_path / "roles.snapshot")
+    result = CliRunner().invoke(iam_sudo.__main__.cli, ["inventory", "import", "--input", filename])
+    assert result.exit_code == 0, result.output
+    assert inventory.is_fresh()
+    assert inventory._timestamp == Snapshot.open(filename).created
+    with open(inventory.filename) as f:
+        assert len(json.load(f)["roles"]) == len(load_roles())
+    assert len(Roles.load_from_file(filename)) == len(load_roles())
+
+
+def test_import_keeps_age_of_snapshot(monkeypatch, tmp_path):
+    filename = str(tmp_path / "old.snapshot")
+    monkeypatch.setattr(iam_sudo.snapshot, "time", SimpleNamespace(time=lambda: time.time() - 301))
+    write_snapshot(filename, ((RoleRecord.create(r), None) for r in load_roles()), False)
+
+    monkeypatch.setenv("IAM_SUDO_CACHE_DIR", str(tmp_path / "cache"))
+    inventory = RoleInventory(ttl=300)
+    monkeypatch.setattr(iam_sudo.__main__, "inventory", inventory)
+
+    result = CliRunner().invoke(iam_sudo.__main__.cli, ["inventory", "import", "--input", filename])
+    assert result.exit_code == 0, result.output
+    assert not inventory.is_fresh()
+
+
+def test_import_is_used_within_the_scope_of_the_policy(snapshot, monkeypatch, tmp_path):
+    from iam_sudo.sudo_policy import Policy
+
+    policy = Policy.load(
+        """
+allowed-role-names: ["aws-account-*"]
+allowed-principals: [{"*": "*"}]
+allowed-base-roles: ["arn:aws:iam::*:role/*"]
+"""
+    )
+    monkeypatch.setattr(Policy, "get_default", staticmethod(lambda: policy))
+    monkeypatch.setenv("IAM_SUDO_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(iam_sudo.__main__, "inventory", RoleInventory())
+
+    filename = str(tmp_path / "roles.snapshot")
+    result = CliRunner().invoke(iam_sudo.__main__.cli, ["inventory", "import", "--input", filename])
+    assert result.exit_code == 0, result.output
+
+    def iterate_all(account=None, scope=None):
+        raise AssertionError("the account was scanned")
+
+    monkeypatch.setattr(Role, "iterate_all", staticmethod(iterate_all))
+    inventory = RoleInventory(filename=iam_sudo.__main__.inventory.filename)
+    roles = inventory.find("destroyer", scope=policy.role_scope())
+    assert roles and all(r.name.startswith("aws-account-") for r in roles)
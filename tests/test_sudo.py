@@ -0,0 +1,223 @@
+import io
+import json
+
+import pytest
+
+import iam_sudo.clients
+import iam_sudo.roles
+import iam_sudo.sudo
+from iam_sudo.cache import TTLCache
+from iam_sudo.principal import Principal
+from iam_sudo.roles import RoleRecord, Roles
+from iam_sudo.sudo import AssumeRoleError, remote_assume_roles, simulate_assume_role
+from iam_sudo.sudo_policy import Policy
+
+policy = Policy.load(
+    """
+allowed-role-names:
+  - "Task*"
+allowed-principals:
+  - Service: "ecs-tasks.amazonaws.com"
+allowed-base-roles:
+  - "arn:aws:iam::*:role/IAMSudoUser"
+allowed-role-paths:
+  - /app/
+"""
+)
+
+
+class FakePaginator(object):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self.pages)
+
+
+class FakeIAM(object):
+    def __init__(self, attached: list, inline: dict):
+        self.attached = attached
+        self.inline = inline
+        self.calls = []
+
+    def get_paginator(self, operation: str):
+        self.calls.append(operation)
+        if operation == "list_attached_role_policies":
+            return FakePaginator(
+                [{"AttachedPolicies": [{"PolicyArn": arn} for arn in self.attached]}]
+            )
+        return FakePaginator([{"PolicyNames": list(self.inline)}])
+
+    def get_role_policy(self, RoleName: str, PolicyName: str):
+        self.calls.append("get_role_policy")
+        return {"PolicyDocument": self.inline[PolicyName]}
+
+
+class FakeSTS(object):
+    def __init__(self):
+        self.calls = []
+
+    def assume_role(self, **kwargs):
+        self.calls.append(kwargs)
+        return {
+            "Credentials": {
+                "AccessKeyId": "ASIA",
+                "SecretAccessKey": "secret",
+                "SessionToken": "token",
+                "Expiration": "2021-02-27T10:00:00+00:00",
+            },
+            "PackedPolicySize": 10,
+        }
+
+
+class FakeInventory(object):
+    """
+    an inventory of the roles of another account, recording the queries.
+    """
+
+    multi_account = True
+
+    def __init__(self, roles):
+        self.roles = roles
+        self.queries = []
+
+    def query(self, name, principal=None, scope=None):
+        self.queries.append((name, principal, scope))
+        return iter(Roles([r for r in self.roles if name in r.name]))
+
+
+def task_role(role_id: str) -> RoleRecord:
+    return RoleRecord(
+        "TaskRole",
+        "arn:aws:iam::222222222222:role/app/TaskRole",
+        "/app/",
+        role_id,
+        (Principal("Service", "ecs-tasks.amazonaws.com"),),
+        ("arn:aws:iam::222222222222:role/app/TaskRole", role_id),
+    )
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    iam = FakeIAM(
+        ["arn:aws:iam::aws:policy/ReadOnlyAccess"],
+        {
+            "s3": {
+                "Version": "2012-10-17",
+                "Statement": [
+                    {"Effect": "Allow", "Action": "s3:GetObject", "Resource": "*"}
+                ],
+            }
+        },
+    )
+    sts = FakeSTS()
+    monkeypatch.setattr(Policy, "get_default", staticmethod(lambda: policy))
+    monkeypatch.setattr(iam_sudo.roles, "policy_snapshots", TTLCache())
+    monkeypatch.setitem(iam_sudo.clients._clients, "iam", iam)
+    monkeypatch.setitem(iam_sudo.clients._clients, "sts", sts)
+    return iam, sts
+
+
+def test_simulate_assume_role(aws, monkeypatch):
+    iam, sts = aws
+    inventory = FakeInventory([task_role("AROA1")])
+    monkeypatch.setattr(iam_sudo.sudo, "inventory", inventory)
+
+    credentials = simulate_assume_role(
+        "IAMSudoUser", "TaskRole", "Service:ecs-tasks.amazonaws.com"
+    )
+    assert credentials.aws_session_token == "token"
+    assert inventory.queries == [
+        (
+            "TaskRole",
+            Principal("Service", "ecs-tasks.amazonaws.com"),
+            policy.role_scope(),
+        )
+    ]
+    assert sts.calls == [
+        {
+            "RoleArn": "arn:aws:iam::222222222222:role/IAMSudoUser",
+            "RoleSessionName": "iam-sudo-TaskRole",
+            "DurationSeconds": 3600,
+            "PolicyArns": [{"arn": "arn:aws:iam::aws:policy/ReadOnlyAccess"}],
+            "Policy": '{"Version":"2012-10-17","Statement":[{"Effect":"Allow",'
+            '"Action":"s3:GetObject","Resource":"*"}]}',
+        }
+    ]
+    assert sorted(iam.calls) == [
+        "get_role_policy",
+        "list_attached_role_policies",
+        "list_role_policies",
+    ]
+
+    simulate_assume_role("IAMSudoUser", "TaskRole", "Service:ecs-tasks.amazonaws.com")
+    assert len(sts.calls) == 2 and len(iam.calls) == 3
+
+
+def test_simulate_assume_role_fails_before_sts(aws, monkeypatch):
+    iam, sts = aws
+    iam.attached = [f"arn:aws:iam::aws:policy/Policy{i}" for i in range(11)]
+    monkeypatch.setattr(iam_sudo.sudo, "inventory", FakeInventory([task_role("AROA2")]))
+
+    with pytest.raises(AssumeRoleError, match="managed policies exceed"):
+        simulate_assume_role("IAMSudoUser", "TaskRole", None)
+    assert not sts.calls
+
+    with pytest.raises(AssumeRoleError, match="does not allow the role"):
+        simulate_assume_role("IAMSudoUser", "OtherRole", None)
+    with pytest.raises(AssumeRoleError, match="does not allow the base role"):
+        simulate_assume_role("arn:aws:iam::222222222222:role/Admin", "TaskRole", None)
+    assert not sts.calls
+
+
+class FakeLambda(object):
+    def __init__(self, reply: dict, function_error: str = None):
+        self.reply = reply
+        self.function_error = function_error
+        self.requests = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.requests.append(json.loads(Payload))
+        response = {"Payload": io.BytesIO(json.dumps(self.reply).encode("utf-8"))}
+        if self.function_error:
+            response["FunctionError"] = self.function_error
+        return response
+
+
+def test_remote_assume_roles(monkeypatch):
+    credentials = {
+        "AccessKeyId": "ASIA",
+        "SecretAccessKey": "secret",
+        "SessionToken": "token",
+        "Expiration": "2021-02-27T10:00:00+00:00",
+    }
+    fake = FakeLambda(
+        {"results": [{"credentials": credentials}, {"error": "no roles matching name x"}]}
+    )
+    monkeypatch.setitem(iam_sudo.clients._clients, "lambda", fake)
+
+    results = remote_assume_roles(
+        [
+            {"role_name": "TaskRole", "principal": "Service:ecs-tasks.amazonaws.com"},
+            {"role_name": "x", "base_role": "OtherBase"},
+        ]
+    )
+    assert fake.requests == [
+        {
+            "requests": [
+                {"role_name": "TaskRole", "principal": "Service:ecs-tasks.amazonaws.com"},
+                {"role_name": "x", "base_role": "OtherBase"},
+            ]
+        }
+    ]
+    assert results[0].aws_session_token == "token"
+    assert isinstance(results[1], AssumeRoleError)
+    assert str(results[1]) == "no roles matching name x"
+
+    fake.reply = {"results": [{"credentials": credentials}]}
+    with pytest.raises(AssumeRoleError, match="expected 2 results from lambda, got 1"):
+        remote_assume_roles([{"role_name": "TaskRole"}, {"role_name": "x"}])
+
+    fake.reply, fake.function_error = {"errorMessage": "invalid batch"}, "Unhandled"
+    with pytest.raises(AssumeRoleError, match="invalid batch"):
+        remote_assume_roles([{"role_name": "TaskRole"}])
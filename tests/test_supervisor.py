@@ -0,0 +1,85 @@
+import datetime
+import os
+import sys
+import time
+
+from iam_sudo.credentials import Credentials
+from iam_sudo.server import CredentialProvider
+from iam_sudo.supervisor import CredentialRefresher, refreshable_env, run_with_refresh
+
+
+def credential_fetcher(seconds: int):
+    fetched = []
+
+    def fetch(*args) -> Credentials:
+        fetched.append(1)
+        return Credentials(
+            {
+                "AccessKeyId": f"ASIA{len(fetched)}",
+                "SecretAccessKey": "secret",
+                "SessionToken": "token",
+                "Expiration": datetime.datetime.now(datetime.timezone.utc)
+                + datetime.timedelta(seconds=seconds),
+            }
+        )
+
+    return fetch, fetched
+
+
+def test_refresher_renews_before_expiry():
+    fetch, fetched = credential_fetcher(2)
+    provider = CredentialProvider(fetch, margin=1)
+    refresher = CredentialRefresher(provider, "TaskRole")
+    refresher.start()
+    try:
+        deadline = time.time() + 10
+        while len(fetched) < 3 and time.time() < deadline:
+            time.sleep(0.1)
+    finally:
+        refresher.stop()
+    assert len(fetched) >= 3
+
+
+def test_refreshable_env(monkeypatch):
+    removed = [
+        "AWS_ACCESS_KEY_ID",
+        "AWS_SECRET_ACCESS_KEY",
+        "AWS_SESSION_TOKEN",
+        "AWS_SECURITY_TOKEN",
+        "AWS_PROFILE",
+        "AWS_DEFAULT_PROFILE",
+        "AWS_CONTAINER_CREDENTIALS_RELATIVE_URI",
+        "AWS_CONTAINER_AUTHORIZATION_TOKEN",
+        "AWS_CONTAINER_AUTHORIZATION_TOKEN_FILE",
+        "AWS_WEB_IDENTITY_TOKEN_FILE",
+        "AWS_ROLE_ARN",
+        "AWS_ROLE_SESSION_NAME",
+    ]
+    for name in removed:
+        monkeypatch.setenv(name, "parent")
+    monkeypatch.setenv("AWS_CONTAINER_CREDENTIALS_FULL_URI", "http://169.254.170.23/v1")
+    monkeypatch.setenv("AWS_CONFIG_FILE", "/home/parent/.aws/config")
+    monkeypatch.setenv("AWS_REGION", "eu-central-1")
+    monkeypatch.delenv("AWS_DEFAULT_REGION", raising=False)
+
+    env = refreshable_env({"AWS_CONTAINER_CREDENTIALS_FULL_URI": "http://127.0.0.1"})
+    assert [name for name in removed if name in env] == []
+    assert env["AWS_CONTAINER_CREDENTIALS_FULL_URI"] == "http://127.0.0.1"
+    assert env["AWS_CONFIG_FILE"] == os.devnull
+    assert env["AWS_SHARED_CREDENTIALS_FILE"] == os.devnull
+    assert env["AWS_REGION"] == "eu-central-1"
+    assert env["AWS_DEFAULT_REGION"] == "eu-central-1"
+
+
+def test_child_gets_credentials_from_endpoint(monkeypatch, tmp_path):
+    for name in ["stdin", "stdout", "stderr"]:
+        monkeypatch.setattr(sys, name, open(tmp_path / name, "a+"))
+    fetch, fetched = credential_fetcher(3600)
+    script = (
+        "import botocore.session, sys;"
+        "c = botocore.session.get_session().get_credentials();"
+        "sys.exit(0 if c.method == 'container-role' and c.access_key == 'ASIA1' else 1)"
+    )
+    r = run_with_refresh("TaskRole", [sys.executable, "-c", script], fetch)
+    assert r.returncode == 0
+    assert len(fetched) == 1